@@ -0,0 +1,136 @@
+"""
+Goal:
+  * Measure the bytes transferred to check whether two branches differ.
+
+  Compares downloading and parsing the complete compare response with the
+  streamed check in 'merge_requests/create_mr.py' ('has_differences'),
+  using a synthetic compare response served locally.
+
+How to:
+  * python benchmarks/compare_probe.py
+  * python benchmarks/compare_probe.py --commits 50 --diffs 5000 --diff-size 2000
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "merge_requests"
+    ),
+)
+
+from create_mr import has_differences  # noqa: E402
+
+CHUNK_SIZE = 16 * 1024
+
+
+def synthetic_compare(commits, diffs, diff_size):
+    """Build a compare response, keys in the order GitLab returns them."""
+    commit = {
+        "id": "0" * 40,
+        "short_id": "0" * 8,
+        "title": "Synthetic commit",
+        "author_name": "Synthetic Author",
+        "author_email": "author@example.com",
+        "created_at": "2020-01-01T00:00:00.000Z",
+        "message": 'Synthetic commit\n\nWith a "diffs": [] look-alike in the message.',
+    }
+    return json.dumps(
+        {
+            "commit": commit,
+            "commits": [commit] * commits,
+            "diffs": [
+                {
+                    "old_path": f"file_{number}.tf",
+                    "new_path": f"file_{number}.tf",
+                    "a_mode": "100644",
+                    "b_mode": "100644",
+                    "diff": "+" + "x" * diff_size + "\n",
+                    "new_file": False,
+                    "renamed_file": False,
+                    "deleted_file": False,
+                }
+                for number in range(diffs)
+            ],
+            "compare_timeout": False,
+            "compare_same_ref": False,
+        }
+    ).encode()
+
+
+class CompareHandler(BaseHTTPRequestHandler):
+    body = b""
+    bytes_sent = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        sent = 0
+        try:
+            for start in range(0, len(self.body), CHUNK_SIZE):
+                end = start + CHUNK_SIZE
+                sent += self.wfile.write(self.body[start:end])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.bytes_sent.append(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bytes transferred by the branch difference check.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--commits", type=int, default=50, help="Number of commits.")
+    parser.add_argument("--diffs", type=int, default=5000, help="Number of diffs.")
+    parser.add_argument(
+        "--diff-size", type=int, default=2000, help="Size of every diff in bytes."
+    )
+    args = parser.parse_args()
+
+    CompareHandler.body = synthetic_compare(args.commits, args.diffs, args.diff_size)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompareHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/compare"
+
+    print(f"Compare response: {len(CompareHandler.body)} bytes")
+
+    response = requests.get(url)
+    differences = bool(response.json()["diffs"])
+    print(
+        f"full download : {len(response.content):>12} bytes read,"
+        f" differences: {differences}"
+    )
+
+    read = []
+    response = requests.get(url, stream=True)
+    iter_content = response.iter_content
+
+    def counting_iter_content(*args, **kwargs):
+        for chunk in iter_content(*args, **kwargs):
+            read.append(len(chunk))
+            yield chunk
+
+    response.iter_content = counting_iter_content
+    differences = has_differences(response)
+    print(f"streamed check: {sum(read):>12} bytes read," f" differences: {differences}")
+
+    server.shutdown()
+    print(f"bytes sent by the server per request: {CompareHandler.bytes_sent}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Goal:
+  * Compare running 'gitlab-scripts' commands directly with sending them to
+    'gitlab_daemon', against the fake gitlab API ('benchmarks/fake_gitlab.py').
+  * Per command and mode: median and p95 wall time of the calls, and the
+    requests the fake API received for all calls.
+
+How to:
+  * Get help
+    - python benchmarks/daemon.py -h
+  * Call every command 20 times, with 100 projects
+    - python benchmarks/daemon.py --calls 20 --projects 100
+  * Simulate a remote server
+    - python benchmarks/daemon.py --latency 0.05
+  * Run 5 calls at the same time, like several dashboards polling; the
+    daemon sends one request for identical requests running at the same time
+    - python benchmarks/daemon.py --parallel 5
+
+The calls run one after the other by default, like a dashboard polling. The
+daemon keeps its cache for the whole run, so the first call fills it.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+sys.path.insert(0, BENCHMARKS_PATH)
+sys.path.insert(1, ROOT_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+from gitlab_daemon import get_status  # noqa: E402
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CALLS_DEFAULT = 20
+PROJECTS_DEFAULT = 100
+LATENCY_DEFAULT = 0.01
+TOKEN = "benchmark"
+# Seconds to wait for the daemon to listen.
+STARTUP_TIMEOUT = 30
+
+
+def get_cases(url):
+    """Return the arguments of the benchmarked commands."""
+    credentials = ["--url", url, "--token", TOKEN]
+    return {
+        "tags": ["tags"] + credentials + ["--group", "1", "--latest"],
+        "users": ["users"] + credentials,
+        "mrs list": ["mrs", "list"] + credentials + ["--project", "", "--group", "1"],
+    }
+
+
+def start_daemon(path):
+    process = subprocess.Popen(
+        [sys.executable, ENTRY_POINT, "daemon", "--socket", path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    started = time.monotonic()
+    while get_status(path) is None:
+        if process.poll() is not None or time.monotonic() - started > STARTUP_TIMEOUT:
+            raise RuntimeError(f"The daemon did not start listening on '{path}'.")
+        time.sleep(0.05)
+    return process
+
+
+def run_call(arguments, environment):
+    """Run a command, return its milliseconds."""
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, ENTRY_POINT] + arguments,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        logger.warning(
+            f"'{arguments[0]}' exited with {process.returncode}:"
+            f" {process.stderr[-2000:].decode(errors='replace')}"
+        )
+    return elapsed
+
+
+def run_calls(arguments, calls, environment, parallel=1):
+    """Run a command 'calls' times, 'parallel' at a time.
+
+    Returns the milliseconds of every call.
+    """
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [
+            executor.submit(run_call, arguments, environment) for _ in range(calls)
+        ]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare running commands directly and in the daemon.",
+        epilog="python benchmarks/daemon.py --calls 20 --projects 100 --latency 0.05",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--calls", type=int, default=CALLS_DEFAULT, help="Calls per command and mode."
+    )
+    parser.add_argument(
+        "--projects",
+        type=int,
+        default=PROJECTS_DEFAULT,
+        help="Projects, users and issues of the fake API.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY_DEFAULT,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "--parallel", type=int, default=1, help="Calls running at the same time."
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    fake_gitlab = FakeGitlab(
+        projects=args.projects,
+        users=args.projects,
+        issues=args.projects,
+        latency=args.latency,
+        token=TOKEN,
+    )
+    results = []
+    with fake_gitlab, tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "gitlab-scripts.sock")
+        daemon = start_daemon(path)
+        try:
+            for name, arguments in get_cases(fake_gitlab.url).items():
+                for mode in ("direct", "daemon"):
+                    environment = dict(os.environ)
+                    environment.pop(SOCKET_ENVIRONMENT_VARIABLE, None)
+                    if mode == "daemon":
+                        environment[SOCKET_ENVIRONMENT_VARIABLE] = path
+                    fake_gitlab.reset_stats()
+                    times = sorted(
+                        run_calls(arguments, args.calls, environment, args.parallel)
+                    )
+                    result = {
+                        "command": name,
+                        "mode": mode,
+                        "calls": args.calls,
+                        "parallel": args.parallel,
+                        "median_ms": round(statistics.median(times), 2),
+                        "p95_ms": round(times[int(0.95 * (len(times) - 1))], 2),
+                        "requests": fake_gitlab.stats()["requests"],
+                    }
+                    print(json.dumps(result), flush=True)
+                    results.append(result)
+            status = get_status(path)
+            logger.info(
+                f"Cache of the daemon: {status['cache']}, memo: {status['memo']},"
+                f" single flight: {status['single_flight']}."
+            )
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(
+                {
+                    "latency": args.latency,
+                    "parallel": args.parallel,
+                    "results": results,
+                },
+                file_handler,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
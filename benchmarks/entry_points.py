@@ -0,0 +1,322 @@
+"""
+Goal:
+  * Benchmark every entry point at several scales, against the fake gitlab
+    API ('benchmarks/fake_gitlab.py') and synthetic terraform trees.
+  * Per run: wall time, number of requests, bytes sent and received by the
+    API, peak RSS of the script and p50/p95 latency of the requests.
+  * Results are written as JSON, to compare versions.
+
+How to:
+  * Get help
+    - python benchmarks/entry_points.py -h
+  * Run all benchmarks at 10, 100 and 1000 projects
+    - python benchmarks/entry_points.py --output results.json
+  * Run some benchmarks at some scales
+    - python benchmarks/entry_points.py --scales 10 100 --benchmarks list_mrs create_mrs
+  * Simulate a remote server
+    - python benchmarks/entry_points.py --latency 0.05 --jitter 0.02
+  * Compare with earlier results, exits with 1 if a benchmark got slower or
+    sends more requests than allowed by '--tolerance'
+    - python benchmarks/entry_points.py --output new.json --baseline results.json
+
+Every script runs in its own process, its peak RSS is taken from
+'os.wait4'. The latency is measured in the fake server.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+sys.path.insert(0, BENCHMARKS_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SCALES_DEFAULT = (10, 100, 1000)
+TOKEN = "benchmark"
+# Projects of the fake server are in group 1, if there is one group.
+GROUP_ID = "1"
+TOLERANCE_DEFAULT = 0.2
+# Modules per terraform file, files per project.
+MODULES_PER_FILE = 5
+FILES_PER_PROJECT = 3
+
+
+def _projects(scale):
+    return [str(project_id) for project_id in range(1, scale + 1)]
+
+
+def get_most_recent_tag(url, scale, workdir):
+    return [
+        "get_most_recent_tag.py",
+        "--url",
+        url,
+        "--token",
+        TOKEN,
+        "--group",
+        GROUP_ID,
+    ]
+
+
+def list_mrs(url, scale, workdir):
+    return [
+        "merge_requests/list_mrs.py",
+        "--url",
+        url,
+        "--token",
+        TOKEN,
+        "--project",
+        "",
+        "--group",
+        GROUP_ID,
+    ]
+
+
+def create_mrs(url, scale, workdir):
+    return [
+        "merge_requests/create_mrs.py",
+        "--url",
+        url,
+        "--token",
+        TOKEN,
+        "--source-branch",
+        "benchmark",
+        "--target-branch",
+        "master",
+        "--title",
+        "Benchmark",
+        "--assignee-id",
+        "1",
+        "--group",
+        GROUP_ID,
+        "--projects",
+    ] + _projects(scale)
+
+
+def create_pipelines(url, scale, workdir):
+    return [
+        "pipelines/create_pipelines.py",
+        "--url",
+        url,
+        "--token",
+        TOKEN,
+        "--reference",
+        "master",
+        "--projects",
+    ] + _projects(scale)
+
+
+def get_users(url, scale, workdir):
+    return ["users/get_users.py", "--url", url, "--token", TOKEN]
+
+
+def get_tf_module_source_version(url, scale, workdir):
+    """Write a terraform tree with 'scale' projects into 'workdir'."""
+    for project in range(scale):
+        path = os.path.join(workdir, f"tf_project_{project}")
+        os.makedirs(path, exist_ok=True)
+        for number in range(FILES_PER_PROJECT):
+            with open(os.path.join(path, f"main_{number}.tf"), "w") as file_handler:
+                for module in range(MODULES_PER_FILE):
+                    file_handler.write(
+                        f'module "module_{module}" {{\n'
+                        f'  source = "s3::https://s3-eu-west-1.amazonaws.com/tf-modules/'
+                        f'tf-module-{module}/tf-module-{module}-1.2.{project % 10}.zip"\n'
+                        f'  name   = "project_{project}"\n'
+                        "}\n\n"
+                    )
+    return ["get_tf_module_source_version.py", "--paths", workdir]
+
+
+BENCHMARKS = {
+    "get_most_recent_tag": get_most_recent_tag,
+    "list_mrs": list_mrs,
+    "create_mrs": create_mrs,
+    "create_pipelines": create_pipelines,
+    "get_users": get_users,
+    "get_tf_module_source_version": get_tf_module_source_version,
+}
+
+
+def run_script(arguments):
+    """Run a script of the repository, return (exit code, seconds, peak RSS in KiB)."""
+    script = os.path.join(ROOT_PATH, arguments[0])
+    with tempfile.TemporaryFile() as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, script] + arguments[1:],
+            cwd=os.path.dirname(script),
+            stdout=subprocess.DEVNULL,
+            stderr=stderr,
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - started
+        # The process is already reaped.
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode:
+            stderr.seek(0)
+            logger.warning(
+                f"'{arguments[0]}' exited with {process.returncode}:"
+                f" {stderr.read()[-2000:].decode(errors='replace')}"
+            )
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak_rss = usage.ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return process.returncode, wall_time, peak_rss
+
+
+def _round(value, digits=6):
+    return None if value is None else round(value, digits)
+
+
+def run_benchmark(name, scale, latency=0.0, jitter=0.0, seed=0):
+    """Run one benchmark against a fresh fake server with 'scale' projects."""
+    fake_gitlab = FakeGitlab(
+        projects=scale,
+        users=scale,
+        issues=scale,
+        latency=latency,
+        jitter=jitter,
+        token=TOKEN,
+        seed=seed,
+    )
+    with fake_gitlab, tempfile.TemporaryDirectory() as workdir:
+        arguments = BENCHMARKS[name](fake_gitlab.url, scale, workdir)
+        # Only the run of the script is measured, not writing the inputs.
+        fake_gitlab.reset_stats()
+        exit_code, wall_time, peak_rss = run_script(arguments)
+        stats = fake_gitlab.stats()
+    return {
+        "benchmark": name,
+        "scale": scale,
+        "exit_code": exit_code,
+        "wall_time": round(wall_time, 4),
+        "requests": stats["requests"],
+        "bytes_sent": stats["bytes_sent"],
+        "bytes_received": stats["bytes_received"],
+        "peak_rss_kib": peak_rss,
+        "latency_p50": _round(stats["latency"]["p50"]),
+        "latency_p95": _round(stats["latency"]["p95"]),
+        "status_codes": stats["status_codes"],
+    }
+
+
+def get_regressions(results, baseline, tolerance=TOLERANCE_DEFAULT):
+    """Compare results with the results of an earlier run.
+
+    Returns a message per benchmark that got slower, or sends more requests,
+    by more than 'tolerance' (a fraction).
+    """
+    earlier = {(r["benchmark"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = earlier.get((result["benchmark"], result["scale"]), None)
+        if not before:
+            continue
+        for key in ("wall_time", "requests"):
+            if result[key] > before[key] * (1 + tolerance) and result[key] > 0:
+                regressions.append(
+                    f"{result['benchmark']} at {result['scale']} projects: {key}"
+                    f" {before[key]} -> {result[key]}."
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the entry points against a fake gitlab API.",
+        epilog="python benchmarks/entry_points.py --scales 10 100 --output results.json",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=SCALES_DEFAULT,
+        help="Numbers of projects to benchmark with.",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Benchmarks to run.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Random seconds, up to this, added to the latency.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fake data.")
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    parser.add_argument(
+        "--baseline",
+        default="",
+        help="JSON file of an earlier run to compare the results with.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE_DEFAULT,
+        help="Fraction a benchmark may get slower than the baseline.",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        for name in args.benchmarks:
+            logger.info(f"Running '{name}' with {scale} projects.")
+            result = run_benchmark(
+                name, scale, latency=args.latency, jitter=args.jitter, seed=args.seed
+            )
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(report, file_handler, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file_handler:
+            baseline = json.load(file_handler)
+        regressions = get_regressions(results, baseline, tolerance=args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
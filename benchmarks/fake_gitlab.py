@@ -0,0 +1,1043 @@
+"""
+Goal:
+  * Serve a fake gitlab API locally, to benchmark and try the scripts offline.
+  * Synthetic projects, groups, tags, users, issues, merge requests (with
+    versions), compare results, commits and pipelines.
+  * Pagination headers like gitlab (X-Next-Page, X-Total, Link, ...).
+  * Optional rate limit (RateLimit-* headers, 429 with Retry-After),
+    injected latency and errors.
+  * Counts requests and bytes, per endpoint.
+
+How to:
+  * Get help
+    - python benchmarks/fake_gitlab.py -h
+  * Start the server
+    - python benchmarks/fake_gitlab.py --projects 100 --port 8080
+    - python benchmarks/fake_gitlab.py --projects 1000 --latency 0.05 --error-rate 0.01 --rate-limit 200
+  * Point the scripts at it
+    - python merge_requests/list_mrs.py --url http://127.0.0.1:8080 --project "" --group 1 --token x
+    - python get_most_recent_tag.py --url http://127.0.0.1:8080 --group 1 --token x
+  * Request and byte counts
+    - curl http://127.0.0.1:8080/_stats
+    - curl -X POST http://127.0.0.1:8080/_stats/reset
+  * From python, e.g. in a benchmark
+    - with FakeGitlab(projects=100) as gitlab:
+          run_script(url=gitlab.url)
+          print(gitlab.stats())
+
+Data:
+  * Projects 1..projects, spread over groups 1..groups.
+  * Users 1..users, named 'user<id>'.
+  * Issues are assigned to the users in turn, every third one is unestimated.
+  * Every project has 'mrs' merge requests from 'feature-<iid>' to 'master'.
+  * Compare results have 'diffs' diffs of 'diff_size' bytes, 'empty_rate' of
+    the projects have none.
+  * Created pipelines run for 'pipeline_duration' seconds,
+    'failure_rate' of them fail.
+  * GraphQL queries of projects, their MRs and diff stats ('fake_graphql.py'),
+    empty MRs have no changed files, like their versions have no 'real_size'.
+  * Creating MRs and pipelines, and 'touch', update the 'last_activity_at'
+    of a project. Group projects can be ordered by it ('order_by', 'sort').
+  * Tags can be searched and ordered ('search', 'order_by', 'sort'), orders
+    not in 'tag_orders' are answered with 400, like older gitlab versions.
+  All data derives from 'seed', two servers with the same options serve the
+  same data.
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlparse, parse_qs, urlencode, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from fake_graphql import FakeGraphql
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+API_PREFIX = "/api/v4"
+GRAPHQL_PATH = "/api/graphql"
+PER_PAGE_DEFAULT = 20
+PER_PAGE_MAX = 100
+
+PROJECTS_DEFAULT = 10
+GROUPS_DEFAULT = 1
+TAGS_DEFAULT = 5
+MRS_DEFAULT = 3
+ISSUES_DEFAULT = 20
+USERS_DEFAULT = 10
+DIFFS_DEFAULT = 3
+DIFF_SIZE_DEFAULT = 200
+EMPTY_RATE_DEFAULT = 0.1
+PIPELINE_DURATION_DEFAULT = 5.0
+FAILURE_RATE_DEFAULT = 0.1
+# Orders of tags gitlab knows, 'version' since 15.4.
+TAG_ORDERS = ("name", "updated", "version")
+
+# All synthetic timestamps are before this.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+DEFAULT_BRANCH = "master"
+
+
+def _time(value):
+    """Format a datetime like gitlab does."""
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _sha(*values):
+    return hashlib.sha1("/".join(str(v) for v in values).encode()).hexdigest()
+
+
+class FakeGitlab:
+    """A fake gitlab API server, see the module docstring.
+
+    Thread safe, requests are served in threads.
+    """
+
+    def __init__(
+        self,
+        projects=PROJECTS_DEFAULT,
+        groups=GROUPS_DEFAULT,
+        tags=TAGS_DEFAULT,
+        mrs=MRS_DEFAULT,
+        issues=ISSUES_DEFAULT,
+        users=USERS_DEFAULT,
+        diffs=DIFFS_DEFAULT,
+        diff_size=DIFF_SIZE_DEFAULT,
+        empty_rate=EMPTY_RATE_DEFAULT,
+        pipeline_duration=PIPELINE_DURATION_DEFAULT,
+        failure_rate=FAILURE_RATE_DEFAULT,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        rate_limit=0,
+        token=None,
+        seed=0,
+        host="127.0.0.1",
+        port=0,
+        tag_orders=TAG_ORDERS,
+    ):
+        """
+        :param latency: Seconds every API request takes at least.
+        :param jitter: Seconds added to 'latency', uniformly random up to this.
+        :param error_rate: Fraction of API requests answered with 503.
+        :param rate_limit: API requests allowed per second, unlimited if 0.
+        :param token: Private token the requests have to send, not checked if
+            not given.
+        :param port: Port to listen on, a free one if 0.
+        :param tag_orders: Orders of tags the server knows, e.g. without
+            'version' like gitlab before 15.4.
+        """
+        self.projects = projects
+        self.groups = max(1, groups)
+        self.tags = tags
+        self.mrs = mrs
+        self.issues = issues
+        self.users = users
+        self.diffs = diffs
+        self.diff_size = diff_size
+        self.empty_rate = empty_rate
+        self.pipeline_duration = pipeline_duration
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.token = token
+        self.seed = seed
+        self.tag_orders = tag_orders
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        # MRs and pipelines created by requests, {project_id: [...]}.
+        self._created_mrs = {}
+        self._pipelines = {}
+        self._next_pipeline_id = 1
+        # Last activity of projects changed by requests, {project_id: datetime}.
+        self._activity = {}
+        self._window = 0
+        self._window_requests = 0
+        self.reset_stats()
+
+        self.httpd = ThreadingHTTPServer((host, port), FakeGitlabHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Statistics
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                "requests": 0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "endpoints": {},
+                "status_codes": {},
+            }
+            # Seconds from reading a request to sending the response.
+            self._durations = []
+
+    def stats(self):
+        """Return the request and byte counts since the last reset.
+
+        'latency' holds percentiles of the seconds spent per request,
+        measured in the server and including the injected latency.
+        """
+        with self._lock:
+            stats = json.loads(json.dumps(self._stats))
+            durations = list(self._durations)
+        stats["latency"] = {
+            "p50": _percentile(durations, 0.5),
+            "p95": _percentile(durations, 0.95),
+            "max": max(durations) if durations else None,
+        }
+        return stats
+
+    def _count(self, endpoint, status_code, bytes_sent, bytes_received, duration):
+        with self._lock:
+            self._durations.append(duration)
+            stats = self._stats
+            stats["requests"] += 1
+            stats["bytes_sent"] += bytes_sent
+            stats["bytes_received"] += bytes_received
+            stats["endpoints"][endpoint] = stats["endpoints"].get(endpoint, 0) + 1
+            status_code = str(status_code)
+            stats["status_codes"][status_code] = (
+                stats["status_codes"].get(status_code, 0) + 1
+            )
+
+    # Injected behaviour
+
+    def _delay(self):
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter) if self.jitter else 0
+        return self.latency + jitter
+
+    def _fails(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _rate_limit_headers(self):
+        """Count a request in the current window.
+
+        Returns the rate limit headers and whether the request is allowed.
+        """
+        if not self.rate_limit:
+            return {}, True
+        now = time.time()
+        with self._lock:
+            window = int(now)
+            if window != self._window:
+                self._window = window
+                self._window_requests = 0
+            self._window_requests += 1
+            observed = self._window_requests
+        reset = window + 1
+        headers = {
+            "RateLimit-Limit": str(self.rate_limit),
+            "RateLimit-Observed": str(observed),
+            "RateLimit-Remaining": str(max(0, self.rate_limit - observed)),
+            "RateLimit-Reset": str(reset),
+        }
+        if observed <= self.rate_limit:
+            return headers, True
+        headers["Retry-After"] = str(max(1, int(reset - now + 0.999)))
+        return headers, False
+
+    # Synthetic data
+
+    def _rng(self, *values):
+        return random.Random(_sha(self.seed, *values))
+
+    def get_project(self, project_id):
+        try:
+            project_id = int(project_id)
+        except ValueError:
+            # Projects can also be addressed by their path.
+            match = re.match(r"group-\d+/project-(\d+)$", unquote(str(project_id)))
+            if not match:
+                return None
+            project_id = int(match.group(1))
+        if not 1 <= project_id <= self.projects:
+            return None
+        group_id = (project_id - 1) % self.groups + 1
+        path = f"group-{group_id}/project-{project_id}"
+        return {
+            "id": project_id,
+            "name": f"project-{project_id}",
+            "path": f"project-{project_id}",
+            "path_with_namespace": path,
+            "namespace": {"id": group_id, "path": f"group-{group_id}"},
+            "default_branch": DEFAULT_BRANCH,
+            "web_url": f"{self.url}/{path}",
+            "http_url_to_repo": f"{self.url}/{path}.git",
+            "last_activity_at": _time(
+                self._activity.get(project_id, EPOCH - timedelta(hours=project_id))
+            ),
+            "archived": False,
+        }
+
+    def touch(self, project_id):
+        """Record activity in a project now, like a push."""
+        with self._lock:
+            self._activity[int(project_id)] = datetime.now(timezone.utc)
+
+    def get_group_projects(self, group_id):
+        group_id = int(group_id)
+        return [
+            self.get_project(project_id)
+            for project_id in range(group_id, self.projects + 1, self.groups)
+        ]
+
+    def get_tags(self, project_id):
+        """Tags of a project, the most recent first."""
+        tags = []
+        for number in range(self.tags, 0, -1):
+            tags.append(
+                {
+                    "name": f"1.{number // 10}.{number % 10}",
+                    "message": "",
+                    "target": _sha(project_id, "tag", number),
+                    "commit": {
+                        "id": _sha(project_id, "tag", number),
+                        "created_at": _time(EPOCH - timedelta(days=self.tags - number)),
+                    },
+                }
+            )
+        return tags
+
+    def get_users(self):
+        return [
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "name": f"User {user_id}",
+                "state": "active",
+            }
+            for user_id in range(1, self.users + 1)
+        ]
+
+    def get_issues(self):
+        issues = []
+        for issue_id in range(1, self.issues + 1):
+            project_id = (issue_id - 1) % max(1, self.projects) + 1
+            estimated = issue_id % 3 != 1
+            issues.append(
+                {
+                    "id": issue_id,
+                    "iid": issue_id,
+                    "project_id": project_id,
+                    "title": f"Issue {issue_id}",
+                    "state": "opened",
+                    "labels": ["synthetic"],
+                    "assignee": {"id": (issue_id - 1) % max(1, self.users) + 1},
+                    "web_url": f"{self.url}/issues/{issue_id}",
+                    "time_stats": {
+                        "time_estimate": 3600 if estimated else 0,
+                        "total_time_spent": 600 * (issue_id % 4),
+                    },
+                }
+            )
+        return issues
+
+    def _mr(self, project_id, iid):
+        rng = self._rng(project_id, "mr", iid)
+        merge_status = rng.choice(
+            ("can_be_merged", "can_be_merged", "cannot_be_merged")
+        )
+        state = rng.choice(("opened", "opened", "merged", "closed"))
+        return {
+            "id": project_id * 100000 + iid,
+            "iid": iid,
+            "project_id": project_id,
+            "title": f"Feature {iid}",
+            "state": state,
+            "merge_status": merge_status,
+            "has_conflicts": merge_status == "cannot_be_merged",
+            "source_branch": f"feature-{iid}",
+            "target_branch": DEFAULT_BRANCH,
+            "sha": _sha(project_id, "mr", iid),
+            "updated_at": _time(EPOCH - timedelta(hours=rng.randint(0, 24 * 90))),
+            "web_url": f"{self.url}/group/project-{project_id}/-/merge_requests/{iid}",
+            "user": {"can_merge": True},
+            "milestone": None,
+        }
+
+    def get_mrs(self, project_id):
+        mrs = [self._mr(project_id, iid) for iid in range(1, self.mrs + 1)]
+        with self._lock:
+            mrs.extend(self._created_mrs.get(project_id, []))
+        return mrs
+
+    def create_mr(self, project_id, data):
+        with self._lock:
+            created = self._created_mrs.setdefault(project_id, [])
+            iid = self.mrs + len(created) + 1
+            mr = {
+                "id": project_id * 100000 + iid,
+                "iid": iid,
+                "project_id": project_id,
+                "title": data.get("title", ""),
+                "state": "opened",
+                "merge_status": "can_be_merged",
+                "has_conflicts": False,
+                "source_branch": data.get("source_branch", None),
+                "target_branch": data.get("target_branch", None),
+                "sha": _sha(project_id, "mr", iid),
+                "updated_at": _time(datetime.now(timezone.utc)),
+                "web_url": f"{self.url}/group/project-{project_id}/-/merge_requests/{iid}",
+                "user": {"can_merge": True},
+                "milestone": None,
+            }
+            created.append(mr)
+        self.touch(project_id)
+        return mr
+
+    def get_versions(self, project_id, iid):
+        """Versions of an MR, None if it does not exist."""
+        mrs = [mr for mr in self.get_mrs(project_id) if mr["iid"] == iid]
+        if not mrs:
+            return None
+        mr = mrs[0]
+        empty = self.is_empty_mr(mr)
+        return [
+            {
+                "id": number,
+                "head_commit_sha": _sha(project_id, "mr", iid, number),
+                "created_at": mr["updated_at"],
+                "merge_request_id": mr["id"],
+                "state": "collected",
+                "real_size": None if empty else str(number),
+            }
+            for number in range(1, 1 + (1 if empty else 2))
+        ]
+
+    def is_empty_mr(self, mr):
+        return mr["merge_status"] == "cannot_be_merged" and mr["iid"] % 2 == 0
+
+    def get_diff_stats(self, mr):
+        """Diff stats of an MR, as many files as its last version's 'real_size'."""
+        files = 0 if self.is_empty_mr(mr) else 2
+        return {"additions": files * 10, "deletions": files, "fileCount": files}
+
+    def is_empty_compare(self, project_id):
+        return self._rng(project_id, "compare").random() < self.empty_rate
+
+    def get_compare(self, project_id, source, target):
+        commit = {
+            "id": _sha(project_id, source, target),
+            "short_id": _sha(project_id, source, target)[:8],
+            "title": f"Merge {source} into {target}",
+            "created_at": _time(EPOCH),
+        }
+        diffs = []
+        if not self.is_empty_compare(project_id):
+            diffs = [
+                {
+                    "old_path": f"file_{number}.tf",
+                    "new_path": f"file_{number}.tf",
+                    "a_mode": "100644",
+                    "b_mode": "100644",
+                    "diff": "+" + "x" * self.diff_size + "\n",
+                    "new_file": False,
+                    "renamed_file": False,
+                    "deleted_file": False,
+                }
+                for number in range(self.diffs)
+            ]
+        return {
+            "commit": commit,
+            "commits": [commit] if diffs else [],
+            "diffs": diffs,
+            "compare_timeout": False,
+            "compare_same_ref": source == target,
+        }
+
+    def get_commit(self, project_id, reference):
+        return {
+            "id": _sha(project_id, "commit", reference),
+            "title": f"Head of {reference}",
+            "created_at": _time(EPOCH),
+        }
+
+    def _pipeline_state(self, pipeline):
+        now = datetime.now(timezone.utc)
+        created_at = _parse_time(pipeline["created_at"])
+        elapsed = (now - created_at).total_seconds()
+        if elapsed < self.pipeline_duration * 0.1:
+            status = "pending"
+        elif elapsed < self.pipeline_duration:
+            status = "running"
+        elif pipeline["fails"]:
+            status = "failed"
+        else:
+            status = "success"
+        updated_at = created_at + timedelta(
+            seconds=min(elapsed, self.pipeline_duration)
+        )
+        state = {key: value for key, value in pipeline.items() if key != "fails"}
+        state.update({"status": status, "updated_at": _time(updated_at)})
+        return state
+
+    def create_pipeline(self, project_id, reference):
+        with self._lock:
+            pipeline_id = self._next_pipeline_id
+            self._next_pipeline_id += 1
+            pipeline = {
+                "id": pipeline_id,
+                "project_id": project_id,
+                "ref": reference,
+                "sha": _sha(project_id, "commit", reference),
+                "created_at": _time(datetime.now(timezone.utc)),
+                "web_url": f"{self.url}/group/project-{project_id}/-/pipelines/{pipeline_id}",
+                "yaml_errors": None,
+                "fails": self._rng("pipeline", pipeline_id).random()
+                < self.failure_rate,
+            }
+            self._pipelines.setdefault(project_id, []).append(pipeline)
+        self.touch(project_id)
+        return self._pipeline_state(pipeline)
+
+    def get_pipelines(self, project_id):
+        with self._lock:
+            pipelines = list(self._pipelines.get(project_id, []))
+        return [self._pipeline_state(pipeline) for pipeline in pipelines]
+
+
+def _filter_mrs(mrs, query):
+    state = query.get("state", "all")
+    for key in ("source_branch", "target_branch"):
+        if key in query:
+            mrs = [mr for mr in mrs if mr[key] == query[key]]
+    if state != "all":
+        mrs = [mr for mr in mrs if mr["state"] == state]
+    if "updated_after" in query:
+        updated_after = _parse_time(query["updated_after"])
+        mrs = [mr for mr in mrs if _parse_time(mr["updated_at"]) > updated_after]
+    return sorted(mrs, key=lambda mr: mr["updated_at"], reverse=True)
+
+
+def _filter_pipelines(pipelines, query):
+    for key in ("ref", "sha", "status"):
+        if key in query:
+            pipelines = [p for p in pipelines if p[key] == query[key]]
+    if "updated_after" in query:
+        updated_after = _parse_time(query["updated_after"])
+        pipelines = [
+            p for p in pipelines if _parse_time(p["updated_at"]) > updated_after
+        ]
+    order_by = query.get("order_by", "id")
+    return sorted(
+        pipelines, key=lambda p: p[order_by], reverse=query.get("sort") != "asc"
+    )
+
+
+def _search_tag(name, search):
+    """Whether a tag matches a 'search' of the tags API, '^' and '$' anchor it."""
+    name, search = name.lower(), search.lower()
+    if search.startswith("^"):
+        search = search[1:]
+        if search.endswith("$"):
+            return name == search[:-1]
+        return name.startswith(search)
+    if search.endswith("$"):
+        return name.endswith(search[:-1])
+    return search in name
+
+
+_TAG_SORT_KEYS = {
+    "name": lambda tag: tag["name"],
+    "updated": lambda tag: tag["commit"]["created_at"],
+    "version": lambda tag: [int(part) for part in tag["name"].split(".")],
+}
+
+
+class FakeGitlabHandler(BaseHTTPRequestHandler):
+    """Route the requests to the 'FakeGitlab' of the server."""
+
+    # Keep connections open, like gitlab does.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, do not delay the body.
+    disable_nagle_algorithm = True
+
+    # (method, path pattern, handler method, endpoint name in the stats)
+    ROUTES = (
+        ("GET", r"/users", "list_users", "users"),
+        ("GET", r"/issues", "list_issues", "issues"),
+        ("GET", r"/merge_requests", "list_all_mrs", "merge_requests"),
+        (
+            "GET",
+            r"/groups/(?P<group>[^/]+)/projects",
+            "list_group_projects",
+            "group_projects",
+        ),
+        (
+            "GET",
+            r"/groups/(?P<group>[^/]+)/merge_requests",
+            "list_group_mrs",
+            "merge_requests",
+        ),
+        ("GET", r"/projects/(?P<project>[^/]+)", "show_project", "project"),
+        ("GET", r"/projects/(?P<project>[^/]+)/repository/tags", "list_tags", "tags"),
+        (
+            "GET",
+            r"/projects/(?P<project>[^/]+)/repository/compare",
+            "compare",
+            "compare",
+        ),
+        (
+            "GET",
+            r"/projects/(?P<project>[^/]+)/repository/commits/(?P<ref>[^/]+)",
+            "show_commit",
+            "commits",
+        ),
+        (
+            "GET",
+            r"/projects/(?P<project>[^/]+)/merge_requests",
+            "list_project_mrs",
+            "merge_requests",
+        ),
+        (
+            "POST",
+            r"/projects/(?P<project>[^/]+)/merge_requests",
+            "create_mr",
+            "create_merge_request",
+        ),
+        (
+            "GET",
+            r"/projects/(?P<project>[^/]+)/merge_requests/(?P<iid>\d+)/versions",
+            "list_versions",
+            "versions",
+        ),
+        (
+            "POST",
+            r"/projects/(?P<project>[^/]+)/pipeline",
+            "create_pipeline",
+            "create_pipeline",
+        ),
+        (
+            "GET",
+            r"/projects/(?P<project>[^/]+)/pipelines",
+            "list_pipelines",
+            "pipelines",
+        ),
+    )
+    ROUTES = tuple(
+        (method, re.compile(API_PREFIX + pattern + "$"), handler, endpoint)
+        for method, pattern, handler, endpoint in ROUTES
+    ) + (
+        ("POST", re.compile(GRAPHQL_PATH + "$"), "graphql", "graphql"),
+    )
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        self.started = time.perf_counter()
+        parsed = urlparse(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        self.body = self.rfile.read(length) if length else b""
+        self.extra_headers = {}
+
+        if parsed.path.startswith("/_stats"):
+            if method == "POST" and parsed.path == "/_stats/reset":
+                self.fake.reset_stats()
+            return self.send_json(200, self.fake.stats(), count=None)
+
+        for route_method, pattern, handler, endpoint in self.ROUTES:
+            match = pattern.match(parsed.path)
+            if match and route_method == method:
+                break
+        else:
+            return self.send_json(404, {"message": "404 Not Found"}, count="unknown")
+
+        self.extra_headers, allowed = self.fake._rate_limit_headers()
+        if not allowed:
+            return self.send_json(
+                429, {"message": "429 Too Many Requests"}, count=endpoint
+            )
+        if self.fake.token and self.headers.get("PRIVATE-TOKEN") != self.fake.token:
+            return self.send_json(401, {"message": "401 Unauthorized"}, count=endpoint)
+        delay = self.fake._delay()
+        if delay:
+            time.sleep(delay)
+        if self.fake._fails():
+            return self.send_json(
+                503, {"message": "503 Service Unavailable"}, count=endpoint
+            )
+
+        arguments = {key: unquote(value) for key, value in match.groupdict().items()}
+        project = None
+        if "project" in arguments:
+            project = self.fake.get_project(arguments.pop("project"))
+            if project is None:
+                return self.send_json(
+                    404, {"message": "404 Project Not Found"}, count=endpoint
+                )
+        if project is not None:
+            arguments["project_id"] = project["id"]
+        status_code, body = getattr(self, handler)(**arguments)
+        if isinstance(body, list):
+            return self.send_page(body, count=endpoint)
+        return self.send_json(status_code, body, count=endpoint)
+
+    def send_json(self, status_code, body, headers=None, count=None):
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in {**self.extra_headers, **(headers or {})}.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if count:
+            self.fake._count(
+                count,
+                status_code,
+                len(data),
+                len(self.body),
+                time.perf_counter() - self.started,
+            )
+
+    def send_page(self, items, count=None):
+        """Send one page of 'items' with gitlab's pagination headers."""
+        try:
+            page = max(1, int(self.query.get("page", 1)))
+            per_page = int(self.query.get("per_page", PER_PAGE_DEFAULT))
+        except ValueError:
+            return self.send_json(400, {"error": "page is invalid"}, count=count)
+        per_page = min(max(1, per_page), PER_PAGE_MAX)
+        total_pages = max(1, -(-len(items) // per_page))
+        next_page = page + 1 if page < total_pages else ""
+        prev_page = page - 1 if page > 1 else ""
+
+        def page_url(number):
+            query = dict(self.query, page=number, per_page=per_page)
+            host = self.headers.get("Host", "127.0.0.1")
+            return f"http://{host}{urlparse(self.path).path}?{urlencode(query)}"
+
+        links = [
+            f'<{page_url(1)}>; rel="first"',
+            f'<{page_url(total_pages)}>; rel="last"',
+        ]
+        if next_page:
+            links.insert(0, f'<{page_url(next_page)}>; rel="next"')
+        if prev_page:
+            links.insert(0, f'<{page_url(prev_page)}>; rel="prev"')
+        headers = {
+            "X-Page": str(page),
+            "X-Per-Page": str(per_page),
+            "X-Next-Page": str(next_page),
+            "X-Prev-Page": str(prev_page),
+            "X-Total": str(len(items)),
+            "X-Total-Pages": str(total_pages),
+            "Link": ", ".join(links),
+        }
+        start, end = (page - 1) * per_page, page * per_page
+        self.send_json(200, items[start:end], headers, count=count)
+
+    # Endpoints, return (status code, body), lists are paginated.
+
+    def list_users(self):
+        users = self.fake.get_users()
+        if "username" in self.query:
+            users = [u for u in users if u["username"] == self.query["username"]]
+        return 200, users
+
+    def list_issues(self):
+        issues = self.fake.get_issues()
+        if "assignee_id" in self.query:
+            assignee_id = int(self.query["assignee_id"])
+            issues = [i for i in issues if i["assignee"]["id"] == assignee_id]
+        state = self.query.get("state", "all")
+        if state != "all":
+            issues = [i for i in issues if i["state"] == state]
+        return 200, issues
+
+    def list_group_projects(self, group):
+        if not group.isdigit() or not 1 <= int(group) <= self.fake.groups:
+            return 404, {"message": "404 Group Not Found"}
+        projects = self.fake.get_group_projects(group)
+        order_by = self.query.get("order_by", "")
+        if order_by in ("id", "name", "last_activity_at"):
+            projects = sorted(
+                projects,
+                key=lambda p: p[order_by],
+                reverse=self.query.get("sort", "desc") != "asc",
+            )
+        return 200, projects
+
+    def list_all_mrs(self):
+        mrs = []
+        for project_id in range(1, self.fake.projects + 1):
+            mrs.extend(self.fake.get_mrs(project_id))
+        return 200, _filter_mrs(mrs, self.query)
+
+    def list_group_mrs(self, group):
+        if not group.isdigit() or not 1 <= int(group) <= self.fake.groups:
+            return 404, {"message": "404 Group Not Found"}
+        mrs = []
+        for project in self.fake.get_group_projects(group):
+            mrs.extend(self.fake.get_mrs(project["id"]))
+        return 200, _filter_mrs(mrs, self.query)
+
+    def show_project(self, project_id):
+        return 200, self.fake.get_project(project_id)
+
+    def list_tags(self, project_id):
+        tags = self.fake.get_tags(project_id)
+        order_by = self.query.get("order_by", "updated")
+        if order_by not in self.fake.tag_orders:
+            return 400, {"error": "order_by does not have a valid value"}
+        search = self.query.get("search", "")
+        if search:
+            tags = [tag for tag in tags if _search_tag(tag["name"], search)]
+        tags = sorted(
+            tags,
+            key=_TAG_SORT_KEYS[order_by],
+            reverse=self.query.get("sort", "desc") != "asc",
+        )
+        return 200, tags
+
+    def compare(self, project_id):
+        return 200, self.fake.get_compare(
+            project_id, self.query.get("from", ""), self.query.get("to", "")
+        )
+
+    def show_commit(self, project_id, ref):
+        return 200, self.fake.get_commit(project_id, ref)
+
+    def list_project_mrs(self, project_id):
+        return 200, _filter_mrs(self.fake.get_mrs(project_id), self.query)
+
+    def create_mr(self, project_id):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            return 400, {"message": "400 Bad request - invalid JSON"}
+        for mr in self.fake.get_mrs(project_id):
+            if (
+                mr["state"] == "opened"
+                and mr["source_branch"] == data.get("source_branch", None)
+                and mr["target_branch"] == data.get("target_branch", None)
+            ):
+                return 409, {
+                    "message": [
+                        "Another open merge request already exists for this source branch"
+                    ]
+                }
+        return 201, self.fake.create_mr(project_id, data)
+
+    def list_versions(self, project_id, iid):
+        versions = self.fake.get_versions(project_id, int(iid))
+        if versions is None:
+            return 404, {"message": "404 Not found"}
+        return 200, versions
+
+    def create_pipeline(self, project_id):
+        reference = self.query.get("ref", None)
+        if not reference:
+            return 400, {"message": "400 Bad request - ref is missing"}
+        return 201, self.fake.create_pipeline(project_id, reference)
+
+    def list_pipelines(self, project_id):
+        return 200, _filter_pipelines(self.fake.get_pipelines(project_id), self.query)
+
+    def graphql(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            return 400, {"message": "400 Bad request - invalid JSON"}
+        graphql = FakeGraphql(self.fake, _filter_mrs)
+        # Errors are answered with 200, like gitlab does.
+        return 200, graphql.execute(
+            data.get("query", ""), variables=data.get("variables", None)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a fake gitlab API with synthetic data.",
+        epilog="python benchmarks/fake_gitlab.py --projects 100 --port 8080",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument(
+        "--port", type=int, default=8080, help="Port to listen on, 0 for a free one."
+    )
+    parser.add_argument(
+        "--projects", type=int, default=PROJECTS_DEFAULT, help="Number of projects."
+    )
+    parser.add_argument(
+        "--groups",
+        type=int,
+        default=GROUPS_DEFAULT,
+        help="Number of groups the projects are spread over.",
+    )
+    parser.add_argument(
+        "--tags", type=int, default=TAGS_DEFAULT, help="Tags per project."
+    )
+    parser.add_argument(
+        "--mrs", type=int, default=MRS_DEFAULT, help="Merge requests per project."
+    )
+    parser.add_argument(
+        "--issues", type=int, default=ISSUES_DEFAULT, help="Number of issues."
+    )
+    parser.add_argument(
+        "--users", type=int, default=USERS_DEFAULT, help="Number of users."
+    )
+    parser.add_argument(
+        "--diffs", type=int, default=DIFFS_DEFAULT, help="Diffs per compare result."
+    )
+    parser.add_argument(
+        "--diff-size", type=int, default=DIFF_SIZE_DEFAULT, help="Bytes per diff."
+    )
+    parser.add_argument(
+        "--empty-rate",
+        type=float,
+        default=EMPTY_RATE_DEFAULT,
+        help="Fraction of projects without differences between branches.",
+    )
+    parser.add_argument(
+        "--pipeline-duration",
+        type=float,
+        default=PIPELINE_DURATION_DEFAULT,
+        help="Seconds a created pipeline runs.",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=FAILURE_RATE_DEFAULT,
+        help="Fraction of pipelines failing.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds every request takes."
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Random seconds, up to this, added to the latency.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with 503.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="Requests allowed per second, answered with 429 above. 0 is unlimited.",
+    )
+    parser.add_argument(
+        "--token", default=None, help="Private token the requests have to send."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data.")
+    parser.add_argument(
+        "--tag-orders",
+        default=",".join(TAG_ORDERS),
+        help="Comma separated orders of tags the server knows, others are answered with 400.",
+    )
+    parser.add_argument("--debug", action="store_true", help="Log every request.")
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+
+    gitlab = FakeGitlab(
+        projects=args.projects,
+        groups=args.groups,
+        tags=args.tags,
+        mrs=args.mrs,
+        issues=args.issues,
+        users=args.users,
+        diffs=args.diffs,
+        diff_size=args.diff_size,
+        empty_rate=args.empty_rate,
+        pipeline_duration=args.pipeline_duration,
+        failure_rate=args.failure_rate,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        token=args.token,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+        tag_orders=tuple(args.tag_orders.split(",")),
+    )
+    logger.info(f"Serving a fake gitlab API at {gitlab.url}.")
+    try:
+        gitlab.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gitlab.httpd.server_close()
+    logger.info(json.dumps(gitlab.stats()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Goal:
+  * Answer GraphQL queries of the fake gitlab API ('fake_gitlab.py').
+  * Only the part of the gitlab schema the scripts query: projects by full
+    path, their merge requests (cursor paginated) and their diff stats.
+
+Queries are parsed with aliases, arguments, variables and nested selections,
+not with fragments, directives or mutations. Unknown fields are errors, like
+in gitlab.
+"""
+
+import re
+import base64
+
+# Nodes per page at most, like gitlab.
+FIRST_MAX = 100
+
+TOKEN = re.compile(
+    r'\s+|,|#[^\n]*|(?P<string>"(?:[^"\\]|\\.)*")|(?P<number>-?\d+)'
+    r"|(?P<name>[_A-Za-z][_0-9A-Za-z]*)|(?P<punctuator>[!$():=@\[\]{}|]|\.\.\.)"
+)
+
+
+class GraphqlError(Exception):
+    pass
+
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = TOKEN.match(query, position)
+        if not match:
+            raise GraphqlError(f"Syntax error at {position}.")
+        position = match.end()
+        for kind in ("string", "number", "name", "punctuator"):
+            if match.group(kind) is not None:
+                tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+class Parser:
+    """Parse a query into [(alias, name, arguments, selections)]."""
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, value=None):
+        kind, token = self.peek()
+        if token is None or (value is not None and token != value):
+            raise GraphqlError(f"Expected '{value}', got '{token}'.")
+        self.position += 1
+        return token
+
+    def parse(self):
+        if self.peek()[1] == "query":
+            self.take()
+            if self.peek()[0] == "name":
+                self.take()
+            if self.peek()[1] == "(":
+                self.skip_variable_definitions()
+        selections = self.parse_selections()
+        if self.peek()[1] is not None:
+            raise GraphqlError(f"Unexpected '{self.peek()[1]}'.")
+        return selections
+
+    def skip_variable_definitions(self):
+        self.take("(")
+        while self.peek()[1] != ")":
+            self.take()
+        self.take(")")
+
+    def parse_selections(self):
+        self.take("{")
+        selections = []
+        while self.peek()[1] != "}":
+            alias = name = self.take()
+            if self.peek()[1] == ":":
+                self.take(":")
+                name = self.take()
+            arguments = {}
+            if self.peek()[1] == "(":
+                self.take("(")
+                while self.peek()[1] != ")":
+                    argument = self.take()
+                    self.take(":")
+                    arguments[argument] = self.parse_value()
+                self.take(")")
+            children = None
+            if self.peek()[1] == "{":
+                children = self.parse_selections()
+            selections.append((alias, name, arguments, children))
+        self.take("}")
+        return selections
+
+    def parse_value(self):
+        kind, token = self.peek()
+        self.take()
+        if token == "$":
+            return ("variable", self.take())
+        if kind == "string":
+            return ("value", token[1:-1].encode().decode("unicode_escape"))
+        if kind == "number":
+            return ("value", int(token))
+        if token in ("true", "false"):
+            return ("value", token == "true")
+        if token == "null":
+            return ("value", None)
+        # Enum values.
+        return ("value", token)
+
+
+def _cursor(offset):
+    return base64.b64encode(f"offset:{offset}".encode()).decode()
+
+
+def _offset(cursor):
+    if not cursor:
+        return 0
+    try:
+        return int(base64.b64decode(cursor).decode().split(":", 1)[1])
+    except (ValueError, IndexError):
+        raise GraphqlError(f"Invalid cursor '{cursor}'.")
+
+
+def _graphql_time(value):
+    """Gitlab's GraphQL times have no milliseconds."""
+    return value.split(".")[0] + "Z" if value else value
+
+
+class FakeGraphql:
+    """Resolve the fields of the queries against a 'fake_gitlab.FakeGitlab'."""
+
+    def __init__(self, fake, filter_mrs):
+        """
+        :param filter_mrs: Function filtering MRs by a REST query, the same as
+            the REST endpoints.
+        """
+        self.fake = fake
+        self.filter_mrs = filter_mrs
+
+    def execute(self, query, variables=None):
+        """Return the response body of a query."""
+        try:
+            selections = Parser(query).parse()
+            data = self.resolve(selections, "Query", None, variables or {})
+        except GraphqlError as e:
+            return {"errors": [{"message": str(e)}]}
+        return {"data": data}
+
+    def resolve(self, selections, type_name, value, variables):
+        result = {}
+        for alias, name, arguments, children in selections:
+            arguments = {
+                key: variables.get(argument) if kind == "variable" else argument
+                for key, (kind, argument) in arguments.items()
+            }
+            resolver = getattr(self, f"resolve_{type_name}_{name}", None)
+            if resolver is None:
+                raise GraphqlError(
+                    f"Field '{name}' doesn't exist on type '{type_name}'"
+                )
+            try:
+                field_type, field_value = resolver(value, **arguments)
+            except TypeError:
+                raise GraphqlError(
+                    f"Field '{name}' of type '{type_name}' has unknown arguments"
+                    f" '{', '.join(arguments)}'"
+                )
+            if children is None or field_value is None:
+                result[alias] = field_value
+            elif isinstance(field_value, list):
+                result[alias] = [
+                    self.resolve(children, field_type, item, variables)
+                    for item in field_value
+                ]
+            else:
+                result[alias] = self.resolve(
+                    children, field_type, field_value, variables
+                )
+        return result
+
+    # Query
+
+    def resolve_Query_project(self, value, fullPath=None):
+        return "Project", self.fake.get_project(fullPath or "")
+
+    # Project
+
+    def resolve_Project_id(self, project):
+        return None, f"gid://gitlab/Project/{project['id']}"
+
+    def resolve_Project_fullPath(self, project):
+        return None, project["path_with_namespace"]
+
+    def resolve_Project_mergeRequests(
+        self, project, state=None, updatedAfter=None, first=None, after=None
+    ):
+        query = {"state": state or "all"}
+        if updatedAfter:
+            query["updated_after"] = updatedAfter
+        mrs = self.filter_mrs(self.fake.get_mrs(project["id"]), query)
+        offset = _offset(after)
+        end = offset + min(FIRST_MAX, first or FIRST_MAX)
+        nodes = mrs[offset:end]
+        end = offset + len(nodes)
+        return "MergeRequestConnection", {
+            "nodes": nodes,
+            "pageInfo": {
+                "hasNextPage": end < len(mrs),
+                "endCursor": _cursor(end) if nodes else None,
+            },
+            "count": len(mrs),
+        }
+
+    # MergeRequestConnection
+
+    def resolve_MergeRequestConnection_nodes(self, connection):
+        return "MergeRequest", connection["nodes"]
+
+    def resolve_MergeRequestConnection_pageInfo(self, connection):
+        return "PageInfo", connection["pageInfo"]
+
+    def resolve_MergeRequestConnection_count(self, connection):
+        return None, connection["count"]
+
+    # PageInfo
+
+    def resolve_PageInfo_hasNextPage(self, page_info):
+        return None, page_info["hasNextPage"]
+
+    def resolve_PageInfo_endCursor(self, page_info):
+        return None, page_info["endCursor"]
+
+    # MergeRequest
+
+    def resolve_MergeRequest_iid(self, mr):
+        return None, str(mr["iid"])
+
+    def resolve_MergeRequest_state(self, mr):
+        return None, mr["state"]
+
+    def resolve_MergeRequest_mergeStatusEnum(self, mr):
+        return None, mr["merge_status"].upper()
+
+    def resolve_MergeRequest_conflicts(self, mr):
+        return None, mr["has_conflicts"]
+
+    def resolve_MergeRequest_webUrl(self, mr):
+        return None, mr["web_url"]
+
+    def resolve_MergeRequest_updatedAt(self, mr):
+        return None, _graphql_time(mr["updated_at"])
+
+    def resolve_MergeRequest_diffHeadSha(self, mr):
+        return None, mr["sha"]
+
+    def resolve_MergeRequest_sourceBranch(self, mr):
+        return None, mr["source_branch"]
+
+    def resolve_MergeRequest_targetBranch(self, mr):
+        return None, mr["target_branch"]
+
+    def resolve_MergeRequest_diffStatsSummary(self, mr):
+        return "DiffStatsSummary", self.fake.get_diff_stats(mr)
+
+    # DiffStatsSummary
+
+    def resolve_DiffStatsSummary_additions(self, stats):
+        return None, stats["additions"]
+
+    def resolve_DiffStatsSummary_deletions(self, stats):
+        return None, stats["deletions"]
+
+    def resolve_DiffStatsSummary_fileCount(self, stats):
+        return None, stats["fileCount"]
+
+    def resolve_DiffStatsSummary_changes(self, stats):
+        return None, stats["additions"] + stats["deletions"]
@@ -0,0 +1,165 @@
+"""
+Goal:
+  * Compare listing tags with the API ('tags --backend api') and with
+    'git ls-remote' ('tags --backend git'), against the fake gitlab API
+    ('benchmarks/fake_gitlab.py') and local bare repositories with the same
+    tags, half of them annotated.
+  * Per backend: wall time and API requests. Both backends have to return
+    the same tags.
+
+How to:
+  * Get help
+    - python benchmarks/git_tags.py -h
+  * 200 repositories with 30 tags, simulating a remote API
+    - python benchmarks/git_tags.py --projects 200 --tags 30 --latency 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+sys.path.insert(0, BENCHMARKS_PATH)
+sys.path.insert(1, ROOT_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROJECTS_DEFAULT = 100
+TAGS_DEFAULT = 20
+LATENCY_DEFAULT = 0.01
+TOKEN = "benchmark"
+GIT_ENVIRONMENT = {
+    "GIT_AUTHOR_NAME": "benchmark",
+    "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+    "GIT_COMMITTER_NAME": "benchmark",
+    "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+}
+
+
+def git(*arguments, cwd=None):
+    subprocess.run(
+        ["git"] + list(arguments),
+        cwd=cwd,
+        env=dict(os.environ, **GIT_ENVIRONMENT),
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def create_repositories(fake_gitlab, workdir):
+    """Create a bare repository per project of the fake API, with its tags.
+
+    Returns the '--git-url' template of the repositories.
+    """
+    source = os.path.join(workdir, "source")
+    git("init", "-q", source)
+    # The fake API lists the tags the most recent first.
+    for number, tag in enumerate(reversed(fake_gitlab.get_tags(1))):
+        git("commit", "-q", "--allow-empty", "-m", tag["name"], cwd=source)
+        if number % 2:
+            git("tag", "-a", "-m", tag["name"], tag["name"], cwd=source)
+        else:
+            git("tag", tag["name"], cwd=source)
+    for project in fake_gitlab.get_group_projects(1):
+        path = os.path.join(workdir, project["path_with_namespace"] + ".git")
+        git("clone", "-q", "--bare", source, path)
+    return f"file://{workdir}/{{path_with_namespace}}.git"
+
+
+def run_command(arguments):
+    """Run a command locally, return (milliseconds, stdout)."""
+    environment = dict(os.environ)
+    environment.pop(SOCKET_ENVIRONMENT_VARIABLE, None)
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, ENTRY_POINT] + arguments,
+        env=environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        logger.warning(
+            f"'{arguments[0]}' exited with {process.returncode}:"
+            f" {process.stderr[-2000:].decode(errors='replace')}"
+        )
+    return elapsed, process.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare listing tags with the API and with 'git ls-remote'.",
+        epilog="python benchmarks/git_tags.py --projects 200 --tags 30 --latency 0.05",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--projects", type=int, default=PROJECTS_DEFAULT, help="Repositories."
+    )
+    parser.add_argument(
+        "--tags", type=int, default=TAGS_DEFAULT, help="Tags per repository."
+    )
+    parser.add_argument(
+        "--amount", type=int, default=-1, help="Tags to show, '-1' for all."
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY_DEFAULT,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    fake_gitlab = FakeGitlab(
+        projects=args.projects, tags=args.tags, latency=args.latency, token=TOKEN
+    )
+    results = []
+    outputs = {}
+    with fake_gitlab, tempfile.TemporaryDirectory() as workdir:
+        git_url = create_repositories(fake_gitlab, workdir)
+        for backend in ("api", "git"):
+            arguments = ["tags", "--url", fake_gitlab.url, "--token", TOKEN]
+            arguments += ["--group", "1", "--amount", str(args.amount)]
+            arguments += ["--backend", backend, "--git-url", git_url]
+            fake_gitlab.reset_stats()
+            elapsed, output = run_command(arguments)
+            outputs[backend] = json.loads(output or b"{}")
+            result = {
+                "backend": backend,
+                "projects": args.projects,
+                "tags": args.tags,
+                "ms": round(elapsed, 2),
+                "requests": fake_gitlab.stats()["requests"],
+                "projects_with_tags": len(outputs[backend]),
+            }
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    exit_code = 0
+    if outputs["api"] != outputs["git"]:
+        logger.error("The backends returned different tags.")
+        exit_code = 1
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(
+                {"latency": args.latency, "results": results}, file_handler, indent=2
+            )
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
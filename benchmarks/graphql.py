@@ -0,0 +1,178 @@
+"""
+Goal:
+  * Compare listing the MRs of a group with REST ('--engine rest', the
+    versions of every MR) and with batched GraphQL queries ('--engine
+    graphql', the diff stats of every MR), against the fake gitlab API
+    ('benchmarks/fake_gitlab.py') serving both.
+  * Per engine: wall time, requests per endpoint, MRs and empty MRs found.
+    Both engines have to find the same MRs and the same empty MRs.
+
+How to:
+  * Get help
+    - python benchmarks/graphql.py -h
+  * 200 projects with 20 MRs each, simulating a remote server
+    - python benchmarks/graphql.py --projects 200 --mrs 20 --latency 0.05
+  * Failing GraphQL queries fall back to REST per project
+    - python benchmarks/graphql.py --error-rate 0.05
+"""
+
+import os
+import ast
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+sys.path.insert(0, BENCHMARKS_PATH)
+sys.path.insert(1, ROOT_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROJECTS_DEFAULT = 100
+MRS_DEFAULT = 20
+LATENCY_DEFAULT = 0.01
+BATCH_SIZE_DEFAULT = 20
+TOKEN = "benchmark"
+# Fields both engines return the same.
+MR_KEYS = ("project_id", "iid", "state", "merge_status", "has_conflicts", "sha")
+
+
+def parse_output(output):
+    """Return the MRs and the web urls of the empty MRs printed by 'mrs list'."""
+    mrs = set()
+    text = []
+    for line in output.decode().splitlines():
+        if line.startswith("{'"):
+            mr = ast.literal_eval(line)
+            mrs.add(tuple(mr[key] for key in MR_KEYS))
+        else:
+            text.append(line)
+    text = "\n".join(text).strip()
+
+    empty = set()
+    decoder = json.JSONDecoder()
+    position = 0
+    while position < len(text):
+        value, position = decoder.raw_decode(text, position)
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if isinstance(value, dict) and value.get("file_count", None) == 0:
+            empty.add(value["web_url"])
+        elif isinstance(value, list) and value:
+            if all(version["real_size"] is None for version in value):
+                empty.add(value[0]["web_url"])
+    return mrs, empty
+
+
+def run_command(arguments):
+    """Run a command locally, return (milliseconds, stdout)."""
+    environment = dict(os.environ)
+    environment.pop(SOCKET_ENVIRONMENT_VARIABLE, None)
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, ENTRY_POINT] + arguments,
+        env=environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        logger.warning(
+            f"'{arguments[0]}' exited with {process.returncode}:"
+            f" {process.stderr[-2000:].decode(errors='replace')}"
+        )
+    return elapsed, process.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare listing MRs with REST and with batched GraphQL queries.",
+        epilog="python benchmarks/graphql.py --projects 200 --mrs 20 --latency 0.05",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--projects", type=int, default=PROJECTS_DEFAULT, help="Projects of the group."
+    )
+    parser.add_argument(
+        "--mrs", type=int, default=MRS_DEFAULT, help="Merge requests per project."
+    )
+    parser.add_argument("--state", default="opened", help="State of the MRs to list.")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE_DEFAULT,
+        help="Projects per GraphQL query.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY_DEFAULT,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests the fake API answers with 503.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    fake_gitlab = FakeGitlab(
+        projects=args.projects,
+        mrs=args.mrs,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        token=TOKEN,
+    )
+    results = []
+    found = {}
+    with fake_gitlab:
+        for engine in ("rest", "graphql"):
+            arguments = ["mrs", "list", "--url", fake_gitlab.url, "--token", TOKEN]
+            arguments += ["--project", "", "--group", "1", "--state", args.state]
+            arguments += ["--engine", engine, "--batch-size", str(args.batch_size)]
+            fake_gitlab.reset_stats()
+            elapsed, output = run_command(arguments)
+            stats = fake_gitlab.stats()
+            found[engine] = parse_output(output)
+            result = {
+                "engine": engine,
+                "projects": args.projects,
+                "mrs_per_project": args.mrs,
+                "ms": round(elapsed, 2),
+                "requests": stats["requests"],
+                "endpoints": stats["endpoints"],
+                "bytes_sent": stats["bytes_sent"],
+                "mrs": len(found[engine][0]),
+                "empty_mrs": len(found[engine][1]),
+            }
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    exit_code = 0
+    if found["rest"] != found["graphql"]:
+        logger.error("The engines found different MRs or empty MRs.")
+        exit_code = 1
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(
+                {"latency": args.latency, "results": results}, file_handler, indent=2
+            )
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Goal:
+  * Measure what the project inventory ('project_inventory.py') saves, against
+    the fake gitlab API ('benchmarks/fake_gitlab.py').
+  * Per command: requests and wall time without the inventory, filling it
+    (first run) and after activity in '--changed' projects (next run).
+  * 'mrs list' also fetches the versions of all MRs, see '--versions-cache'
+    to skip those, the requests are shown per endpoint.
+
+How to:
+  * Get help
+    - python benchmarks/inventory.py -h
+  * 1000 projects, 10 of them with activity between the runs
+    - python benchmarks/inventory.py --projects 1000 --changed 10
+  * Simulate a remote server
+    - python benchmarks/inventory.py --latency 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+sys.path.insert(0, BENCHMARKS_PATH)
+sys.path.insert(1, ROOT_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROJECTS_DEFAULT = 200
+CHANGED_DEFAULT = 5
+LATENCY_DEFAULT = 0.01
+TOKEN = "benchmark"
+
+
+def get_cases(url):
+    """Return the arguments of the benchmarked commands."""
+    credentials = ["--url", url, "--token", TOKEN]
+    return {
+        "tags": ["tags"] + credentials + ["--group", "1", "--latest"],
+        "mrs list": ["mrs", "list"] + credentials + ["--project", "", "--group", "1"],
+    }
+
+
+def run_command(arguments):
+    """Run a command locally, return (milliseconds, stdout)."""
+    environment = dict(os.environ)
+    environment.pop(SOCKET_ENVIRONMENT_VARIABLE, None)
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, ENTRY_POINT] + arguments,
+        env=environment,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        logger.warning(
+            f"'{arguments[0]}' exited with {process.returncode}:"
+            f" {process.stderr[-2000:].decode(errors='replace')}"
+        )
+    return elapsed, process.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the requests the project inventory saves.",
+        epilog="python benchmarks/inventory.py --projects 1000 --changed 10",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--projects",
+        type=int,
+        default=PROJECTS_DEFAULT,
+        help="Projects of the fake API.",
+    )
+    parser.add_argument(
+        "--changed",
+        type=int,
+        default=CHANGED_DEFAULT,
+        help="Projects with activity between the runs.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY_DEFAULT,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    fake_gitlab = FakeGitlab(projects=args.projects, latency=args.latency, token=TOKEN)
+    results = []
+    with fake_gitlab, tempfile.TemporaryDirectory() as workdir:
+        for name, arguments in get_cases(fake_gitlab.url).items():
+            path = os.path.join(workdir, f"{name.replace(' ', '-')}.json")
+            inventory_arguments = arguments + ["--inventory", path]
+            runs = (
+                ("without", arguments),
+                ("first", inventory_arguments),
+                ("next", inventory_arguments),
+            )
+            outputs = {}
+            for run, run_arguments in runs:
+                if run == "next":
+                    for project_id in range(1, args.changed + 1):
+                        fake_gitlab.touch(project_id)
+                fake_gitlab.reset_stats()
+                elapsed, outputs[run] = run_command(run_arguments)
+                stats = fake_gitlab.stats()
+                result = {
+                    "command": name,
+                    "run": run,
+                    "projects": args.projects,
+                    "changed": args.changed if run == "next" else None,
+                    "ms": round(elapsed, 2),
+                    "requests": stats["requests"],
+                    "endpoints": stats["endpoints"],
+                }
+                print(json.dumps(result), flush=True)
+                results.append(result)
+            if name == "tags" and json.loads(outputs["next"]) != json.loads(
+                outputs["without"]
+            ):
+                logger.warning("The tags from the inventory differ.")
+
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(
+                {"latency": args.latency, "results": results}, file_handler, indent=2
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Goal:
+  * Run '--jobs' 'tags' commands at the same time with the same token, like
+    parallel CI jobs, against the fake gitlab API ('benchmarks/fake_gitlab.py')
+    allowing '--server-limit' requests per second.
+  * Without and with the shared rate limit ('rate_limit.py', '--rate-limit'):
+    wall time, requests, requests rejected with 429 and seconds waited for
+    the rate limit (from the metrics of the jobs).
+
+How to:
+  * Get help
+    - python benchmarks/shared_rate_limit.py -h
+  * 4 jobs over 50 projects, the server allows 40 requests per second
+    - python benchmarks/shared_rate_limit.py --jobs 4 --projects 50 --server-limit 40 --rate-limit 35
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+sys.path.insert(0, BENCHMARKS_PATH)
+sys.path.insert(1, ROOT_PATH)
+
+from fake_gitlab import FakeGitlab  # noqa: E402
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE  # noqa: E402
+from rate_limit import RATE_LIMIT_VARIABLE, DATABASE_VARIABLE  # noqa: E402
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+JOBS_DEFAULT = 4
+PROJECTS_DEFAULT = 50
+SERVER_LIMIT_DEFAULT = 40
+RATE_LIMIT_DEFAULT = 35
+LATENCY_DEFAULT = 0.01
+TOKEN = "benchmark"
+
+
+def run_jobs(url, jobs, workdir, rate_limit=0):
+    """Run 'jobs' commands at the same time, return (milliseconds, their metrics)."""
+    environment = dict(os.environ)
+    for variable in (SOCKET_ENVIRONMENT_VARIABLE, RATE_LIMIT_VARIABLE):
+        environment.pop(variable, None)
+    environment[DATABASE_VARIABLE] = os.path.join(workdir, "rate-limit.sqlite")
+    started = time.perf_counter()
+    processes = []
+    for job in range(jobs):
+        metrics_path = os.path.join(workdir, f"job-{rate_limit}-{job}.json")
+        arguments = ["tags", "--url", url, "--token", TOKEN, "--group", "1"]
+        arguments += ["--latest", "--metrics-out", metrics_path]
+        arguments += ["--rate-limit", str(rate_limit)]
+        process = subprocess.Popen(
+            [sys.executable, ENTRY_POINT] + arguments,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        processes.append((process, metrics_path))
+    metrics = []
+    for process, metrics_path in processes:
+        _, stderr = process.communicate()
+        if process.returncode:
+            logger.warning(
+                f"A job exited with {process.returncode}:"
+                f" {stderr[-2000:].decode(errors='replace')}"
+            )
+        with open(metrics_path) as file_handler:
+            metrics.append(json.load(file_handler))
+    return (time.perf_counter() - started) * 1000, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare parallel jobs without and with the shared rate limit.",
+        epilog="python benchmarks/shared_rate_limit.py --jobs 4 --projects 50 --server-limit 40 --rate-limit 35",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=JOBS_DEFAULT, help="Jobs at the same time."
+    )
+    parser.add_argument(
+        "--projects", type=int, default=PROJECTS_DEFAULT, help="Projects of the group."
+    )
+    parser.add_argument(
+        "--server-limit",
+        type=int,
+        default=SERVER_LIMIT_DEFAULT,
+        help="Requests per second the fake API allows, answering 429 above.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=RATE_LIMIT_DEFAULT,
+        help="Requests per second of the shared rate limit of all jobs.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=LATENCY_DEFAULT,
+        help="Seconds every request to the fake API takes.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    fake_gitlab = FakeGitlab(
+        projects=args.projects,
+        latency=args.latency,
+        rate_limit=args.server_limit,
+        token=TOKEN,
+    )
+    results = []
+    with fake_gitlab, tempfile.TemporaryDirectory() as workdir:
+        for rate_limit in (0, args.rate_limit):
+            fake_gitlab.reset_stats()
+            elapsed, metrics = run_jobs(
+                fake_gitlab.url, args.jobs, workdir, rate_limit=rate_limit
+            )
+            stats = fake_gitlab.stats()
+            endpoints = [endpoint for job in metrics for endpoint in job["endpoints"]]
+            result = {
+                "rate_limit": rate_limit,
+                "jobs": args.jobs,
+                "projects": args.projects,
+                "ms": round(elapsed, 2),
+                "requests": stats["requests"],
+                "rejected": stats["status_codes"].get("429", 0),
+                "retries": sum(endpoint["retries"] for endpoint in endpoints),
+                "rate_limit_waits": sum(
+                    endpoint["rate_limit_waits"] for endpoint in endpoints
+                ),
+                "rate_limit_wait_seconds": round(
+                    sum(endpoint["rate_limit_wait_seconds"] for endpoint in endpoints),
+                    3,
+                ),
+            }
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as file_handler:
+            json.dump(
+                {"server_limit": args.server_limit, "results": results},
+                file_handler,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Goal:
+  * Measure the startup time of the 'gitlab-scripts' commands, e.g. to keep
+    commands run in git hooks fast.
+  * Per command: median and fastest wall time of runs that only parse the
+    arguments (mostly '--help'), and the heavy modules it imports.
+  * The startup of the interpreter alone ('python -c pass') is measured too,
+    for comparison.
+
+How to:
+  * Get help
+    - python benchmarks/startup.py -h
+  * Measure all commands
+    - python benchmarks/startup.py --output startup.json
+  * Change the number of runs and the budget of the light commands,
+    exits with 1 if a light command is slower or imports a heavy module.
+    - python benchmarks/startup.py --runs 20 --budget 100
+
+Light commands do not need 'requests' or 'GitPython' to start, e.g. the
+top level help and 'ci-ref' without files.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(BENCHMARKS_PATH)
+ENTRY_POINT = os.path.join(ROOT_PATH, "gitlab_scripts.py")
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RUNS_DEFAULT = 10
+BUDGET_DEFAULT = 100.0
+HEAVY_MODULES = ("requests", "urllib3", "git")
+
+# name: (arguments, light)
+CASES = {
+    "help": (["--help"], True),
+    "mrs help": (["mrs", "--help"], True),
+    "pipelines help": (["pipelines", "--help"], True),
+    "ci-ref": (["ci-ref"], True),
+    "tf-modules": (["tf-modules", "--paths", "{workdir}"], True),
+    "tags help": (["tags", "--help"], False),
+    "users help": (["users", "--help"], False),
+    "issues help": (["issues", "--help"], False),
+    "mrs create help": (["mrs", "create", "--help"], False),
+    "mrs list help": (["mrs", "list", "--help"], False),
+    "mrs sync help": (["mrs", "sync", "--help"], False),
+    "pipelines create help": (["pipelines", "create", "--help"], False),
+}
+
+
+def run(command, cwd):
+    """Run a command, return (exit code, milliseconds, stderr)."""
+    started = time.perf_counter()
+    process = subprocess.run(
+        command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    return process.returncode, elapsed, process.stderr.decode(errors="replace")
+
+
+def get_imported(arguments, cwd):
+    """Return the top level modules imported by a command, using '-X importtime'."""
+    _, _, stderr = run(
+        [sys.executable, "-X", "importtime", ENTRY_POINT] + arguments, cwd
+    )
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+def measure(name, arguments, light, runs=RUNS_DEFAULT, cwd=ROOT_PATH):
+    """Run a command 'runs' times, returns its result."""
+    exit_code = 0
+    times = []
+    for _ in range(runs):
+        exit_code, elapsed, stderr = run([sys.executable, ENTRY_POINT] + arguments, cwd)
+        times.append(elapsed)
+        if exit_code:
+            logger.warning(f"'{name}' exited with {exit_code}: {stderr[-2000:]}")
+    imported = get_imported(arguments, cwd)
+    return {
+        "command": name,
+        "light": light,
+        "exit_code": exit_code,
+        "median_ms": round(statistics.median(times), 2),
+        "min_ms": round(min(times), 2),
+        "heavy_modules": sorted(m for m in HEAVY_MODULES if m in imported),
+    }
+
+
+def get_failures(results, budget=BUDGET_DEFAULT):
+    """Return a message per light command slower than 'budget' ms or importing heavy modules."""
+    failures = []
+    for result in results:
+        if not result["light"]:
+            continue
+        if result["median_ms"] > budget:
+            failures.append(
+                f"'{result['command']}' takes {result['median_ms']} ms, budget {budget} ms."
+            )
+        if result["heavy_modules"]:
+            failures.append(
+                f"'{result['command']}' imports {', '.join(result['heavy_modules'])}."
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the startup time of the gitlab-scripts commands.",
+        epilog="python benchmarks/startup.py --runs 20 --output startup.json",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--runs", type=int, default=RUNS_DEFAULT, help="Runs per command."
+    )
+    parser.add_argument(
+        "--commands",
+        nargs="+",
+        choices=sorted(CASES),
+        default=list(CASES),
+        help="Commands to measure.",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=BUDGET_DEFAULT,
+        help="Milliseconds a light command may take to start.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="", help="Write the results to this JSON file."
+    )
+    args = parser.parse_args()
+
+    times = [
+        run([sys.executable, "-c", "pass"], ROOT_PATH)[1] for _ in range(args.runs)
+    ]
+    interpreter_ms = round(statistics.median(times), 2)
+    logger.info(f"Interpreter startup: {interpreter_ms} ms.")
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.commands:
+            arguments, light = CASES[name]
+            arguments = [argument.format(workdir=workdir) for argument in arguments]
+            # Run outside of the repository, like an installed command.
+            result = measure(name, arguments, light, runs=args.runs, cwd=workdir)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "interpreter_ms": interpreter_ms,
+            "results": results,
+        }
+        with open(args.output, "w") as file_handler:
+            json.dump(report, file_handler, indent=2)
+
+    failures = get_failures(results, budget=args.budget)
+    for failure in failures:
+        logger.error(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
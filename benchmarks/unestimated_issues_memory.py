@@ -0,0 +1,89 @@
+"""
+Goal:
+  * Compare the memory used by the unestimated issues result representations.
+
+How to:
+  * python benchmarks/unestimated_issues_memory.py
+  * python benchmarks/unestimated_issues_memory.py --issues 100000
+"""
+
+import os
+import sys
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from get_unestimated_issues import UnestimatedIssue  # noqa: E402
+
+NUMBER_OF_ISSUES = 100000
+
+
+def synthetic_issues(amount):
+    for issue_id in range(amount):
+        yield {
+            "id": issue_id,
+            "project_id": issue_id % 300,
+            "title": f"Synthetic issue number {issue_id}",
+            "web_url": f"https://gitlab.example.com/group/project/-/issues/{issue_id}",
+            "labels": ["bug", "backend"],
+            "time_stats": {"time_estimate": 0, "total_time_spent": issue_id % 7200},
+        }
+
+
+def tuples(issues):
+    """The former representation: stringified (label, value) tuples per issue."""
+    result = defaultdict(list)
+    for issue in issues:
+        timestats = issue["time_stats"]
+        result[issue["id"]].append(("project_id", str(issue["project_id"])))
+        result[issue["id"]].append(("title", issue["title"]))
+        result[issue["id"]].append(("web_url", issue["web_url"]))
+        result[issue["id"]].append(("labels", ", ".join(issue["labels"])))
+        result[issue["id"]].append(
+            ("time estimated [seconds]", str(timestats["time_estimate"]))
+        )
+        result[issue["id"]].append(
+            ("total_time_spent [seconds]", str(timestats["total_time_spent"]))
+        )
+    return result
+
+
+def records(issues):
+    return [UnestimatedIssue.from_issue(issue, issue["time_stats"]) for issue in issues]
+
+
+def measure(build, issues):
+    tracemalloc.start()
+    result = build(issues)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Memory benchmark of the unestimated issues representation.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--issues", type=int, default=NUMBER_OF_ISSUES, help="Number of issues."
+    )
+    args = parser.parse_args()
+
+    # The API response is parsed before the representation is built,
+    # so it is not part of the measurement.
+    issues = list(synthetic_issues(args.issues))
+
+    for name, build in (("tuples", tuples), ("records", records)):
+        current, peak = measure(build, issues)
+        print(
+            f"{name:8} {args.issues} issues: {current / 1024 / 1024:8.1f} MiB retained"
+            f" ({current / args.issues:6.0f} B/issue), peak {peak / 1024 / 1024:8.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,22 +13,11 @@ Optimizations:
   * Only simple words are considered in ref/branch name, using `\w+`  # noqa: W605
 """
 
-from git import Repo
 import argparse
 import os
 import re
 import sys
 
-parser = argparse.ArgumentParser(
-    description="Check ref of included .gitlab-ci.yml files.",
-    epilog="python check_included_ci_ref.py <path_to_gitlab_ci_file>",
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-)
-# parser.add_argument('-f', '--file', default="./.gitlab-ci.yml", help='Path to .gitlab-ci yml file.')
-parser.add_argument("filenames", nargs="*", help="Filenames to check.")
-args = parser.parse_args()
-
-
 # Make 'flake8' ignore [W605 invalid escape sequence] - escape sequence necessary for regular expression.
 REF_LINE = re.compile("^[ ]*ref:[ ] *(\w+)")  # noqa: W605
 
@@ -66,6 +55,9 @@ def check_included_refs(filenames):
             print(f"Is this the correct file: {filename}")
             continue
         base_path = os.path.dirname(filename)
+        # Imported here, 'GitPython' takes longer to import than the check.
+        from git import Repo
+
         # Get current branch
         repo = Repo(base_path)
         branch = repo.active_branch.name
@@ -97,5 +89,18 @@ def check_included_refs(filenames):
     return retv
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check ref of included .gitlab-ci.yml files.",
+        epilog="python check_included_ci_ref.py <path_to_gitlab_ci_file>",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    # parser.add_argument('-f', '--file', default="./.gitlab-ci.yml", help='Path to .gitlab-ci yml file.')
+    parser.add_argument("filenames", nargs="*", help="Filenames to check.")
+    args = parser.parse_args(argv)
+
+    return check_included_refs(filenames=args.filenames)
+
+
 if __name__ == "__main__":
-    sys.exit(check_included_refs(filenames=args.filenames))
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+A deadline for the API requests of a script, and their timeouts.
+
+'--deadline SECONDS' bounds the run time of a script, e.g. of a scheduled job:
+  * no request is sent after the deadline, 'gitlab_client.GitlabClient'
+    raises 'DeadlineExceeded' instead, a 'requests.Timeout' the scripts
+    already report per project or MR,
+  * the timeouts of the requests and the delays of their retries end at the
+    deadline, a hung connection cannot outlive it,
+  * the scripts stop waiting for outstanding work at the deadline and emit
+    the results completed until then.
+'within' sets an earlier deadline for the requests of one thread, e.g. of
+one project of a script.
+'--connect-timeout' and '--read-timeout' set the timeouts of every request.
+Nothing is limited when not given.
+"""
+
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from requests.exceptions import Timeout
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection and for a response.
+CONNECT_TIMEOUT_DEFAULT = 10
+READ_TIMEOUT_DEFAULT = 60
+
+# Deadline of the running process, 'time.monotonic()', see 'enable'.
+_deadline = None
+# Timeout of the requests of the running process, see 'set_timeout'.
+_timeout = None
+# Deadlines of single threads, see 'within'.
+_local = threading.local()
+# Requests not sent, because the deadline passed.
+_cancelled = 0
+
+
+class DeadlineExceeded(Timeout):
+    """The deadline passed, the request was not sent."""
+
+
+def enable(seconds):
+    """Stop sending requests 'seconds' from now."""
+    global _deadline
+    _deadline = time.monotonic() + seconds
+    return _deadline
+
+
+def set_timeout(timeout):
+    """Use 'timeout', (connect, read) or one for both, in all clients created from now on."""
+    global _timeout
+    _timeout = timeout
+
+
+def get_timeout():
+    """Return the timeout of the requests of the process, None if not set."""
+    return _timeout
+
+
+@contextmanager
+def within(seconds):
+    """Stop sending requests of the current thread 'seconds' from now.
+
+    The deadline of the process still applies, if it is earlier.
+    """
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = time.monotonic() + seconds
+    if previous is not None:
+        _local.deadline = min(previous, _local.deadline)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def _get_deadline():
+    deadlines = [
+        value
+        for value in (_deadline, getattr(_local, "deadline", None))
+        if value is not None
+    ]
+    return min(deadlines) if deadlines else None
+
+
+def remaining():
+    """Return the seconds left until the deadline, None without deadline."""
+    deadline = _get_deadline()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired():
+    """Return whether the deadline passed."""
+    deadline = _get_deadline()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def cancel(what="Request"):
+    """Raise 'DeadlineExceeded' for 'what', counted as not sent."""
+    global _cancelled
+    _cancelled += 1
+    raise DeadlineExceeded(f"{what} cancelled, the deadline passed.")
+
+
+def limit(timeout, what="Request"):
+    """Return 'timeout', (connect, read) or one for both, ending at the deadline at the latest.
+
+    Raises 'DeadlineExceeded' if the deadline passed.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        cancel(what)
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(left if part is None else min(part, left) for part in timeout)
+    return min(timeout, left)
+
+
+def add_arguments(parser):
+    """Add '--deadline', '--connect-timeout' and '--read-timeout' to an 'argparse' parser."""
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Stop sending requests after this many seconds, the results completed until then are emitted.",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=f"Seconds to wait for a connection to gitlab, {CONNECT_TIMEOUT_DEFAULT} if not given.",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help=f"Seconds to wait for a response of gitlab, {READ_TIMEOUT_DEFAULT} if not given.",
+    )
+    return parser
+
+
+def setup(args):
+    """Set the deadline and the timeouts, if given by the parsed arguments.
+
+    If the deadline passed, the number of requests not sent is logged when
+    the script exits.
+    """
+    if args.connect_timeout or args.read_timeout:
+        set_timeout(
+            (
+                args.connect_timeout or CONNECT_TIMEOUT_DEFAULT,
+                args.read_timeout or READ_TIMEOUT_DEFAULT,
+            )
+        )
+    if args.deadline is None:
+        return None
+    atexit.register(_report, args.deadline)
+    return enable(args.deadline)
+
+
+def _report(seconds):
+    if _cancelled:
+        logger.warning(
+            f"Deadline of {seconds}s passed, {_cancelled} requests were not sent."
+        )
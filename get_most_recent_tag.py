@@ -22,23 +22,57 @@ How to:
     - returns the last 5 tags.
     - The number of tags returned can be modified with '--amount'
     - '--amount -1' returns all tags found for the project.
+* '--inventory <file>' keeps the projects of the group and their tags in a file,
+  only the tags of projects with activity since the last run are fetched again.
+* '--backend git' lists the tags with 'git ls-remote', '--jobs' repositories at
+  the same time, instead of the API.
+    - The tags are ordered like versions, the API orders them by their commit.
+    - The repositories are those of the projects ('http_url_to_repo'), or
+      given as template, e.g. '--git-url git@<gitlab_host>:{path_with_namespace}.git'
+      or '--git-url file:///srv/git/{path_with_namespace}.git'.
+* '--search v1.' only returns tags containing 'v1.', '^v1.' tags starting
+  with it, 'v1.$' tags ending with it, filtered by gitlab.
+* '--pattern <regex>' only returns tags matching the regular expression,
+  filtered by the script.
+* '--order-by name|updated|version' and '--sort asc|desc' order the tags, by
+  gitlab if it can, otherwise (e.g. 'version' before gitlab 15.4) all tags are
+  fetched and sorted by the script.
 """
 
-
 import os
+import re
 from collections import defaultdict
 import sys
 import json
 import logging
-from threading import Thread
 from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import quote_plus
 
-import requests
-from requests.exceptions import (
-    ConnectionError as RequestsConnectionError,
-    ReadTimeout,
-    Timeout,
+from requests.exceptions import RequestException
+
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from deadline import DeadlineExceeded
+from project_inventory import ProjectInventory, FULL_REFRESH_DEFAULT, MAX_AGE_DEFAULT
+from git_tags import (
+    GitError,
+    ls_remote_tags,
+    get_environment,
+    get_version_key,
+    JOBS_DEFAULT,
+    TIMEOUT_DEFAULT as GIT_TIMEOUT_DEFAULT,
+)
+from gitlab_client import (
+    GitlabClient,
+    GitlabError,
+    GROUP_ENDPOINT,
+    PROJECT_ENDPOINT,
+    PROJECT_TAGS_ENDPOINT,
+    PER_PAGE_DEFAULT,
+    POOL_SIZE_DEFAULT,
 )
 
 logging.basicConfig()
@@ -50,16 +84,124 @@ GROUP_ID = os.environ.get("GITLAB_GROUP_ID", None)
 PROJECT_ID = os.environ.get("PROJECT_GROUP_ID", None)
 URL = os.environ.get("GITLAB_URL", None)
 
-GITHUB_API_ENDPOINT = "/api/v4"
-ISSUES_ENDPOINT = "/issues"
-PROJECT_ENDPOINT = "/projects" + "/{project_id}"
-GROUP_ENDPOINT = "/groups" + "/{group_id}"
-TAGS_ENDPOINT = "/repository/tags"
-PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{TAGS_ENDPOINT}"
-
 projects_tags_queue = Queue()
 
 NUMBER_OF_TAGS_TO_SHOW = 5
+BACKENDS = ("api", "git")
+ORDERS = ("name", "updated", "version")
+SORTS = ("asc", "desc")
+# Projects whose tags are fetched from the API at the same time, as many as
+# the client has connections.
+WORKERS_DEFAULT = POOL_SIZE_DEFAULT
+# Orders of the tags the gitlab servers rejected, {(url, order_by)}.
+# 'version' is known since gitlab 15.4.
+unsupported_orders = set()
+
+
+def get_commit_date(tag):
+    """Date of the commit of a tag of the API, gitlab orders 'updated' by it."""
+    commit = tag.get("commit", None) or {}
+    return commit.get("committed_date", None) or commit.get("created_at", None) or ""
+
+
+# Sort keys of tags of the API, or of 'git ls-remote' ({"name": name}).
+TAG_SORT_KEYS = {
+    "name": lambda tag: tag["name"],
+    "updated": get_commit_date,
+    "version": lambda tag: get_version_key(tag["name"]),
+}
+
+
+def compile_search(search):
+    """Return a regex matching tag names like the 'search' of the tags API.
+
+    '^term' matches the tags starting with 'term', 'term$' those ending with
+    it, otherwise those containing it, ignoring case.
+    """
+    term = search
+    start = end = ""
+    if term.startswith("^"):
+        start, term = "^", term[1:]
+    if term.endswith("$"):
+        end, term = "$", term[:-1]
+    return re.compile(start + re.escape(term) + end, re.IGNORECASE)
+
+
+def get_matcher(search="", pattern=None):
+    """Return a function telling whether a tag name matches 'search' and 'pattern'.
+
+    :param search: Search of the tags API, see 'compile_search'.
+    :param pattern: Compiled regex, searched in the tag names.
+    """
+    regexes = [regex for regex in (search and compile_search(search), pattern) if regex]
+    return lambda name: all(regex.search(name) for regex in regexes)
+
+
+def list_tags(
+    client,
+    project_id,
+    search="",
+    pattern=None,
+    order_by="updated",
+    sort="desc",
+    limit=-1,
+):
+    """Return the tags of a project, at most 'limit', all if -1.
+
+    'search', 'order_by' and 'sort' are sent to the tags API, only the pages
+    holding the shown tags are fetched. Tags are matched again here, for
+    servers ignoring 'search'. Servers rejecting 'order_by' send all tags,
+    they are sorted here.
+
+    :param pattern: Compiled regex the tag names have to match, not known to
+        the API.
+    Raises 'GitlabError' if a page cannot be fetched.
+    """
+    project_endpoint = PROJECT_TAGS_ENDPOINT.format(
+        project_id=quote_plus(str(project_id))
+    )
+    logger.debug(client.get_url(project_endpoint))
+    matches = get_matcher(search=search, pattern=pattern)
+    params = {}
+    if search:
+        params["search"] = search
+    sort_here = (client.url, order_by) in unsupported_orders
+    if not sort_here:
+        params.update({"order_by": order_by, "sort": sort})
+
+    per_page = PER_PAGE_DEFAULT
+    if limit > 0 and not sort_here and pattern is None:
+        per_page = min(limit, PER_PAGE_DEFAULT)
+    tags = []
+    try:
+        for tag in client.paginate(project_endpoint, params=params, per_page=per_page):
+            if not matches(tag.get("name", "")):
+                continue
+            tags.append(tag)
+            if not sort_here and len(tags) == limit:
+                break
+    except GitlabError as e:
+        if sort_here or e.response.status_code != 400:
+            raise
+        logger.info(
+            f"'{client.url}' cannot order tags by '{order_by}', they are sorted here."
+        )
+        unsupported_orders.add((client.url, order_by))
+        return list_tags(
+            client,
+            project_id,
+            search=search,
+            pattern=pattern,
+            order_by=order_by,
+            sort=sort,
+            limit=limit,
+        )
+
+    if sort_here:
+        tags.sort(key=TAG_SORT_KEYS[order_by], reverse=sort == "desc")
+    if limit > 0:
+        tags = tags[:limit]
+    return tags
 
 
 def get_tags(
@@ -68,46 +210,160 @@ def get_tags(
     headers=None,
     latest_only=False,
     number_of_tags=NUMBER_OF_TAGS_TO_SHOW,
+    client=None,
+    tags_queue=projects_tags_queue,
+    search="",
+    pattern=None,
+    order_by="updated",
+    sort="desc",
 ):
     """Get tags from a repository.
 
     The API request returns an ordered list of tags.
     The most recent tag is the first one in the list.
+    Only the pages holding the shown tags are fetched.
 
     :param latest_only: Only return the most recent tag.
     :param number_of_tags: Number of tags to show. Not considered with 'latest_only'.
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    :param tags_queue: Queue to put the tags of the project into.
+    :param search: Only tags matching it, see 'list_tags'.
+    :param pattern: Only tags matching this compiled regex.
+    :param order_by: 'name', 'updated' or 'version'.
+    :param sort: 'asc' or 'desc'.
+    Raises 'gitlab_client.GitlabError' if the tags cannot be listed.
     """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
 
     project_id = project.get("id", None)
     project_name = project.get("name", None)
     logger.debug(project)
-    project_endpoint = PROJECT_TAGS_ENDPOINT.format(
-        project_id=quote_plus(str(project_id))
-    )
-    logger.debug(url + project_endpoint)
-    response = requests.get(url + project_endpoint, headers=headers)
-    if not response.status_code == 200:
+    project_tags = defaultdict(list)
+    try:
+        for tag in list_tags(
+            client,
+            project_id,
+            search=search,
+            pattern=pattern,
+            order_by=order_by,
+            sort=sort,
+            limit=1 if latest_only else number_of_tags,
+        ):
+            project_tags[project_name].append(tag.get("name", None))
+    except GitlabError as e:
+        response = e.response
         print(
             f"Project '{project_name}' received status code '{response.status_code}' with '{response.text}'."
         )
-        sys.exit(1)
-    tags = response.json()
-    project_tags = defaultdict(list)
-    count = 0
-    for tag in tags:
-        project_tags[project_name].append(tag.get("name", None))
-        if latest_only:
-            break
-        else:
-            count += 1
-            if number_of_tags > 0 and number_of_tags - count == 0:
-                break
+        raise
+    except RequestException as e:
+        # E.g. the deadline passed, the tags of the other projects are shown.
+        print(f"Project '{project_name}' failed: '{str(e)}'.")
+        return
 
-    projects_tags_queue.put(project_tags)
+    tags_queue.put(project_tags)
 
     return latest_only
 
 
+def get_repository_url(project, git_url="", url=URL):
+    """Return the url of the repository of a project.
+
+    :param git_url: Template formatted with the project, e.g.
+        'file:///srv/git/{path_with_namespace}.git'. If empty, the
+        'http_url_to_repo' of the project.
+    """
+    if git_url:
+        return git_url.format(**project)
+    if project.get("http_url_to_repo", None):
+        return project["http_url_to_repo"]
+    return f"{url}/{project['path_with_namespace']}.git"
+
+
+def get_git_tags(
+    project=None,
+    latest_only=False,
+    number_of_tags=NUMBER_OF_TAGS_TO_SHOW,
+    url=URL,
+    git_url="",
+    environment=None,
+    tags_queue=projects_tags_queue,
+    search="",
+    pattern=None,
+    order_by="version",
+    sort="desc",
+):
+    """Get tags from a repository with 'git ls-remote', like 'get_tags'.
+
+    The tags are ordered like versions, the most recent first, by default.
+    'git ls-remote' knows no dates, 'order_by' is 'name' or 'version'.
+
+    :param url: Gitlab url, the repository url is derived from, if the
+        project has none.
+    :param git_url: Template of the repository url, see 'get_repository_url'.
+    :param environment: Environment of git, see 'git_tags.get_environment'.
+    """
+    project_name = project.get("name", None)
+    try:
+        repository_url = get_repository_url(project, git_url=git_url, url=url)
+        tags = ls_remote_tags(
+            repository_url,
+            environment=environment,
+            timeout=deadline.limit(GIT_TIMEOUT_DEFAULT, what="'git ls-remote'"),
+        )
+    except KeyError as e:
+        print(f"Project '{project_name}' has no {str(e)} for '{git_url}'.")
+        return
+    except (GitError, DeadlineExceeded) as e:
+        print(f"Project '{project_name}' failed: {str(e)}")
+        return
+
+    matches = get_matcher(search=search, pattern=pattern)
+    names = sorted(
+        (name for name in tags if matches(name)),
+        key=lambda name: TAG_SORT_KEYS[order_by]({"name": name}),
+        reverse=sort == "desc",
+    )
+    if latest_only:
+        names = names[:1]
+    elif number_of_tags > 0:
+        names = names[:number_of_tags]
+    project_tags = defaultdict(list)
+    for name in names:
+        project_tags[project_name].append(name)
+    tags_queue.put(project_tags)
+
+
+def get_inventory_tags(
+    project=None,
+    inventory=None,
+    name="",
+    get=get_tags,
+    tags_queue=projects_tags_queue,
+    **kwargs,
+):
+    """Get the tags of a project from 'inventory', if it had no activity since they were stored.
+
+    Otherwise they are fetched with 'get' and stored.
+
+    :param inventory: 'project_inventory.ProjectInventory' holding the project.
+    :param name: Name of the stored tags, differs per 'get' arguments.
+    :param get: 'get_tags' or 'get_git_tags'.
+    """
+    project_tags = inventory.get_result(project, name)
+    if project_tags is None:
+        project_queue = Queue()
+        get(project=project, tags_queue=project_queue, **kwargs)
+        if project_queue.empty():
+            # Failed, nothing to store.
+            return
+        project_tags = project_queue.get()
+        inventory.put_result(project, name, project_tags)
+    tags_queue.put(project_tags)
+
+
 def get_group_tags(
     url=URL,
     group_id=GROUP_ID,
@@ -115,75 +371,160 @@ def get_group_tags(
     headers=None,
     latest_only=False,
     number_of_tags=NUMBER_OF_TAGS_TO_SHOW,
+    client=None,
+    inventory=None,
+    backend="api",
+    git_url="",
+    jobs=JOBS_DEFAULT,
+    search="",
+    pattern=None,
+    order_by="",
+    sort="desc",
+    errors=None,
 ):
-    url = url + GITHUB_API_ENDPOINT
+    """
+    The tags of 'WORKERS_DEFAULT' projects are fetched at the same time, of
+    'jobs' projects with 'git'.
+
+    :param inventory: 'project_inventory.ProjectInventory' to list the projects
+        of the group with and to keep their tags in.
+    :param backend: 'api' or 'git', to list the tags with 'git ls-remote'.
+    :param git_url: Template of the repository urls, see 'get_repository_url'.
+    :param jobs: Number of 'git ls-remote' running at the same time.
+    :param search: Only tags matching it, like the 'search' of the tags API,
+        e.g. '^v1.'.
+    :param pattern: Only tags matching this compiled regex.
+    :param order_by: 'name', 'updated' or 'version', 'updated' for the API
+        and 'version' for git if not given.
+    :param sort: 'asc' or 'desc'.
+    :param errors: List to append the 'gitlab_client.GitlabError' of the
+        projects whose tags cannot be listed to.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers, pool_size=WORKERS_DEFAULT)
 
     if group_id:
         group_endpoint = (
             GROUP_ENDPOINT.format(group_id=quote_plus(str(group_id))) + "/projects"
         )
-        logger.debug(f"GROUP URL: {url+group_endpoint}")
+        logger.debug(f"GROUP URL: {client.get_url(group_endpoint)}")
     elif project_id:
         project_endpoint = PROJECT_TAGS_ENDPOINT.format(
             project_id=quote_plus(str(project_id))
         )
-        logger.debug(f"PROJECT URL: {url+project_endpoint}")
+        logger.debug(f"PROJECT URL: {client.get_url(project_endpoint)}")
 
-    response = None
     projects = []
     if group_id:
         try:
-            response = requests.get(url + f"{group_endpoint}", headers=headers)
-            projects = response.json()
-            if not response.status_code == 200:
-                print(
-                    f"Received status code {response.status_code} with {response.text}"
-                )
-                sys.exit(1)
-        except (RequestsConnectionError, ReadTimeout, Timeout) as e:
+            if inventory is None:
+                projects = list(client.paginate(group_endpoint))
+            else:
+                projects = inventory.refresh(client, group_id)
+        except GitlabError as e:
+            print(
+                f"Received status code {e.response.status_code} with {e.response.text}"
+            )
+            sys.exit(1)
+        except RequestException as e:
             # TODO Add logging.
             # TODO Add error key and message.
             print(f"Some error occurred: '{str(e)}'.")
+    elif project_id and backend == "git":
+        # The repository url of the project.
+        response = client.get(
+            PROJECT_ENDPOINT.format(project_id=quote_plus(str(project_id)))
+        )
+        if response.status_code != 200:
+            print(f"Received status code {response.status_code} with {response.text}")
+            sys.exit(1)
+        projects = [{**response.json(), "name": project_id}]
     elif project_id:
-        projects = [{"id": project_id, "name": project_id,}]
-
-    threads = []
-
-    for project in projects:
-        # if not latest_only:
-        thread = Thread(
-            target=get_tags,
-            kwargs={
-                "url": url,
-                "project": project,
-                "headers": headers,
-                "latest_only": latest_only,
-                "number_of_tags": number_of_tags,
-            },
+        projects = [
+            {
+                "id": project_id,
+                "name": project_id,
+            }
+        ]
+
+    # One queue per call, calls can run at the same time, e.g. in 'gitlab_daemon'.
+    tags_queue = Queue()
+
+    get = get_tags
+    name = "tags"
+    kwargs = {"client": client}
+    if backend == "git":
+        get = get_git_tags
+        name = "git-tags"
+        kwargs = {
+            "url": client.url,
+            "git_url": git_url,
+            "environment": get_environment(
+                client.headers.get("PRIVATE-TOKEN", None), url=client.url
+            ),
+        }
+    order_by = order_by or ("version" if backend == "git" else "updated")
+    kwargs.update(
+        {"search": search, "pattern": pattern, "order_by": order_by, "sort": sort}
+    )
+    target = get
+    if inventory is not None and group_id:
+        target = get_inventory_tags
+        name = f"{name}:latest" if latest_only else f"{name}:{number_of_tags}"
+        if search or pattern or (order_by, sort) != ("updated", "desc"):
+            name += f":{order_by}:{sort}:{search}:{pattern.pattern if pattern else ''}"
+        kwargs.update({"inventory": inventory, "name": name, "get": get})
+
+    # At most 'jobs' 'git ls-remote' processes, or one request per connection
+    # of the client, at once.
+    workers = jobs if backend == "git" else WORKERS_DEFAULT
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = [
+        executor.submit(
+            target,
+            project=project,
+            latest_only=latest_only,
+            number_of_tags=number_of_tags,
+            tags_queue=tags_queue,
+            **kwargs,
         )
-        thread.daemon = True
-        thread.start()
-        threads.append(thread)
-
-    for thread in threads:
-        thread.join()  # wait for end of threads
+        for project in projects
+    ]
+    # Wait for the projects, until the deadline at most.
+    _, unfinished = wait(futures, timeout=deadline.remaining())
+    for future in unfinished:
+        future.cancel()
+    executor.shutdown(wait=False)
+    if unfinished:
+        logger.warning(
+            f"Deadline passed, the tags of {len(unfinished)} projects are missing."
+        )
+    for future in futures:
+        if future in unfinished:
+            continue
+        try:
+            future.result()
+        except GitlabError as e:
+            # Already reported by 'get_tags'.
+            if errors is not None:
+                errors.append(e)
 
     projects_tags = defaultdict(list)
-    while not projects_tags_queue.empty():
+    while not tags_queue.empty():
         # project_tags = projects_tags_queue.get()
         # projects_tags[next(iter(project_tags))] = project[next(iter(project_tags))]
-        project_tags = projects_tags_queue.get()
+        project_tags = tags_queue.get()
         if not projects_tags:
             projects_tags = project_tags
         else:
             projects_tags.update(project_tags)
-        projects_tags_queue.task_done()
+        tags_queue.task_done()
 
     return projects_tags
     # return sorted(projects_tags.items())
 
 
-def main():
+def main(argv=None):
     import argparse
 
     parser = argparse.ArgumentParser(
@@ -217,9 +558,80 @@ def main():
     parser.add_argument(
         "-l", "--latest", action="store_true", help="Show most recent tag only."
     )
+    parser.add_argument(
+        "--search",
+        default="",
+        help="Only tags matching it, filtered by gitlab: 'term' contained, '^term' at the start, 'term$' at the end.",
+    )
+    parser.add_argument(
+        "--pattern",
+        default="",
+        help="Only tags matching this regular expression, filtered here, e.g. '^v[0-9]+\\.[0-9]+\\.[0-9]+$'.",
+    )
+    parser.add_argument(
+        "--order-by",
+        choices=ORDERS,
+        default="",
+        help="Order of the tags, sorted by gitlab if it can. 'updated' for the API and 'version' for git if not given.",
+    )
+    parser.add_argument(
+        "--sort", choices=SORTS, default="desc", help="Sort order of the tags."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="api",
+        help="List the tags with the API or with 'git ls-remote', ordered like versions.",
+    )
+    parser.add_argument(
+        "--git-url",
+        default="",
+        help="Template of the repository urls for '--backend git', e.g. 'git@<gitlab_host>:{path_with_namespace}.git'."
+        " The 'http_url_to_repo' of the projects if not given.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=JOBS_DEFAULT,
+        help="Number of 'git ls-remote' running at the same time.",
+    )
+    parser.add_argument(
+        "--inventory",
+        default="",
+        help="JSON file keeping the projects of the group and their tags, only tags of changed projects are fetched.",
+    )
+    parser.add_argument(
+        "--inventory-full-refresh",
+        type=int,
+        default=FULL_REFRESH_DEFAULT,
+        help="Seconds after which all projects of the inventory are listed again.",
+    )
+    parser.add_argument(
+        "--inventory-max-age",
+        type=int,
+        default=MAX_AGE_DEFAULT,
+        help="Seconds after which the results of the inventory are fetched again, also of projects without activity.",
+    )
     parser.add_argument("--debug", action="store_true", help="Show debug info.")
 
-    args = parser.parse_args()
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
+
+    if args.backend == "git" and args.order_by == "updated":
+        parser.error("'--order-by updated' needs '--backend api', git knows no dates.")
+    pattern = None
+    if args.pattern:
+        try:
+            pattern = re.compile(args.pattern)
+        except re.error as e:
+            parser.error(f"Invalid '--pattern': '{str(e)}'.")
 
     debug = args.debug
     if debug:
@@ -237,8 +649,17 @@ def main():
     number_of_tags = args.amount
 
     headers = {"PRIVATE-TOKEN": private_token}
+    inventory = None
+    if args.inventory:
+        inventory = ProjectInventory(
+            args.inventory,
+            url,
+            full_refresh=args.inventory_full_refresh,
+            max_age=args.inventory_max_age,
+        )
 
     tags = {}
+    errors = []
     if group_id:
         tags = get_group_tags(
             url=url,
@@ -246,7 +667,22 @@ def main():
             headers=headers,
             latest_only=latest_only,
             number_of_tags=number_of_tags,
+            inventory=inventory,
+            backend=args.backend,
+            git_url=args.git_url,
+            jobs=args.jobs,
+            search=args.search,
+            pattern=pattern,
+            order_by=args.order_by,
+            sort=args.sort,
+            errors=errors,
         )
+        if inventory:
+            inventory.save()
+            logger.info(
+                f"Inventory: {inventory.hits} projects unchanged, {inventory.misses} fetched,"
+                f" hit rate {inventory.hit_rate:.0%}."
+            )
     elif project_id:
         tags = get_group_tags(
             url=url,
@@ -254,9 +690,18 @@ def main():
             headers=headers,
             latest_only=latest_only,
             number_of_tags=number_of_tags,
+            backend=args.backend,
+            git_url=args.git_url,
+            jobs=args.jobs,
+            search=args.search,
+            pattern=pattern,
+            order_by=args.order_by,
+            sort=args.sort,
+            errors=errors,
         )
 
     print(json.dumps(tags, indent=2))
+    return 1 if errors else 0
 
 
 if __name__ == "__main__":
@@ -19,6 +19,8 @@ import json
 from threading import Thread
 from queue import Queue
 
+import profiling
+
 PATHS = os.environ.get("TERRAFORM_PATHS", [])
 
 ALLOWED_FILE_EXTENSIONS = [".tf"]
@@ -89,7 +91,7 @@ def get_tf_module_version(paths=PATHS):
     return sorted(modules_tags.items())
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="Get terraform source module versions.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -97,7 +99,9 @@ def main():
     parser.add_argument(
         "-p", "--paths", required=True, nargs="+", help="Directories/files to check."
     )
-    args = parser.parse_args()
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    profiling.setup(args)
 
     paths = args.paths
 
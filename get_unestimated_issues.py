@@ -1,9 +1,3 @@
-import requests
-import os
-import argparse
-from collections import defaultdict
-import sys
-
 """
 Goal:
   * Get unestimated issue over all gitlab projects assigned to a specific user
@@ -19,99 +13,212 @@ How to:
   * If the Private Token is set both ways, GITLAB_PRIVATE_TOKEN has precedence.
   * The user can be given as argument (-u, --user)
   * The url can be given as argument (-l, --url)
-
-Optimizations:
-  * Implement pagination and make sure to get ALL the projects and issues.
+  * The output format can be given as argument (-f, --format)
+    - table (default), csv or ndjson
 """
 
+import os
+import sys
+import csv
+import json
+
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient, GitlabError, USERS_ENDPOINT, ISSUES_ENDPOINT
 
 PRIVATE_TOKEN = os.environ.get("GITLAB_PRIVATE_TOKEN", None)
 
-GITHUB_API_ENDPOINT = "/api/v4"
-USERS_ENDPOINT = "/users"
-ISSUES_ENDPOINT = "/issues"
-
-parser = argparse.ArgumentParser(
-    description="Get unestimated gitlab issues for a user.",
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter,
-)
-parser.add_argument(
-    "-l",
-    "--url",
-    required=True,
-    default="https://example.gitlab.com",
-    help="Gitlab host/url/server.",
-)
-parser.add_argument(
-    "-t",
-    "--token",
-    nargs="?",
-    help="Private Token to access gitlab API. If not given as argument, set GITLAB_PRIVATE_TOKEN.",
-)
-parser.add_argument(
-    "-u", "--user", required=True, help="Gitlab username to get information for."
-)
-args = parser.parse_args()
-
-if not PRIVATE_TOKEN:
-    PRIVATE_TOKEN = args.token
-USER = args.user
-URL = args.url + GITHUB_API_ENDPOINT
-
-headers = {"PRIVATE-TOKEN": PRIVATE_TOKEN}
-
-
-def get_unestimated_issues():
+OUTPUT_FORMATS = ("table", "csv", "ndjson")
+OUTPUT_FORMAT_DEFAULT = "table"
+
+
+class UnestimatedIssue:
+    """One row of the unestimated issues result.
+
+    Values are kept as received from the API and only formatted when
+    written, so large result sets stay small and can be sorted or
+    filtered on the raw values.
+    """
+
+    __slots__ = (
+        "id",
+        "project_id",
+        "title",
+        "web_url",
+        "labels",
+        "time_estimate",
+        "total_time_spent",
+    )
+
+    # (column name, attribute) in output order, the id is written separately.
+    COLUMNS = (
+        ("project_id", "project_id"),
+        ("title", "title"),
+        ("web_url", "web_url"),
+        ("labels", "labels"),
+        ("time estimated [seconds]", "time_estimate"),
+        ("total_time_spent [seconds]", "total_time_spent"),
+    )
+
+    def __init__(
+        self,
+        id=None,
+        project_id=None,
+        title=None,
+        web_url=None,
+        labels=(),
+        time_estimate=None,
+        total_time_spent=None,
+    ):
+        self.id = id
+        self.project_id = project_id
+        self.title = title
+        self.web_url = web_url
+        self.labels = labels
+        self.time_estimate = time_estimate
+        self.total_time_spent = total_time_spent
+
+    @classmethod
+    def from_issue(cls, issue, timestats):
+        return cls(
+            id=issue.get("id", None),
+            project_id=issue.get("project_id", None),
+            title=issue.get("title", None),
+            web_url=issue.get("web_url", None),
+            labels=tuple(issue.get("labels", None) or ()),
+            time_estimate=timestats.get("time_estimate", None),
+            total_time_spent=timestats.get("total_time_spent", None),
+        )
+
+    def as_dict(self):
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__}
+
+    def formatted(self):
+        """Return (column name, value as string) pairs for text output."""
+        values = []
+        for column, attribute in self.COLUMNS:
+            value = getattr(self, attribute)
+            if attribute == "labels":
+                values.append((column, ", ".join(value)))
+            elif attribute == "title":
+                values.append((column, value))
+            else:
+                values.append((column, str(value)))
+        return values
+
+
+def get_unestimated_issues(url=None, user=None, headers=None, client=None):
+    """Yield the unestimated open issues assigned to 'user', all pages.
+
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+
     # get gitlab user id
-    response = requests.get(URL + f"{USERS_ENDPOINT}?username={USER}", headers=headers)
+    response = client.get(f"{USERS_ENDPOINT}?username={user}")
     if not response.status_code == 200:
         print(f"Received status code {response.status_code} with {response.text}")
-        sys.exit
+        sys.exit(1)
     user_id = response.json()[0].get("id", None)
 
     # get all users' issues
-    response = requests.get(
-        URL
-        + f"{ISSUES_ENDPOINT}?scope=assigned_to_me&assignee_id={user_id}&state=opened",
-        headers=headers,
+    issues = client.paginate(
+        ISSUES_ENDPOINT,
+        params={"scope": "assigned_to_me", "assignee_id": user_id, "state": "opened"},
     )
-    if not response.status_code == 200:
-        print(f"Received status code {response.status_code} with {response.text}")
-        sys.exit
-    issues = response.json()
-    issues_not_estimated = defaultdict(list)
+    try:
+        for issue in issues:
+            timestats = issue.get("time_stats", None)
+            # only collect unestimated issues
+            if timestats and not timestats.get("time_estimate", None):
+                yield UnestimatedIssue.from_issue(issue, timestats)
+    except GitlabError as e:
+        print(f"Received status code {e.response.status_code} with {e.response.text}")
+        sys.exit(1)
+
+
+def write_table(issues, out=sys.stdout):
+    for issue in issues:
+        out.write(f"{issue.id}\n")
+        out.write(
+            "  "
+            + "\n  ".join(column + ": " + value for column, value in issue.formatted())
+            + "\n"
+        )
+
+
+def write_csv(issues, out=sys.stdout):
+    writer = csv.writer(out)
+    writer.writerow(["id"] + [column for column, _ in UnestimatedIssue.COLUMNS])
     for issue in issues:
-        timestats = issue.get("time_stats", None)
-        if timestats:
-            estimated = timestats.get("time_estimate", None)
-            # only collect unestimated issues, add some information
-            if not estimated:
-                issues_not_estimated[issue.get("id", None)].append(
-                    ("project_id", str(issue.get("project_id", None)))
-                )
-                issues_not_estimated[issue.get("id", None)].append(
-                    ("title", issue.get("title", None))
-                )
-                issues_not_estimated[issue.get("id", None)].append(
-                    ("web_url", issue.get("web_url", None))
-                )
-                issues_not_estimated[issue.get("id", None)].append(
-                    ("labels", ", ".join(issue.get("labels", None)))
-                )
-                issues_not_estimated[issue.get("id", None)].append(
-                    ("time estimated [seconds]", str(estimated))
-                )
-                issues_not_estimated[issue.get("id", None)].append(
-                    (
-                        "total_time_spent [seconds]",
-                        str(timestats.get("total_time_spent", None)),
-                    )
-                )
-    return issues_not_estimated
+        writer.writerow([issue.id] + [value for _, value in issue.formatted()])
+
+
+def write_ndjson(issues, out=sys.stdout):
+    for issue in issues:
+        out.write(json.dumps(issue.as_dict()) + "\n")
+
+
+WRITERS = {
+    "table": write_table,
+    "csv": write_csv,
+    "ndjson": write_ndjson,
+}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Get unestimated gitlab issues for a user.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-l",
+        "--url",
+        required=True,
+        default="https://example.gitlab.com",
+        help="Gitlab host/url/server.",
+    )
+    parser.add_argument(
+        "-t",
+        "--token",
+        nargs="?",
+        help="Private Token to access gitlab API. If not given as argument, set GITLAB_PRIVATE_TOKEN.",
+    )
+    parser.add_argument(
+        "-u", "--user", required=True, help="Gitlab username to get information for."
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default=OUTPUT_FORMAT_DEFAULT,
+        help="Output format.",
+    )
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
+
+    private_token = PRIVATE_TOKEN
+    if not private_token:
+        private_token = args.token
+
+    headers = {"PRIVATE-TOKEN": private_token}
+
+    issues = get_unestimated_issues(url=args.url, user=args.user, headers=headers)
+    WRITERS[args.format](issues)
 
 
 if __name__ == "__main__":
-    issues_not_estimated = get_unestimated_issues()
-    for k, v in issues_not_estimated.items():
-        print(k)
-        print("  " + "\n  ".join(t[0] + ": " + t[1] for t in v))
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Goal:
+  * List the tags of git repositories with 'git ls-remote --tags', one round
+    trip per repository over HTTP or SSH, without the gitlab API and its rate
+    limit.
+  * Annotated tags are peeled, every tag points to its commit.
+
+Attention:
+  * The private token is given to git in GIT_CONFIG_* environment variables
+    (git 2.31 or newer), not on the command line, and only sent to the
+    gitlab server.
+  * 'git ls-remote' does not know when tags were created, they are ordered
+    like versions, '1.10.0' before '1.9.0'.
+"""
+
+import os
+import re
+import base64
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Seconds one 'git ls-remote' may take.
+TIMEOUT_DEFAULT = 60
+# 'git ls-remote' running at the same time.
+JOBS_DEFAULT = 8
+TAGS_PREFIX = "refs/tags/"
+PEELED_SUFFIX = "^{}"
+
+
+class GitError(Exception):
+    """Git failed, the message holds its error."""
+
+
+def parse_tags(output):
+    """Return {tag: commit sha} from the output of 'git ls-remote --tags'.
+
+    Annotated tags are listed twice, the peeled line ('<tag>^{}') holds the
+    commit the tag points to.
+    """
+    tags = {}
+    for line in output.splitlines():
+        sha, _, ref = line.strip().partition("\t")
+        if not ref.startswith(TAGS_PREFIX):
+            continue
+        # Tags can contain '/'.
+        name = ref.split("/", 2)[2]
+        if name.endswith(PEELED_SUFFIX):
+            tags[name[: -len(PEELED_SUFFIX)]] = sha
+        else:
+            tags.setdefault(name, sha)
+    return tags
+
+
+def get_version_key(name):
+    """Sort key ordering tags like versions, '1.10.0' after '1.9.0'."""
+    return [
+        (0, int(part), "") if part.isdigit() else (1, 0, part)
+        for part in re.findall(r"\d+|\D+", name)
+    ]
+
+
+def get_environment(token=None, url=None):
+    """Return the environment to run git in, never asking for credentials.
+
+    :param token: Private token sent to the HTTP remotes of 'url'.
+    :param url: Gitlab host/url/server, the token is not sent to other
+        hosts, e.g. of '--git-url', redirects or submodules.
+    """
+    environment = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    environment.setdefault("GIT_SSH_COMMAND", "ssh -o BatchMode=yes")
+    if token and url:
+        credentials = base64.b64encode(f"oauth2:{token}".encode()).decode()
+        count = int(environment.get("GIT_CONFIG_COUNT", "") or 0)
+        environment["GIT_CONFIG_COUNT"] = str(count + 1)
+        environment[f"GIT_CONFIG_KEY_{count}"] = f"http.{url.rstrip('/')}/.extraHeader"
+        environment[f"GIT_CONFIG_VALUE_{count}"] = f"Authorization: Basic {credentials}"
+    return environment
+
+
+def ls_remote_tags(url, environment=None, timeout=TIMEOUT_DEFAULT):
+    """Return {tag: commit sha} of the repository at 'url'.
+
+    Raises 'GitError' if git fails or takes longer than 'timeout' seconds.
+    """
+    try:
+        process = subprocess.run(
+            ["git", "ls-remote", "--tags", url],
+            env=environment,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise GitError(f"'git ls-remote' of '{url}' took longer than {timeout}s.")
+    except OSError as e:
+        raise GitError(f"Cannot run git: '{str(e)}'.")
+    if process.returncode:
+        error = process.stderr.decode(errors="replace").strip()
+        raise GitError(f"'git ls-remote' of '{url}' failed with '{error}'.")
+    logger.debug(f"Listed the tags of '{url}'.")
+    return parse_tags(process.stdout.decode(errors="replace"))
@@ -0,0 +1,597 @@
+"""
+Shared client to talk to the gitlab API.
+
+All scripts send their requests through 'GitlabClient', which provides
+  * a pooled session, connections are reused,
+  * timeouts for every request, ending at the deadline of the script, if
+    set (see 'deadline'),
+  * retries with backoff for rate limited and temporarily failing requests,
+  * pagination over list endpoints,
+  * GraphQL queries ('GitlabClient.graphql'), see 'gitlab_graphql' to batch them,
+  * the error dicts returned by the scripts,
+  * metrics of the requests, if enabled (see 'instrumentation'),
+  * a rate limit shared by all processes using the same token, if enabled
+    (see 'rate_limit'),
+  * one request for concurrent identical GET requests ('SingleFlight'), the
+    response of lookups requested repeatedly is also reused for
+    'MEMO_TTL_DEFAULT' seconds,
+  * shared sessions and a cache of users, projects and tags, if enabled,
+    e.g. by the long running 'gitlab_daemon'.
+"""
+
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import (
+    ConnectionError as RequestsConnectionError,
+    ConnectTimeout,
+    Timeout,
+)
+from urllib3.exceptions import MaxRetryError, ConnectTimeoutError
+
+import deadline
+import instrumentation
+import rate_limit
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_ENDPOINT = "/api/v4"
+GRAPHQL_ENDPOINT = "/api/graphql"
+ISSUES_ENDPOINT = "/issues"
+USERS_ENDPOINT = "/users"
+PROJECT_ENDPOINT = "/projects" + "/{project_id}"
+GROUP_ENDPOINT = "/groups" + "/{group_id}"
+MR_ENDPOINT = "/merge_requests"
+TAGS_ENDPOINT = "/repository/tags"
+PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{TAGS_ENDPOINT}"
+PIPELINES_ENDPOINT = "/pipelines"
+
+POOL_SIZE_DEFAULT = 8
+PER_PAGE_DEFAULT = 100
+# Seconds to wait for a connection and for a response.
+TIMEOUT_DEFAULT = (deadline.CONNECT_TIMEOUT_DEFAULT, deadline.READ_TIMEOUT_DEFAULT)
+RETRIES_DEFAULT = 3
+# Seconds to wait before the first retry, doubled for every further retry.
+BACKOFF_DEFAULT = 0.5
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# Requests that can be sent again without creating anything twice.
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# Seconds a cached response is used.
+CACHE_TTL_DEFAULT = 60
+# Bytes of the response bodies a cache keeps at most, the oldest are dropped.
+CACHE_MAX_BYTES_DEFAULT = 64 * 1024 * 1024
+# Endpoints changing rarely, cached if enabled: users, projects, the projects
+# of groups and tags.
+CACHED_ENDPOINTS = re.compile(
+    r"^/(users(/[^/]+)?|projects(/[^/]+)?|groups/[^/]+/projects|projects/[^/]+/repository/tags)/?$"
+)
+# Seconds the response of a GET request is reused by identical requests,
+# sending anything else clears them.
+MEMO_TTL_DEFAULT = 1.0
+MEMO_MAX_BYTES_DEFAULT = 4 * 1024 * 1024
+# Lookups of single users, projects, groups and commits, memorized once
+# requested twice within 'MEMO_TTL_DEFAULT'. Lists are not, they are large and
+# fetched once.
+MEMO_ENDPOINTS = re.compile(
+    r"^/(users(/[^/]+)?|projects/[^/]+|groups/[^/]+|projects/[^/]+/repository/commits/[^/]+)/?$"
+)
+
+_sessions = None
+_sessions_lock = threading.Lock()
+_cache = None
+
+
+def get_session(pool_size=POOL_SIZE_DEFAULT, timed=False):
+    """Return a session keeping up to 'pool_size' connections per host open.
+
+    If sessions are shared, the same session is returned for the same
+    arguments, see 'share_sessions'.
+
+    :param timed: Time opening connections, see 'instrumentation'.
+    """
+    if _sessions is not None:
+        with _sessions_lock:
+            session = _sessions.get((pool_size, timed), None)
+            if session is None:
+                session = _sessions[(pool_size, timed)] = _new_session(pool_size, timed)
+        return session
+    return _new_session(pool_size, timed)
+
+
+def share_sessions():
+    """Share the sessions, and their open connections, between all clients created from now on."""
+    global _sessions
+    if _sessions is None:
+        _sessions = {}
+
+
+def _new_session(pool_size, timed):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    if timed:
+        instrumentation.time_connections(adapter)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_error(message, response=None, **fields):
+    """Return the error dict used in the results of all scripts."""
+    error = {"message": message}
+    if response is not None:
+        error["reason"] = (
+            f"Received status code {response.status_code} with {response.text}."
+        )
+    error.update(fields)
+    return error
+
+
+def is_connect_error(error):
+    """Return whether a request failed while connecting, before anything was sent.
+
+    Covers connect timeouts, refused connections and failed name
+    resolution, not connections dropped after the request was sent.
+    """
+    if isinstance(error, ConnectTimeout):
+        return True
+    if not isinstance(error, RequestsConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    # 'NewConnectionError' and 'NameResolutionError' are connect timeout errors.
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def get_request_key(url, params, headers):
+    """Return the key of a GET request, equal for requests getting the same response."""
+    params = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return url, params, tuple(sorted(headers.items()))
+
+
+class SingleFlight:
+    """Share one call between all concurrent callers with the same key.
+
+    Callers arriving while the call of the first caller is running wait for
+    it and get its result, or its exception.
+    Thread safe.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        # key: [done event, result, exception]
+        self._calls = {}
+
+    def do(self, key, function):
+        """Return '(result, shared)', 'shared' if another caller made the call."""
+        with self._lock:
+            call = self._calls.get(key, None)
+            first = call is None
+            if first:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+            else:
+                self.shared += 1
+        done, _, _ = call
+        if not first:
+            done.wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1], True
+
+        try:
+            call[1] = function()
+        except BaseException as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            done.set()
+        return call[1], False
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
+
+class ResponseCache:
+    """Keep the successful responses of GET requests to 'endpoints'.
+
+    Responses are kept for 'ttl' seconds per url, parameters and headers,
+    so clients with different tokens do not share responses.
+    At most 'max_bytes' of response bodies are kept, the oldest are dropped,
+    and only once requested 'min_requests' times within 'ttl'.
+    Thread safe.
+    """
+
+    def __init__(
+        self,
+        ttl=CACHE_TTL_DEFAULT,
+        max_bytes=CACHE_MAX_BYTES_DEFAULT,
+        endpoints=CACHED_ENDPOINTS,
+        min_requests=1,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.endpoints = endpoints
+        self.min_requests = min_requests
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._lock = threading.Lock()
+        # key: (expires, size, response), the oldest first.
+        self._responses = OrderedDict()
+        # key: (expires, requests), of the keys not kept yet, the oldest first.
+        self._requests = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            _, _, response = self._responses.get(key, (0, 0, None))
+            if response is not None:
+                self.hits += 1
+                return response
+            self.misses += 1
+            if self.min_requests > 1:
+                _, requests = self._requests.pop(key, (0, 0))
+                self._requests[key] = (now + self.ttl, requests + 1)
+            return None
+
+    def put(self, key, response):
+        """Keep a response, return whether it is kept."""
+        size = len(response.content or b"")
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            if self.min_requests > 1:
+                _, requests = self._requests.get(key, (0, 0))
+                if requests < self.min_requests:
+                    return False
+                del self._requests[key]
+            if size > self.max_bytes:
+                return False
+            self._remove(key)
+            self._responses[key] = (now + self.ttl, size, response)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._responses)))
+            return True
+
+    def _remove(self, key):
+        _, size, _ = self._responses.pop(key, (0, 0, None))
+        self.size -= size
+
+    def _purge(self, now):
+        # All entries live for 'ttl', the oldest expire first.
+        while self._responses:
+            key, (expires, _, _) = next(iter(self._responses.items()))
+            if expires >= now:
+                break
+            self._remove(key)
+        while self._requests:
+            key, (expires, _) = next(iter(self._requests.items()))
+            if expires >= now:
+                break
+            del self._requests[key]
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self._requests.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._responses),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared by all clients of the process, see 'GitlabClient'.
+_single_flight = SingleFlight()
+_memo = ResponseCache(
+    ttl=MEMO_TTL_DEFAULT,
+    max_bytes=MEMO_MAX_BYTES_DEFAULT,
+    endpoints=MEMO_ENDPOINTS,
+    min_requests=2,
+)
+
+
+def enable_cache(ttl=CACHE_TTL_DEFAULT, max_bytes=CACHE_MAX_BYTES_DEFAULT):
+    """Cache users, projects and tags in all clients created from now on."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(ttl=ttl, max_bytes=max_bytes)
+    return _cache
+
+
+def get_cache():
+    """Return the cache of the process, None if not enabled."""
+    return _cache
+
+
+def get_single_flight():
+    """Return the 'SingleFlight' of the process, shared by all clients."""
+    return _single_flight
+
+
+def get_memo():
+    """Return the 'ResponseCache' of the process reusing responses for a short time."""
+    return _memo
+
+
+class GitlabError(Exception):
+    """A request to the API failed.
+
+    'error' is the error dict, 'response' the response, if there is one.
+    """
+
+    def __init__(self, error, response=None):
+        super().__init__(error.get("reason", error["message"]))
+        self.error = error
+        self.response = response
+
+
+class GitlabClient:
+    """Send requests to the API of one gitlab server.
+
+    Thread safe, one client can be shared by all workers of a script.
+    """
+
+    def __init__(
+        self,
+        url,
+        token=None,
+        headers=None,
+        pool_size=POOL_SIZE_DEFAULT,
+        timeout=None,
+        retries=RETRIES_DEFAULT,
+        backoff=BACKOFF_DEFAULT,
+        metrics=None,
+        cache=None,
+        coalesce=True,
+        bucket=None,
+    ):
+        """
+        :param url: Gitlab host/url/server, without the API path.
+        :param token: Private token, added to 'headers'.
+        :param timeout: Seconds to wait, (connect, read) or one for both,
+            those of the process (see 'deadline') or 'TIMEOUT_DEFAULT' if not
+            given.
+        :param retries: Number of times a failed request is sent again.
+        :param metrics: 'instrumentation.Metrics' to count the requests in,
+            those of the process if enabled.
+        :param cache: 'ResponseCache' to keep users, projects and tags in,
+            the one of the process if enabled.
+        :param coalesce: Send one request for identical concurrent GET
+            requests of all clients of the process, and reuse the response of
+            repeated lookups for 'MEMO_TTL_DEFAULT' seconds.
+        :param bucket: 'rate_limit.TokenBucket' every request takes a token
+            of, the one of the process if enabled.
+        """
+        self.url = url
+        self.api_url = url + GITHUB_API_ENDPOINT
+        self.headers = dict(headers or {})
+        if token:
+            self.headers["PRIVATE-TOKEN"] = token
+        self.timeout = timeout or deadline.get_timeout() or TIMEOUT_DEFAULT
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics or instrumentation.get_metrics()
+        self.cache = cache if cache is not None else get_cache()
+        self.single_flight = get_single_flight() if coalesce else None
+        self.memo = get_memo() if coalesce else None
+        self.bucket = bucket or rate_limit.get_bucket()
+        self.bucket_key = rate_limit.get_key(self.headers.get("PRIVATE-TOKEN", None))
+        self.session = get_session(pool_size=pool_size, timed=bool(self.metrics))
+
+    def get_url(self, endpoint):
+        """Return the complete url of an API endpoint, complete urls are kept."""
+        if endpoint.startswith("http://") or endpoint.startswith("https://"):
+            return endpoint
+        return self.api_url + endpoint
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * 2**attempt
+
+    def request(self, method, endpoint, **kwargs):
+        """Send a request, retrying rate limited and temporary failures.
+
+        Requests that would create something (POST) are only sent again if
+        the server rejected them (429) or no connection could be made, see
+        'is_connect_error'. Dropped connections and read timeouts may mean
+        the server received them already.
+        Returns the response, whatever its status code.
+        Raises 'requests.RequestException' if no response was received,
+        'deadline.DeadlineExceeded' if the deadline of the script passed.
+
+        Concurrent identical GET requests share one request, see 'coalesce'.
+        The responses of GET requests are shared, they must not be changed.
+        """
+        url = self.get_url(endpoint)
+        headers = dict(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("timeout", self.timeout)
+
+        if method.upper() != "GET" or kwargs.get("stream", False):
+            if method.upper() not in ("GET", "HEAD") and self.memo is not None:
+                # It may change what the memorized requests return.
+                self.memo.clear()
+            return self._send(method, url, headers, kwargs)
+
+        key = get_request_key(url, kwargs.get("params", None), headers)
+        path = self._get_path(url)
+        caches = [
+            (self.cache, instrumentation.CACHED),
+            (self.memo, instrumentation.MEMO),
+        ]
+        caches = [
+            (cache, reason)
+            for cache, reason in caches
+            if cache is not None and cache.endpoints.match(path)
+        ]
+        for cache, reason in caches:
+            response = cache.get(key)
+            if response is not None:
+                if self.metrics:
+                    self.metrics.deduplicate(method, path, reason)
+                return response
+
+        def send():
+            response = self._send(method, url, headers, kwargs)
+            if response.status_code == 200:
+                for cache, _ in caches:
+                    cache.put(key, response)
+            return response
+
+        if self.single_flight is None:
+            return send()
+        response, shared = self.single_flight.do(key, send)
+        if shared and self.metrics:
+            self.metrics.deduplicate(method, path, instrumentation.COALESCED)
+        return response
+
+    def graphql(self, query, variables=None, **kwargs):
+        """Send a GraphQL query, returns the response, whatever its status code.
+
+        Queries do not change anything, they are retried like GET requests
+        and keep the memorized responses.
+        Raises 'requests.RequestException' if no response was received.
+        """
+        headers = dict(self.headers)
+        headers.update(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs["json"] = {"query": query, "variables": variables or {}}
+        return self._send(
+            "POST", self.url + GRAPHQL_ENDPOINT, headers, kwargs, idempotent=True
+        )
+
+    def _send(self, method, url, headers, kwargs, idempotent=None):
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs = dict(kwargs)
+        timeout = kwargs.pop("timeout", self.timeout)
+        attempt = 0
+        while True:
+            # Raises 'DeadlineExceeded' if the deadline passed.
+            request_timeout = deadline.limit(timeout, what=f"{method} {url}")
+            if self.bucket is not None and self._take_token(method, url):
+                request_timeout = deadline.limit(timeout, what=f"{method} {url}")
+            if self.metrics:
+                started = time.perf_counter()
+                self.metrics.start_request()
+            try:
+                response = self.session.request(
+                    method, url, headers=headers, timeout=request_timeout, **kwargs
+                )
+            except (RequestsConnectionError, Timeout) as e:
+                if self.metrics:
+                    self._observe(method, url, started, error=e, retry=attempt > 0)
+                # Only sure to be new, if nothing was sent.
+                retry = attempt < self.retries and (idempotent or is_connect_error(e))
+                if not retry:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.debug(f"{method} {url} failed: '{str(e)}', retry in {delay}s.")
+            else:
+                if self.metrics:
+                    self._observe(
+                        method,
+                        url,
+                        started,
+                        response=response,
+                        retry=attempt > 0,
+                        streamed=kwargs.get("stream", False),
+                    )
+                retry = (
+                    attempt < self.retries
+                    and response.status_code in RETRY_STATUS_CODES
+                    and (idempotent or response.status_code == 429)
+                )
+                if not retry:
+                    return response
+                delay = self._retry_delay(attempt, response=response)
+                logger.debug(
+                    f"{method} {url} received {response.status_code}, retry in {delay}s."
+                )
+                response.close()
+            left = deadline.remaining()
+            if left is not None and left <= delay:
+                # The retry would be sent after the deadline.
+                deadline.cancel(f"Retry of {method} {url}")
+            time.sleep(delay)
+            attempt += 1
+
+    def _take_token(self, method, url):
+        """Wait for a token of the rate limit, until the deadline at most.
+
+        Returns the seconds waited.
+        """
+        waited = self.bucket.acquire(self.bucket_key, max_wait=deadline.remaining())
+        if waited is None:
+            deadline.cancel(f"{method} {url}")
+        if waited and self.metrics:
+            self.metrics.throttle(method, self._get_path(url), waited)
+        return waited
+
+    def _get_path(self, url):
+        path = urlparse(url).path
+        api_path = urlparse(self.api_url).path
+        if path.startswith(api_path):
+            path = path.replace(api_path, "", 1)
+        return path
+
+    def _observe(self, method, url, started, **kwargs):
+        self.metrics.observe(method, self._get_path(url), started, **kwargs)
+
+    def get(self, endpoint, **kwargs):
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self.request("POST", endpoint, **kwargs)
+
+    def paginate(self, endpoint, params=None, per_page=PER_PAGE_DEFAULT, **kwargs):
+        """Yield the items of all pages of a list endpoint.
+
+        Follows the 'X-Next-Page' header, falling back to the 'next' link.
+        Raises 'GitlabError' if a page cannot be fetched.
+        """
+        url = self.get_url(endpoint)
+        params = dict(params or {})
+        params.setdefault("per_page", per_page)
+        while url:
+            response = self.get(url, params=params, **kwargs)
+            if response.status_code != 200:
+                raise GitlabError(
+                    get_error("Cannot get list.", response=response, url=response.url),
+                    response=response,
+                )
+            for item in response.json():
+                yield item
+
+            next_page = response.headers.get("X-Next-Page", "")
+            if next_page:
+                params["page"] = next_page
+            elif "X-Next-Page" not in response.headers and "next" in response.links:
+                # The next link already contains all parameters.
+                url = response.links["next"]["url"]
+                params = None
+            else:
+                url = None
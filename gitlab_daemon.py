@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+"""
+Goal:
+  * Serve the commands of 'gitlab-scripts' from one long running process,
+    listening on a local UNIX socket.
+  * Calls do not pay for the startup of the interpreter, the imports and the
+    TLS handshakes: the scripts are imported once, the connections to gitlab
+    are kept open and users, projects and tags are cached for '--cache-ttl'
+    seconds.
+  * 'gitlab-scripts' sends its commands to the daemon, if GITLAB_SCRIPTS_SOCKET
+    is set. If no daemon answers, it runs them itself.
+
+How to:
+  * Get help
+    - gitlab-scripts daemon -h
+  * Start the daemon
+    - gitlab-scripts daemon --socket /tmp/gitlab-scripts.sock
+  * Send the commands to it
+    - export GITLAB_SCRIPTS_SOCKET=/tmp/gitlab-scripts.sock
+    - gitlab-scripts tags --url <gitlab_url> --group <gitlab_group_id> --latest
+  * Show the served commands and the cache
+    - gitlab-scripts daemon --socket /tmp/gitlab-scripts.sock --status
+
+Attention:
+  * Only 'tags', 'users', 'issues', 'mrs' and 'pipelines' are served.
+    Commands not using the API, and commands with '--debug', '--profile',
+    '--metrics-out', '--deadline', '--connect-timeout', '--read-timeout',
+    '--rate-limit' or '--rate-limit-db', which set up the whole process,
+    always run locally. GITLAB_SCRIPTS_RATE_LIMIT of the daemon limits the
+    commands it runs.
+  * Relative paths of '--journal', '--resume', '--mirror', '--versions-cache'
+    and '--inventory' are made absolute by the client, the daemon has its own
+    working directory.
+  * Environment variables, e.g. GITLAB_PRIVATE_TOKEN, are those of the daemon.
+  * Output of threads started by a command goes to its client, output after
+    the command finished, e.g. of threads left at the deadline, is dropped.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import signal
+import logging
+import argparse
+import threading
+import traceback
+import socketserver
+
+import gitlab_scripts
+from gitlab_scripts import SOCKET_ENVIRONMENT_VARIABLE
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SOCKET_DEFAULT = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "gitlab-scripts.sock"
+)
+# Seconds users, projects and tags are cached, see 'gitlab_client.ResponseCache'.
+CACHE_TTL_DEFAULT = 60
+DAEMON_COMMANDS = ("tags", "users", "issues", "mrs", "pipelines")
+# Arguments setting up the whole process, commands with them run locally.
+LOCAL_ARGUMENTS = (
+    "--debug",
+    "--profile",
+    "--metrics-out",
+    "--deadline",
+    "--connect-timeout",
+    "--read-timeout",
+    "--rate-limit",
+    "--rate-limit-db",
+)
+PATH_ARGUMENTS = (
+    "--journal",
+    "--resume",
+    "--mirror",
+    "-m",
+    "--versions-cache",
+    "--inventory",
+)
+
+
+def can_route(argv):
+    """Return whether the daemon can run a command, given its arguments."""
+    if not argv or argv[0] not in DAEMON_COMMANDS:
+        return False
+    for argument in argv:
+        for local_argument in LOCAL_ARGUMENTS:
+            if argument == local_argument or argument.startswith(local_argument + "="):
+                return False
+    return True
+
+
+def get_absolute_paths(argv):
+    """Return the arguments with the paths of 'PATH_ARGUMENTS' made absolute."""
+    argv = list(argv)
+    for index, argument in enumerate(argv):
+        if argument in PATH_ARGUMENTS and index + 1 < len(argv):
+            argv[index + 1] = os.path.abspath(argv[index + 1])
+        elif "=" in argument and argument.split("=", 1)[0] in PATH_ARGUMENTS:
+            name, path = argument.split("=", 1)
+            argv[index] = f"{name}={os.path.abspath(path)}"
+    return argv
+
+
+def _connect(path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def send(path, argv):
+    """Run a command in the daemon listening on 'path', writing its output.
+
+    Returns the exit code of the command, None if no daemon is listening.
+    """
+    client = _connect(path)
+    if client is None:
+        return None
+    with client:
+        client.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+        for line in client.makefile("rb"):
+            message = json.loads(line)
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+                sys.stdout.flush()
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+                sys.stderr.flush()
+            elif "exit_code" in message:
+                return message["exit_code"]
+    # Not run again locally, it may have created something already.
+    print(f"Lost the connection to the daemon at '{path}'.", file=sys.stderr)
+    return 1
+
+
+def get_status(path):
+    """Return the status of the daemon listening on 'path', None if there is none."""
+    client = _connect(path)
+    if client is None:
+        return None
+    with client:
+        client.sendall(json.dumps({"status": True}).encode() + b"\n")
+        line = client.makefile("rb").readline()
+    return json.loads(line)["status"] if line else None
+
+
+class _ThreadStream(io.TextIOBase):
+    """Write to the stream set for the current thread, else to 'stream'.
+
+    Replaces 'sys.stdout' and 'sys.stderr' of the daemon, so the output of
+    every command goes to its client. Threads write to the stream of the
+    thread starting them, see '_inherit_streams'.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self._local = threading.local()
+
+    def set(self, stream):
+        self._local.stream = stream
+
+    def get(self):
+        """Return the stream set for the current thread, None if not set."""
+        return getattr(self._local, "stream", None)
+
+    def _get(self):
+        stream = self.get()
+        return self.stream if stream is None else stream
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self._get().write(text)
+
+    def flush(self):
+        self._get().flush()
+
+
+def _inherit_streams(streams):
+    """Make every thread write to the streams of the thread starting it.
+
+    E.g. the workers of a 'ThreadPoolExecutor', started when the tasks of a
+    command are submitted.
+    """
+    start = threading.Thread.start
+
+    def start_inheriting(thread):
+        inherited = [(stream, stream.get()) for stream in streams]
+        run = thread.run
+
+        def run_inheriting():
+            for stream, inherited_stream in inherited:
+                stream.set(inherited_stream)
+            run()
+
+        thread.run = run_inheriting
+        return start(thread)
+
+    threading.Thread.start = start_inheriting
+
+
+class _Connection:
+    """Send JSON messages to a client, one per line, from several threads.
+
+    Messages sent after 'close' are dropped.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = json.dumps(message).encode() + b"\n"
+        with self._lock:
+            if self.closed:
+                return
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+
+
+class _ResponseStream(io.TextIOBase):
+    """Send the lines written to it to the client, as '{name: lines}'.
+
+    Thread safe, the threads of a command share it.
+    """
+
+    def __init__(self, connection, name):
+        super().__init__()
+        self.connection = connection
+        self.name = name
+        self._buffer = ""
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self._lock:
+            self._buffer += text
+            if "\n" not in self._buffer:
+                return len(text)
+            end = self._buffer.rindex("\n") + 1
+            lines, self._buffer = self._buffer[:end], self._buffer[end:]
+        self.connection.send({self.name: lines})
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, ""
+        if lines:
+            self.connection.send({self.name: lines})
+
+
+def run_command(argv):
+    """Run a command of 'gitlab-scripts' in this process, returns its exit code."""
+    if not can_route(argv):
+        print(f"Not served by the daemon: '{' '.join(argv)}'.", file=sys.stderr)
+        return 2
+    try:
+        exit_code = gitlab_scripts.main(argv)
+    except SystemExit as e:
+        exit_code = e.code
+    except Exception:
+        traceback.print_exc()
+        return 1
+    if exit_code is None:
+        return 0
+    if isinstance(exit_code, int):
+        return exit_code
+    print(exit_code, file=sys.stderr)
+    return 1
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Answer one request: '{"argv": [...]}' or '{"status": true}'."""
+
+    def handle(self):
+        connection = _Connection(self.wfile)
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            connection.send({"stderr": "Invalid request.\n"})
+            connection.send({"exit_code": 2})
+            return
+        if request.get("status", False):
+            connection.send({"status": self.server.get_status()})
+            return
+
+        argv = request.get("argv", [])
+        # Only the command, the arguments may hold tokens.
+        command = [argument for argument in argv[:2] if not argument.startswith("-")]
+        logger.info(f"Running '{' '.join(command)}'.")
+        self.server.count_request()
+        stdout = _ResponseStream(connection, "stdout")
+        stderr = _ResponseStream(connection, "stderr")
+        sys.stdout.set(stdout)
+        sys.stderr.set(stderr)
+        try:
+            exit_code = run_command(argv)
+        finally:
+            sys.stdout.set(None)
+            sys.stderr.set(None)
+        try:
+            stdout.flush()
+            stderr.flush()
+            connection.send({"exit_code": exit_code})
+        except OSError as e:
+            logger.warning(f"Cannot answer the client: '{str(e)}'.")
+        finally:
+            connection.close()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, cache=None):
+        """
+        :param path: Path of the UNIX socket to listen on.
+        :param cache: 'gitlab_client.ResponseCache' of the clients, to report.
+        """
+        self.cache = cache
+        self.started = time.monotonic()
+        self.requests = 0
+        self._lock = threading.Lock()
+        super().__init__(path, DaemonHandler)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def get_status(self):
+        import gitlab_client
+
+        return {
+            "pid": os.getpid(),
+            "uptime": round(time.monotonic() - self.started, 3),
+            "commands": list(DAEMON_COMMANDS),
+            "requests": self.requests,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "memo": gitlab_client.get_memo().stats(),
+            "single_flight": gitlab_client.get_single_flight().stats(),
+        }
+
+
+def load_commands():
+    """Import the scripts of all served commands."""
+    for name in DAEMON_COMMANDS:
+        command = gitlab_scripts.COMMANDS[name]
+        commands = command.values() if isinstance(command, dict) else [command]
+        for directory, module, _ in commands:
+            gitlab_scripts.load_command(directory, module)
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def serve(path=SOCKET_DEFAULT, cache_ttl=CACHE_TTL_DEFAULT):
+    """Serve the commands on the UNIX socket 'path' until terminated."""
+    import gitlab_client
+
+    if _connect(path) is not None:
+        logger.error(f"A daemon is already listening on '{path}'.")
+        return 1
+    if os.path.exists(path):
+        # Left by a daemon that did not exit cleanly.
+        os.remove(path)
+
+    # Before importing the scripts, they keep the streams to write to.
+    sys.stdout = _ThreadStream(sys.stdout)
+    sys.stderr = _ThreadStream(sys.stderr)
+    _inherit_streams((sys.stdout, sys.stderr))
+    for handler in logging.getLogger().handlers:
+        if getattr(handler, "stream", None) is sys.stderr.stream:
+            handler.setStream(sys.stderr)
+    load_commands()
+
+    gitlab_client.share_sessions()
+    cache = None
+    if cache_ttl > 0:
+        cache = gitlab_client.enable_cache(ttl=cache_ttl)
+
+    # Only the user can connect, the daemon sends requests with their tokens.
+    umask = os.umask(0o177)
+    try:
+        server = DaemonServer(path, cache=cache)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, _terminate)
+    logger.info(f"Listening on '{path}'.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the gitlab-scripts commands from a long running process.",
+        epilog=f"{SOCKET_ENVIRONMENT_VARIABLE}=/tmp/gitlab-scripts.sock gitlab-scripts tags --url <gitlab_url> --group <gitlab_group_id>",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=os.environ.get(SOCKET_ENVIRONMENT_VARIABLE, "") or SOCKET_DEFAULT,
+        help=f"UNIX socket to listen on. Set {SOCKET_ENVIRONMENT_VARIABLE} to send commands to it.",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=CACHE_TTL_DEFAULT,
+        help="Seconds users, projects and tags are cached. '0' disables the cache.",
+    )
+    # default=False is implied by action='store_true'
+    parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Show the status of the daemon listening on the socket.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.status:
+        status = get_status(args.socket)
+        if status is None:
+            logger.error(f"No daemon is listening on '{args.socket}'.")
+            return 1
+        print(json.dumps(status, indent=2))
+        return 0
+
+    return serve(path=args.socket, cache_ttl=args.cache_ttl)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
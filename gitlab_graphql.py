@@ -0,0 +1,155 @@
+"""
+Batched GraphQL queries to the gitlab API.
+
+'iter_batched' queries a connection, e.g. the merge requests, of many projects
+at once:
+  * one alias per project, 'batch_size' projects per query,
+  * only the requested fields of the nodes,
+  * projects with more pages are queried again with their cursor, together
+    with the next projects,
+  * projects failing in GraphQL, e.g. an error of the query or a missing
+    project, are returned without nodes, to be fetched with REST instead.
+
+Attention:
+  * The GraphQL API of gitlab has no tags, those are fetched with REST.
+"""
+
+import logging
+
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+# Projects per query, the complexity of a query is limited by gitlab.
+BATCH_SIZE_DEFAULT = 20
+# Nodes per page, the most gitlab returns.
+FIRST_DEFAULT = 100
+PAGE_INFO = "pageInfo { hasNextPage endCursor }"
+
+MR_FIELDS = (
+    "iid state mergeStatusEnum conflicts webUrl updatedAt diffHeadSha"
+    " sourceBranch targetBranch diffStatsSummary { additions deletions fileCount }"
+)
+# GraphQL types of the arguments of 'Project.mergeRequests'.
+MR_ARGUMENTS = {"state": "MergeRequestState", "updatedAfter": "Time"}
+
+
+def get_query(connection, fields, count, arguments=None, first=FIRST_DEFAULT):
+    """Return a query of 'connection' of 'count' projects, aliased 'p0', 'p1', ...
+
+    The variables are 'path<n>' and 'after<n>' per project and 'arguments'
+    (name: GraphQL type) for the connection of all projects.
+    """
+    arguments = arguments or {}
+    variables = []
+    selections = []
+    connection_arguments = "".join(f"{name}: ${name}, " for name in arguments)
+    for number in range(count):
+        variables += [f"$path{number}: ID!", f"$after{number}: String"]
+        selections.append(
+            f"p{number}: project(fullPath: $path{number}) {{"
+            f" {connection}({connection_arguments}first: {first}, after: $after{number})"
+            f" {{ {PAGE_INFO} nodes {{ {fields} }} }} }}"
+        )
+    variables += [
+        f"${name}: {graphql_type}" for name, graphql_type in arguments.items()
+    ]
+    return f"query({', '.join(variables)}) {{ {' '.join(selections)} }}"
+
+
+def _get_errors(body):
+    return "; ".join(error.get("message", "") for error in body.get("errors", []))
+
+
+def query_batch(
+    client,
+    connection,
+    fields,
+    batch,
+    variables=None,
+    types=None,
+    first=FIRST_DEFAULT,
+):
+    """Query one page of 'connection' of the projects of 'batch', [(path, cursor)].
+
+    Variables without a value are left out.
+    Returns the connection of every project, None for failed projects.
+    """
+    types = types or {}
+    variables = {name: value for name, value in (variables or {}).items() if value}
+    arguments = {name: types.get(name, "String") for name in variables}
+    query = get_query(connection, fields, len(batch), arguments=arguments, first=first)
+    for number, (path, cursor) in enumerate(batch):
+        variables[f"path{number}"] = path
+        variables[f"after{number}"] = cursor
+
+    try:
+        response = client.graphql(query, variables=variables)
+        body = response.json() if response.status_code == 200 else {}
+    except (RequestException, ValueError) as e:
+        logger.warning(f"GraphQL query of {len(batch)} projects failed: '{str(e)}'.")
+        return [None] * len(batch)
+    data = body.get("data", None)
+    if not data:
+        reason = _get_errors(body) or f"status code {response.status_code}"
+        logger.warning(f"GraphQL query of {len(batch)} projects failed: '{reason}'.")
+        return [None] * len(batch)
+
+    connections = []
+    for number, (path, _) in enumerate(batch):
+        project = data.get(f"p{number}", None)
+        project_connection = project.get(connection, None) if project else None
+        if project_connection is None:
+            logger.debug(f"GraphQL query of '{path}' failed: '{_get_errors(body)}'.")
+        connections.append(project_connection)
+    return connections
+
+
+def iter_batched(
+    client,
+    paths,
+    connection,
+    fields,
+    variables=None,
+    types=None,
+    batch_size=BATCH_SIZE_DEFAULT,
+    first=FIRST_DEFAULT,
+):
+    """Yield '(path, nodes)' of every project once all its pages are fetched.
+
+    'nodes' is None, if the project failed in GraphQL.
+
+    :param client: 'gitlab_client.GitlabClient' to send the queries with.
+    :param paths: Full paths of the projects, e.g. 'group/project'.
+    :param connection: Field of 'Project' to query, e.g. 'mergeRequests'.
+    :param fields: Fields of its nodes, e.g. 'MR_FIELDS'.
+    :param variables: Arguments of the connection, e.g. '{"state": "opened"}'.
+    :param types: GraphQL types of the arguments, e.g. 'MR_ARGUMENTS',
+        'String' if not given.
+    """
+    # (path, cursor, nodes so far), in the order of 'paths'.
+    pending = [(path, None, []) for path in paths]
+    while pending:
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        connections = query_batch(
+            client,
+            connection,
+            fields,
+            [(path, cursor) for path, cursor, _ in batch],
+            variables=variables,
+            types=types,
+            first=first,
+        )
+        next_pages = []
+        for (path, _, nodes), project_connection in zip(batch, connections):
+            if project_connection is None:
+                yield path, None
+                continue
+            nodes += project_connection.get("nodes", None) or []
+            page_info = project_connection.get("pageInfo", None) or {}
+            if page_info.get("hasNextPage", False):
+                next_pages.append((path, page_info["endCursor"], nodes))
+            else:
+                yield path, nodes
+        # Further pages first, their projects are done sooner.
+        pending = next_pages + pending
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Goal:
+  * One entry point for all scripts, as subcommands.
+  * Start fast: only the module of the chosen subcommand is imported, so
+    'requests' or 'GitPython' are only loaded if the subcommand needs them.
+
+How to:
+  * Get help
+    - gitlab-scripts -h
+    - gitlab-scripts <command> -h
+  * Install it with 'pip install .', or run it from the repository
+    - python gitlab_scripts.py <command> <arguments>
+  * Commands
+    - gitlab-scripts tags --url <gitlab_url> --group <gitlab_group_id> --latest
+    - gitlab-scripts tf-modules --paths <path_to_terraform_folder>
+    - gitlab-scripts users --url <gitlab_url>
+    - gitlab-scripts issues --url <gitlab_url> --user <user_name>
+    - gitlab-scripts mrs create|list|sync <arguments>
+    - gitlab-scripts pipelines create <arguments>
+    - gitlab-scripts ci-ref <path_to_gitlab_ci_file>
+    - gitlab-scripts daemon --socket <path_to_socket>
+  * Every command takes the arguments of its script, e.g.
+    'gitlab-scripts mrs list' the arguments of 'merge_requests/list_mrs.py'.
+  * Send the commands to a running daemon, see 'gitlab_daemon.py'
+    - GITLAB_SCRIPTS_SOCKET=<path_to_socket> gitlab-scripts <command> <arguments>
+
+Measure the startup with 'python benchmarks/startup.py'.
+"""
+
+import os
+import sys
+import argparse
+import importlib
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+# Socket of the daemon to send the commands to, see 'gitlab_daemon'.
+SOCKET_ENVIRONMENT_VARIABLE = "GITLAB_SCRIPTS_SOCKET"
+
+# command: (directory of the script, module, help) or {subcommand: ...}
+COMMANDS = {
+    "tags": ("", "get_most_recent_tag", "Get most recent tags in group repositories."),
+    "tf-modules": (
+        "",
+        "get_tf_module_source_version",
+        "Get terraform source module versions.",
+    ),
+    "users": ("users", "get_users", "Get gitlab users."),
+    "issues": ("", "get_unestimated_issues", "Get unestimated issues of a user."),
+    "mrs": {
+        "create": ("merge_requests", "create_mrs", "Create MRs for several projects."),
+        "list": ("merge_requests", "list_mrs", "List open MRs."),
+        "sync": ("merge_requests", "sync_mrs", "Sync MRs into a local mirror."),
+    },
+    "pipelines": {
+        "create": (
+            "pipelines",
+            "create_pipelines",
+            "Create pipelines for several projects.",
+        ),
+    },
+    "ci-ref": (
+        "",
+        "check_included_ci_ref",
+        "Check ref of included .gitlab-ci.yml files.",
+    ),
+    "daemon": (
+        "",
+        "gitlab_daemon",
+        "Serve the commands from a long running process.",
+    ),
+}
+
+# Modules with the same name in several script directories, imported from
+# the directory of the script.
+SIBLING_MODULES = ("_version", "arguments", "environment_variables", "root_path")
+
+
+def load_command(directory, module):
+    """Import the module of a command from its directory.
+
+    The scripts import their siblings by name, e.g. 'import arguments', so
+    the directory is put first on 'sys.path'.
+    """
+    path = os.path.join(ROOT_PATH, directory) if directory else ROOT_PATH
+    if sys.path[0] != path:
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+        # Loaded from another directory, e.g. 'merge_requests/arguments.py'.
+        for name in SIBLING_MODULES:
+            sibling = sys.modules.get(name, None)
+            if sibling is not None and os.path.dirname(sibling.__file__) != path:
+                del sys.modules[name]
+    return importlib.import_module(module)
+
+
+def _get_parser(prog, commands):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Gitlab scripts.",
+        epilog="\n".join(
+            ["commands:"]
+            + [
+                f"  {name:<12}{_get_help(command)}"
+                for name, command in commands.items()
+            ]
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=list(commands), metavar="command")
+    parser.add_argument(
+        "arguments", nargs=argparse.REMAINDER, help="Arguments of the command."
+    )
+    return parser
+
+
+def _get_help(command):
+    if isinstance(command, dict):
+        return ", ".join(command)
+    return command[2]
+
+
+def main(argv=None, prog="gitlab-scripts", commands=COMMANDS):
+    """Run a command, returns its exit code.
+
+    The command line is sent to the daemon listening on GITLAB_SCRIPTS_SOCKET,
+    if set and the daemon serves the command. It is run here, if no daemon
+    answers.
+    """
+    socket_path = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE, "")
+    if argv is None and socket_path:
+        import gitlab_daemon
+
+        argv = sys.argv[1:]
+        if gitlab_daemon.can_route(argv):
+            exit_code = gitlab_daemon.send(
+                socket_path, gitlab_daemon.get_absolute_paths(argv)
+            )
+            if exit_code is not None:
+                return exit_code
+
+    args = _get_parser(prog, commands).parse_args(argv)
+    command = commands[args.command]
+    prog = f"{prog} {args.command}"
+    if isinstance(command, dict):
+        return main(args.arguments, prog=prog, commands=command)
+
+    directory, module, _ = command
+    # The scripts name their help and output files after 'sys.argv[0]'.
+    sys.argv[0] = prog
+    return load_command(directory, module).main(args.arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
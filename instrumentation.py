@@ -0,0 +1,473 @@
+"""
+Metrics of the requests sent to the gitlab API.
+
+Collected per method and endpoint (ids replaced by placeholders, e.g.
+'/projects/:id/merge_requests'), when enabled:
+  * requests per status code, or per exception if no response was received,
+  * retries,
+  * bytes sent and received, streamed responses are not counted,
+  * a latency histogram,
+  * seconds per phase: 'connect' (DNS and TCP), 'tls', 'wait' (until the
+    response headers arrived) and 'download' (reading the body),
+  * requests not sent, answered with the response of another request:
+    'coalesced' (an identical request was running), 'memo' (an identical
+    request just finished) or 'cached' (see 'gitlab_client.ResponseCache'),
+  * requests waiting for the shared rate limit and the seconds waited (see
+    'rate_limit').
+
+The scripts enable them with '--metrics-out FILE' (Prometheus text format,
+or JSON if the file ends with '.json' or '--metrics-format json' is given)
+and log a summary with '--debug'.
+Nothing is measured when disabled.
+"""
+
+import re
+import json
+import time
+import atexit
+import logging
+import threading
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+PHASES = ("connect", "tls", "wait", "download")
+FORMATS = ("prometheus", "json")
+# Why a request was not sent, see 'Metrics.deduplicate'.
+COALESCED = "coalesced"
+MEMO = "memo"
+CACHED = "cached"
+DEDUPLICATED = (COALESCED, MEMO, CACHED)
+
+# The segment following one of these is an id.
+ID_COLLECTIONS = {
+    "projects": ":id",
+    "groups": ":id",
+    "users": ":id",
+    "issues": ":iid",
+    "merge_requests": ":iid",
+    "pipelines": ":id",
+    "commits": ":ref",
+    "tags": ":name",
+}
+
+# Metrics of the running process, see 'enable'.
+_metrics = None
+# Phase timings of the request sent by the current thread.
+_local = threading.local()
+
+
+def get_endpoint(path):
+    """Replace the ids in an API path by placeholders."""
+    segments = path.split("?", 1)[0].rstrip("/").split("/")
+    for number in range(1, len(segments)):
+        placeholder = ID_COLLECTIONS.get(segments[number - 1], None)
+        if placeholder:
+            segments[number] = placeholder
+    return "/".join(segments)
+
+
+def _add_timing(phase, seconds):
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+class _TimedConnectionMixin:
+    """Time opening connections, for the request sent by the current thread."""
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._connect_seconds = time.perf_counter() - started
+            _add_timing("connect", self._connect_seconds)
+
+    def connect(self):
+        self._connect_seconds = 0.0
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            # Whatever is not DNS and TCP is the TLS handshake.
+            _add_timing(
+                "tls", max(0.0, time.perf_counter() - started - self._connect_seconds)
+            )
+            _add_timing("connections", 1)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def time_connections(adapter):
+    """Make a 'requests' adapter time the connections it opens."""
+    adapter.poolmanager.pool_classes_by_scheme = {
+        "http": TimedHTTPConnectionPool,
+        "https": TimedHTTPSConnectionPool,
+    }
+    return adapter
+
+
+class Metrics:
+    """Metrics of the requests sent by the clients of a process.
+
+    Thread safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(method, endpoint): {...}}
+        self._endpoints = {}
+        self.connections = 0
+
+    def start_request(self):
+        """Collect the phase timings of the request the current thread sends."""
+        _local.timings = {}
+
+    def observe(
+        self,
+        method,
+        endpoint,
+        started,
+        response=None,
+        error=None,
+        retry=False,
+        streamed=False,
+    ):
+        """Count a request started at 'started' ('time.perf_counter').
+
+        :param error: Exception raised instead of receiving 'response'.
+        :param retry: The request was sent again.
+        """
+        duration = time.perf_counter() - started
+        timings = getattr(_local, "timings", None) or {}
+        _local.timings = None
+
+        if response is not None:
+            status = str(response.status_code)
+            elapsed = response.elapsed.total_seconds()
+            body = response.request.body
+            bytes_sent = len(body) if body else 0
+            bytes_received = 0
+            if not streamed:
+                bytes_received = len(response.content)
+        else:
+            status = error.__class__.__name__
+            elapsed = duration
+            bytes_sent = bytes_received = 0
+        connect = timings.get("connect", 0.0)
+        tls = timings.get("tls", 0.0)
+        phases = {
+            "connect": connect,
+            "tls": tls,
+            "wait": max(0.0, elapsed - connect - tls),
+            "download": max(0.0, duration - elapsed),
+        }
+
+        with self._lock:
+            self.connections += int(timings.get("connections", 0))
+            metric = self._get_metric(method, endpoint)
+            metric["requests"] += 1
+            metric["statuses"][status] = metric["statuses"].get(status, 0) + 1
+            metric["retries"] += int(retry)
+            metric["bytes_sent"] += bytes_sent
+            metric["bytes_received"] += bytes_received
+            metric["duration_sum"] += duration
+            for number, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    metric["buckets"][number] += 1
+                    break
+            for phase, seconds in phases.items():
+                metric["phases"][phase] += seconds
+
+    def deduplicate(self, method, endpoint, reason):
+        """Count a request not sent, answered with the response of another request.
+
+        :param reason: One of 'DEDUPLICATED'.
+        """
+        with self._lock:
+            metric = self._get_metric(method, endpoint)
+            metric["deduplicated"][reason] += 1
+
+    def throttle(self, method, endpoint, seconds):
+        """Count a request waiting 'seconds' for the rate limit before it was sent."""
+        with self._lock:
+            metric = self._get_metric(method, endpoint)
+            metric["throttled"] += 1
+            metric["throttled_seconds"] += seconds
+
+    def _get_metric(self, method, endpoint):
+        key = (method.upper(), get_endpoint(endpoint))
+        metric = self._endpoints.get(key, None)
+        if metric is None:
+            metric = self._endpoints[key] = {
+                "requests": 0,
+                "statuses": {},
+                "retries": 0,
+                "deduplicated": dict.fromkeys(DEDUPLICATED, 0),
+                "throttled": 0,
+                "throttled_seconds": 0.0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "duration_sum": 0.0,
+                "buckets": [0] * len(BUCKETS),
+                "phases": dict.fromkeys(PHASES, 0.0),
+            }
+        return metric
+
+    def as_dict(self):
+        with self._lock:
+            endpoints = []
+            for (method, endpoint), metric in sorted(self._endpoints.items()):
+                endpoints.append(
+                    {
+                        "method": method,
+                        "endpoint": endpoint,
+                        "requests": metric["requests"],
+                        "statuses": dict(metric["statuses"]),
+                        "retries": metric["retries"],
+                        "deduplicated": dict(metric["deduplicated"]),
+                        "rate_limit_waits": metric["throttled"],
+                        "rate_limit_wait_seconds": round(
+                            metric["throttled_seconds"], 6
+                        ),
+                        "bytes_sent": metric["bytes_sent"],
+                        "bytes_received": metric["bytes_received"],
+                        "duration": {
+                            "sum": round(metric["duration_sum"], 6),
+                            "p50": _quantile(metric["buckets"], 0.5),
+                            "p95": _quantile(metric["buckets"], 0.95),
+                            # Requests per bucket, not cumulated.
+                            "buckets": {
+                                _bound(bound): count
+                                for bound, count in zip(BUCKETS, metric["buckets"])
+                            },
+                        },
+                        "phases": {
+                            phase: round(seconds, 6)
+                            for phase, seconds in metric["phases"].items()
+                        },
+                    }
+                )
+            return {"connections": self.connections, "endpoints": endpoints}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2) + "\n"
+
+    def to_prometheus(self):
+        metrics = self.as_dict()
+        lines = [
+            "# HELP gitlab_requests_total Requests sent to the gitlab API.",
+            "# TYPE gitlab_requests_total counter",
+        ]
+        for metric in metrics["endpoints"]:
+            for status, count in sorted(metric["statuses"].items()):
+                lines.append(
+                    f"gitlab_requests_total{_labels(metric, status=status)} {count}"
+                )
+        lines.append(
+            "# HELP gitlab_requests_deduplicated_total Requests not sent, answered with the response of another request."
+        )
+        lines.append("# TYPE gitlab_requests_deduplicated_total counter")
+        for metric in metrics["endpoints"]:
+            for reason, count in metric["deduplicated"].items():
+                lines.append(
+                    f"gitlab_requests_deduplicated_total{_labels(metric, reason=reason)} {count}"
+                )
+        for name, key, help in (
+            ("gitlab_request_retries_total", "retries", "Requests sent again."),
+            (
+                "gitlab_rate_limit_waits_total",
+                "rate_limit_waits",
+                "Requests waiting for the shared rate limit.",
+            ),
+            (
+                "gitlab_rate_limit_wait_seconds_total",
+                "rate_limit_wait_seconds",
+                "Seconds requests waited for the shared rate limit.",
+            ),
+            ("gitlab_request_bytes_total", "bytes_sent", "Bytes of request bodies."),
+            (
+                "gitlab_response_bytes_total",
+                "bytes_received",
+                "Bytes of response bodies, not streamed ones.",
+            ),
+        ):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for metric in metrics["endpoints"]:
+                lines.append(f"{name}{_labels(metric)} {metric[key]}")
+
+        lines.append(
+            "# HELP gitlab_request_duration_seconds Seconds per request, retries count separately."
+        )
+        lines.append("# TYPE gitlab_request_duration_seconds histogram")
+        for metric in metrics["endpoints"]:
+            cumulated = 0
+            for bound, count in metric["duration"]["buckets"].items():
+                cumulated += count
+                lines.append(
+                    f"gitlab_request_duration_seconds_bucket{_labels(metric, le=bound)} {cumulated}"
+                )
+            lines.append(
+                f"gitlab_request_duration_seconds_sum{_labels(metric)} {metric['duration']['sum']}"
+            )
+            lines.append(
+                f"gitlab_request_duration_seconds_count{_labels(metric)} {metric['requests']}"
+            )
+
+        lines.append(
+            "# HELP gitlab_request_phase_seconds_total Seconds spent per phase of the requests."
+        )
+        lines.append("# TYPE gitlab_request_phase_seconds_total counter")
+        for metric in metrics["endpoints"]:
+            for phase, seconds in metric["phases"].items():
+                lines.append(
+                    f"gitlab_request_phase_seconds_total{_labels(metric, phase=phase)} {seconds}"
+                )
+
+        lines.append("# HELP gitlab_connections_total Connections opened.")
+        lines.append("# TYPE gitlab_connections_total counter")
+        lines.append(f"gitlab_connections_total {metrics['connections']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format=None):
+        """Write the metrics to 'path', as JSON if it ends with '.json'."""
+        if format is None:
+            format = "json" if path.endswith(".json") else "prometheus"
+        content = self.to_json() if format == "json" else self.to_prometheus()
+        with open(path, "w") as file_handler:
+            file_handler.write(content)
+
+    def summary(self):
+        """Return one line per endpoint, the slowest first."""
+        endpoints = sorted(
+            self.as_dict()["endpoints"],
+            key=lambda metric: metric["duration"]["sum"],
+            reverse=True,
+        )
+        lines = []
+        for metric in endpoints:
+            phases = ", ".join(
+                f"{phase} {seconds:.3f}s" for phase, seconds in metric["phases"].items()
+            )
+            deduplicated = ", ".join(
+                f"{reason} {count}"
+                for reason, count in metric["deduplicated"].items()
+                if count
+            )
+            lines.append(
+                f"{metric['method']} {metric['endpoint']}: {metric['requests']} requests"
+                f" ({', '.join(f'{s}: {c}' for s, c in sorted(metric['statuses'].items()))}),"
+                f" {metric['retries']} retries, {deduplicated or 'none'} deduplicated,"
+                f" {metric['rate_limit_wait_seconds']:.3f}s waited for the rate limit,"
+                f" {metric['duration']['sum']:.3f}s"
+                f" (p50 <= {metric['duration']['p50']}s, p95 <= {metric['duration']['p95']}s;"
+                f" {phases}), {metric['bytes_received']} bytes received"
+            )
+        return lines
+
+
+def _bound(bound):
+    return "+Inf" if bound == float("inf") else str(bound)
+
+
+def _quantile(buckets, fraction):
+    """Return the upper bound of the bucket holding the quantile."""
+    total = sum(buckets)
+    if not total:
+        return None
+    cumulated = 0
+    for bound, count in zip(BUCKETS, buckets):
+        cumulated += count
+        if cumulated >= fraction * total:
+            return _bound(bound) if bound == float("inf") else bound
+    return None
+
+
+def _labels(metric, **labels):
+    labels = dict(method=metric["method"], endpoint=metric["endpoint"], **labels)
+    return (
+        "{"
+        + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+        + "}"
+    )
+
+
+def _escape(value):
+    return re.sub(r'(["\\])', r"\\\1", value).replace("\n", "\\n")
+
+
+def enable():
+    """Collect the metrics of all clients created from now on."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def get_metrics():
+    """Return the metrics of the process, None if not enabled."""
+    return _metrics
+
+
+def add_arguments(parser):
+    """Add the arguments shared by all scripts to an 'argparse' parser."""
+    parser.add_argument(
+        "--metrics-out",
+        default="",
+        metavar="FILE",
+        help="Write metrics of the API requests to this file when done.",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=FORMATS,
+        default=None,
+        help="Format of --metrics-out, JSON if the file ends with '.json', else Prometheus text.",
+    )
+    return parser
+
+
+def setup(args):
+    """Enable the metrics, if asked for by the parsed arguments.
+
+    They are written to '--metrics-out' and, with '--debug', logged, when the
+    script exits.
+    """
+    debug = getattr(args, "debug", False)
+    if not args.metrics_out and not debug:
+        return None
+    metrics = enable()
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    atexit.register(report, metrics, args.metrics_out, args.metrics_format, debug)
+    return metrics
+
+
+def report(metrics, path="", format=None, debug=False):
+    if path:
+        try:
+            metrics.write(path, format=format)
+        except OSError as e:
+            logger.error(f"Cannot write metrics to '{path}': '{str(e)}'.")
+    if debug:
+        for line in metrics.summary():
+            logger.debug(line)
@@ -0,0 +1,122 @@
+"""
+Append-only journal of the outcome of every project in bulk operations.
+
+Every line is a JSON object (NDJSON):
+  {"project_id": "42", "completed": true, "time": 1600000000.0, "result": {...}}
+
+The journal is written while the projects complete, so an interrupted run
+can be resumed without redoing the completed projects.
+"""
+
+import os
+import json
+import time
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Records and seconds after which the journal is synced to disk. Every record
+# is written to the file at once, it survives the process being killed.
+SYNC_EVERY = 20
+SYNC_INTERVAL = 2.0
+
+
+class Journal:
+    """Append project outcomes to a NDJSON file, synced to disk in batches.
+
+    A line cut off by an interrupted write is ended first, it does not swallow
+    the next record.
+
+    Thread safe, can be used as context manager.
+    """
+
+    def __init__(self, path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = open(path, "a")
+        if _is_cut_off(path):
+            self._file.write("\n")
+            self._file.flush()
+        self._lock = Lock()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def record(self, project_id, result, completed=True):
+        """Append the outcome of a project.
+
+        :param completed: Whether the project is done and can be skipped
+            when resuming. Failed projects are retried.
+        """
+        line = json.dumps(
+            {
+                "project_id": str(project_id),
+                "completed": completed,
+                "time": time.time(),
+                "result": result,
+            }
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            # In the OS from now on, only syncing to disk is batched.
+            self._file.flush()
+            self._unsynced += 1
+            if (
+                self._unsynced >= self.sync_every
+                or time.monotonic() - self._synced_at >= self.sync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _is_cut_off(path):
+    """Return whether a file is not empty and its last line is not ended."""
+    with open(path, "rb") as file_handler:
+        file_handler.seek(0, os.SEEK_END)
+        if not file_handler.tell():
+            return False
+        file_handler.seek(-1, os.SEEK_END)
+        return file_handler.read(1) != b"\n"
+
+
+def read_completed(path):
+    """Return the results of the completed projects in a journal by project id.
+
+    A missing journal has no completed projects. A line cut off by an
+    interrupted write is ignored.
+    """
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r") as file_handler:
+        for number, line in enumerate(file_handler, start=1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Ignoring broken line {number} in journal '{path}'.")
+                continue
+            project_id = entry.get("project_id", None)
+            if entry.get("completed", False):
+                completed[project_id] = entry.get("result", None)
+            else:
+                # A later failure of the same project means it is not done.
+                completed.pop(project_id, None)
+    return completed
@@ -1,6 +1,11 @@
 import argparse
 
 from _version import __version__
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
 
 
 def get_cli_arguments():
@@ -56,5 +61,9 @@ def get_cli_arguments():
         help="Only check differences between branches.",
     )
     parser.add_argument("--debug", action="store_true", help="Show debug info.")
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
 
     return parser
@@ -17,29 +17,91 @@ How to:
   * The url can be given as argument (-u, --url)
 """
 
+import re
 import sys
 import logging
 from urllib.parse import quote_plus
 
-import requests
-
 import environment_variables
+import arguments
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient, get_error, PROJECT_ENDPOINT, MR_ENDPOINT
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-GITHUB_API_ENDPOINT = "/api/v4"
-ISSUES_ENDPOINT = "/issues"
-PROJECT_ENDPOINT = "/projects" + "/{project_id}"
-MR_ENDPOINT = "/merge_requests"
-TAGS_ENDPOINT = "/repository/tags"
-PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{TAGS_ENDPOINT}"
-
 CAN_BE_MERGED = "can_be_merged"
 CANNOT_BE_MERGED = "cannot_be_merged"
 
+# The opening of the 'diffs' array and its first non whitespace character.
+# Quotes within JSON strings are escaped, so this only matches the key.
+DIFFS_START = re.compile(rb'"diffs"\s*:\s*\[\s*(\S)')
+DIFFS_BUFFER_SIZE = 256
+DIFFS_CHUNK_SIZE = 16 * 1024
+
+
+def get_mr_result(
+    json_response, project_id=None, assignee_id=None, source_branch="", target_branch=""
+):
+    """Shape a merge request returned by the API into the printed result."""
+    iid = json_response.get("iid", None)
+    merge_status = json_response.get("merge_status", None)
+    has_conflicts = json_response.get("has_conflicts", None)
+    web_url = json_response.get("web_url", None)
+    user_info = json_response.get("user", None)
+    milestone = json_response.get("milestone", None)
+    milestone_title = ""
+    if milestone:
+        milestone_title = milestone.get("title", None)
+
+    assignee_can_merge = None
+    if user_info:
+        assignee_can_merge = user_info.get("can_merge", None)
+
+    return {
+        "iid": iid,
+        "assignee_can_merge": assignee_can_merge,
+        "merge_status": merge_status,
+        "has_conflicts": has_conflicts,
+        "web_url": web_url,
+        "project_id": project_id,
+        "assignee_id": assignee_id,
+        "source_branch": source_branch,
+        "target_branch": target_branch,
+        "milestone": milestone_title,
+    }
+
+
+def has_differences(response, chunk_size=DIFFS_CHUNK_SIZE):
+    """Check whether a streamed compare response contains any diffs.
+
+    The response is only read until the start of the 'diffs' array is found,
+    the remaining (possibly huge) diffs are not downloaded.
+    The response is closed afterwards.
+    """
+    bytes_read = 0
+    buffer = b""
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            bytes_read += len(chunk)
+            buffer += chunk
+            match = DIFFS_START.search(buffer)
+            if match:
+                logger.debug(f"Read {bytes_read} bytes of the compare response.")
+                return match.group(1) != b"]"
+            # Keep enough to find the key if it is split between chunks.
+            buffer = buffer[-DIFFS_BUFFER_SIZE:]
+    finally:
+        response.close()
+    logger.debug(f"No 'diffs' in {bytes_read} bytes of the compare response.")
+    return False
+
 
 def create_mr(
     url=environment_variables.URL,
@@ -53,8 +115,15 @@ def create_mr(
     headers=None,
     remove_source_branch=False,
     only_check_differences=False,
+    client=None,
 ):
-    url = url + GITHUB_API_ENDPOINT
+    """Create a merge request, if the branches differ.
+
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
 
     data = {
         "id": project_id,
@@ -70,19 +139,16 @@ def create_mr(
     # Compare branches before creating the merge request.
     # Using '&straight=true' (default is 'false') to show 'diffs' in response.
     # Using 'false' returned empty 'diffs'.
-    complete_url = (
-        url
-        + project_endpoint
+    complete_url = client.get_url(
+        project_endpoint
         + f"/repository/compare?from={source_branch}&to={target_branch}&straight=true"
     )
 
-    response = requests.get(url=complete_url, headers=headers)
+    # The complete diffs are only downloaded when they are shown,
+    # otherwise the response is read until the first diff is seen.
+    response = client.get(complete_url, stream=not only_check_differences)
     if response.status_code not in [200, 201]:
-        error = {
-            "message": CANNOT_BE_MERGED,
-            "reason": f"Received status code {response.status_code} with {response.text}.",
-            "project_id": project_id,
-        }
+        error = get_error(CANNOT_BE_MERGED, response=response, project_id=project_id)
         logger.error(error)
         return {
             "error": error,
@@ -92,36 +158,33 @@ def create_mr(
             "url": complete_url,
         }
 
-    json_response = response.json()
-
-    diffs = json_response["diffs"]
-
-    if not diffs:
-        if not only_check_differences:
-            error = {
-                "message": CANNOT_BE_MERGED,
-                "reason": "No changes detected. Not creating empty MR.",
-                "project_id": project_id,
-            }
-            logger.error(error)
-            return {
-                "error": error,
-                "project_id": project_id,
-                "source_branch": source_branch,
-                "target_branch": target_branch,
-                "url": complete_url,
-            }
     # When only showing differences between the given branches.
     if only_check_differences:
+        json_response = response.json()
         return {
-            "diffs": diffs,
+            "diffs": json_response["diffs"],
             "project_id": project_id,
             "source_branch": source_branch,
             "target_branch": target_branch,
             "url": complete_url,
         }
 
-    complete_url = url + project_endpoint + MR_ENDPOINT
+    if not has_differences(response):
+        error = {
+            "message": CANNOT_BE_MERGED,
+            "reason": "No changes detected. Not creating empty MR.",
+            "project_id": project_id,
+        }
+        logger.error(error)
+        return {
+            "error": error,
+            "project_id": project_id,
+            "source_branch": source_branch,
+            "target_branch": target_branch,
+            "url": complete_url,
+        }
+
+    complete_url = client.get_url(project_endpoint + MR_ENDPOINT)
 
     try:
         if int(milestone_id) > -1:
@@ -141,13 +204,9 @@ def create_mr(
             "url": complete_url,
         }
 
-    response = requests.post(url=complete_url, json=data, headers=headers)
+    response = client.post(complete_url, json=data)
     if response.status_code not in [200, 201]:
-        error = {
-            "message": CANNOT_BE_MERGED,
-            "reason": f"Received status code {response.status_code} with {response.text}.",
-            "project_id": project_id,
-        }
+        error = get_error(CANNOT_BE_MERGED, response=response, project_id=project_id)
         logger.error(error)
         return {
             "error": error,
@@ -160,36 +219,16 @@ def create_mr(
     json_response = response.json()
     logger.debug(json_response)
 
-    iid = json_response.get("iid", None)
-    merge_status = json_response.get("merge_status", None)
-    has_conflicts = json_response.get("has_conflicts", None)
-    web_url = json_response.get("web_url", None)
-    user_info = json_response.get("user", None)
-    milestone = json_response.get("milestone", None)
-    milestone_title = ""
-    if milestone:
-        milestone_title = milestone.get("title", None)
-
-    assignee_can_merge = None
-    if user_info:
-        assignee_can_merge = user_info.get("can_merge", None)
-
-    return {
-        "iid": iid,
-        "assignee_can_merge": assignee_can_merge,
-        "merge_status": merge_status,
-        "has_conflicts": has_conflicts,
-        "web_url": web_url,
-        "project_id": project_id,
-        "assignee_id": assignee_id,
-        "source_branch": source_branch,
-        "target_branch": target_branch,
-        "milestone": milestone_title,
-    }
+    return get_mr_result(
+        json_response,
+        project_id=project_id,
+        assignee_id=assignee_id,
+        source_branch=source_branch,
+        target_branch=target_branch,
+    )
 
 
-def main():
-    import arguments
+def main(argv=None):
     import json
 
     parser = arguments.get_cli_arguments()
@@ -197,7 +236,11 @@ def main():
         "-p", "--project", required=True, default="-1", help="Gitlab project id."
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
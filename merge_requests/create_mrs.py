@@ -1,15 +1,91 @@
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from create_mr import create_mr
+from requests.exceptions import RequestException
+
+from create_mr import create_mr, get_mr_result, CANNOT_BE_MERGED
+from open_mrs import get_open_mrs_index
 import environment_variables
+import arguments
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient, GitlabError
+from journal import Journal, read_completed
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+CONCURRENCY_DEFAULT = 8
+
+
+CREATED = "created"
+EXISTING = "existing"
+SKIPPED = "skipped"
+
+
+def get_outcome(mr):
+    """Return whether an MR result was created, already existed or skipped."""
+    if "error" in mr:
+        return SKIPPED
+    if mr.get(EXISTING, False):
+        return EXISTING
+    return CREATED
+
+
+def _create_mr(
+    project_id=None,
+    source_branch=None,
+    target_branch=None,
+    open_mrs=None,
+    **kwargs,
+):
+    """Create the MR of one project, errors do not affect other projects.
+
+    :param open_mrs: Index of already open MRs, see 'get_open_mrs_index'.
+        An MR found there is returned instead of creating it again.
+    """
+    existing_mr = (open_mrs or {}).get((str(project_id), source_branch, target_branch))
+    if existing_mr:
+        logger.info(f"MR already exists for project '{project_id}'.")
+        mr = get_mr_result(
+            existing_mr,
+            project_id=project_id,
+            assignee_id=kwargs.get("assignee_id", None),
+            source_branch=source_branch,
+            target_branch=target_branch,
+        )
+        mr[EXISTING] = True
+        return mr
 
-def create_mrs(
+    logger.info(f"Trying to create MR for project '{project_id}'.")
+    try:
+        return create_mr(
+            project_id=project_id,
+            source_branch=source_branch,
+            target_branch=target_branch,
+            **kwargs,
+        )
+    except Exception as e:
+        error = {
+            "message": CANNOT_BE_MERGED,
+            "reason": f"Error: '{str(e)}'.",
+            "project_id": project_id,
+        }
+        logger.error(error)
+        return {
+            "error": error,
+            "project_id": project_id,
+            "source_branch": source_branch,
+            "target_branch": target_branch,
+        }
+
+
+def iter_create_mrs(
     url=environment_variables.URL,
     project_ids=environment_variables.PROJECT_ID,
     source_branch=environment_variables.SOURCE_BRANCH,
@@ -21,34 +97,82 @@ def create_mrs(
     headers=None,
     remove_source_branch=False,
     only_check_differences=False,
+    concurrency=CONCURRENCY_DEFAULT,
+    client=None,
+    group_id=None,
+    prefetch=True,
+    journal=None,
+    completed_projects=(),
 ):
-    mrs = []
-    try:
-        for project_id in project_ids:
-            logger.info(f"Trying to create MR for project '{project_id}'.")
-            mrs.append(
-                create_mr(
-                    url=url,
-                    project_id=project_id,
-                    source_branch=source_branch,
-                    target_branch=target_branch,
-                    title=title,
-                    description=description,
-                    assignee_id=assignee_id,
-                    milestone_id=milestone_id,
-                    remove_source_branch=remove_source_branch,
-                    only_check_differences=only_check_differences,
-                    headers=headers,
-                )
+    """Create MRs for several projects, 'concurrency' projects at a time.
+
+    Yields the results in the order the projects complete.
+
+    :param prefetch: Get all open MRs of the projects first (on group level,
+        if 'group_id' is given, else per project) and return existing MRs
+        instead of creating them again.
+    :param journal: 'journal.Journal' to record the outcome of every project in.
+    :param completed_projects: Project ids to skip, e.g. completed in a
+        previous run.
+    """
+    completed_projects = {str(project_id) for project_id in completed_projects}
+    skipped_projects = [p for p in project_ids if str(p) in completed_projects]
+    if skipped_projects:
+        logger.info(f"Skipping {len(skipped_projects)} already completed projects.")
+    project_ids = [p for p in project_ids if str(p) not in completed_projects]
+
+    if client is None:
+        client = GitlabClient(url, headers=headers, pool_size=concurrency)
+
+    open_mrs = {}
+    if prefetch and not only_check_differences:
+        try:
+            open_mrs = get_open_mrs_index(
+                url=url,
+                project_ids=project_ids,
+                source_branch=source_branch,
+                target_branch=target_branch,
+                group_id=group_id,
+                client=client,
+                concurrency=concurrency,
             )
-    except (Exception) as e:
-        logger.error(f"Error: '{str(e)}'.")
+        except (GitlabError, RequestException) as e:
+            logger.warning(f"Cannot get open MRs, creating all MRs: '{str(e)}'.")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(
+                _create_mr,
+                url=url,
+                project_id=project_id,
+                source_branch=source_branch,
+                target_branch=target_branch,
+                title=title,
+                description=description,
+                assignee_id=assignee_id,
+                milestone_id=milestone_id,
+                remove_source_branch=remove_source_branch,
+                only_check_differences=only_check_differences,
+                client=client,
+                open_mrs=open_mrs,
+            )
+            for project_id in project_ids
+        ]
+        for future in as_completed(futures):
+            mr = future.result()
+            if journal:
+                journal.record(
+                    mr["project_id"], mr, completed=get_outcome(mr) != SKIPPED
+                )
+            yield mr
 
-    return mrs
 
+def create_mrs(*args, **kwargs):
+    """Create MRs for several projects, see 'iter_create_mrs'."""
+    return list(iter_create_mrs(*args, **kwargs))
 
-def main():
-    import arguments
+
+def main(argv=None):
     import json
 
     parser = arguments.get_cli_arguments()
@@ -59,8 +183,41 @@ def main():
         nargs="+",
         help="Gitlab project ids. Pass several divided by whitespace.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY_DEFAULT,
+        help="Number of projects to create MRs for at the same time.",
+    )
+    parser.add_argument(
+        "-g",
+        "--group",
+        default="",
+        help="Gitlab group id of the projects, used to get the open MRs.",
+    )
+    # default=False is implied by action='store_true'
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="Do not get the open MRs first, try to create every MR.",
+    )
+    parser.add_argument(
+        "--journal",
+        default="",
+        help="Append the outcome of every project to this NDJSON file.",
+    )
+    parser.add_argument(
+        "--resume",
+        default="",
+        metavar="JOURNAL",
+        help="Skip the projects completed in this journal, also appends to it.",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
@@ -78,28 +235,54 @@ def main():
     url = args.url
     remove_source_branch = args.remove_source_branch
     only_check_differences = args.only_check_diffs
+    concurrency = args.concurrency
+    group_id = args.group
+    prefetch = not args.no_prefetch
+    journal_path = args.journal or args.resume
+    completed_projects = {}
+    if args.resume:
+        completed_projects = read_completed(args.resume)
 
     headers = {
         "PRIVATE-TOKEN": private_token,
         "Content-Type": "application/json",
     }
 
-    created_mrs = create_mrs(
-        url=url,
-        project_ids=project_ids,
-        source_branch=source_branch,
-        target_branch=target_branch,
-        title=title,
-        description=description,
-        assignee_id=assignee_id,
-        milestone_id=milestone_id,
-        headers=headers,
-        remove_source_branch=remove_source_branch,
-        only_check_differences=only_check_differences,
-    )
-    logger.debug(created_mrs)
-    for mr in created_mrs:
-        print(json.dumps(mr))
+    journal = Journal(journal_path) if journal_path else None
+    try:
+        created_mrs = iter_create_mrs(
+            url=url,
+            project_ids=project_ids,
+            source_branch=source_branch,
+            target_branch=target_branch,
+            title=title,
+            description=description,
+            assignee_id=assignee_id,
+            milestone_id=milestone_id,
+            headers=headers,
+            remove_source_branch=remove_source_branch,
+            only_check_differences=only_check_differences,
+            concurrency=concurrency,
+            group_id=group_id,
+            prefetch=prefetch,
+            journal=journal,
+            completed_projects=completed_projects,
+        )
+        outcomes = {CREATED: 0, EXISTING: 0, SKIPPED: 0}
+        # Print every MR as soon as it is done (NDJSON).
+        for mr in created_mrs:
+            logger.debug(mr)
+            outcomes[get_outcome(mr)] += 1
+            print(json.dumps(mr), flush=True)
+        if not only_check_differences:
+            logger.info(
+                f"MRs created: {outcomes[CREATED]}, existing: {outcomes[EXISTING]},"
+                f" skipped: {outcomes[SKIPPED]}."
+            )
+
+    finally:
+        if journal:
+            journal.close()
 
 
 if __name__ == "__main__":
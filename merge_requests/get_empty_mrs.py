@@ -6,11 +6,15 @@ Goal:
     - Mr has merge conflicts (accoring to the API result).
 """
 
-import requests
 import os
 import sys
 import logging
 
+from requests.exceptions import RequestException
+
+import root_path  # noqa: F401
+from gitlab_client import GitlabClient, get_error, PROJECT_ENDPOINT, MR_ENDPOINT
+
 logging.basicConfig()
 logger = logging.getLogger("EMPTY_MRS")
 logger.setLevel(logging.INFO)
@@ -19,33 +23,50 @@ logger.setLevel(logging.INFO)
 PROJECT_ID = os.environ.get("GITLAB_PROJECT_ID", None)
 URL = os.environ.get("GITLAB_URL", None)
 
-GITHUB_API_ENDPOINT = "/api/v4"
-ISSUES_ENDPOINT = "/issues"
-PROJECT_ENDPOINT = "/projects" + "/{project_id}"
-MR_ENDPOINT = "/merge_requests"
 MR_VERSION_ENDPOINT = "/{mr_iid}/versions"
-TAGS_ENDPOINT = "/repository/tags"
-PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{TAGS_ENDPOINT}"
 
 CAN_BE_MERGED = "can_be_merged"
 CANNOT_BE_MERGED = "cannot_be_merged"
 
 
-def empty_mrs(url=URL, mr=None, headers=None):
+def empty_mrs(url=URL, mr=None, headers=None, client=None, cache=None):
+    """Get the versions of an MR.
+
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    :param cache: 'versions_cache.VersionsCache' to get the versions of
+        unchanged MRs from.
+    """
+    if cache:
+        mr_versions = cache.get(mr)
+        if mr_versions is not None:
+            return mr_versions
+
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+
     mr_versions = list()
-    url = url + GITHUB_API_ENDPOINT
 
     endpoint = ""
     if mr["project_id"]:
         endpoint = PROJECT_ENDPOINT.format(project_id=mr["project_id"])
-    complete_url = (
-        url + endpoint + MR_ENDPOINT + MR_VERSION_ENDPOINT.format(mr_iid=mr["iid"])
+    complete_url = client.get_url(
+        endpoint + MR_ENDPOINT + MR_VERSION_ENDPOINT.format(mr_iid=mr["iid"])
     )
-    response = requests.get(url=complete_url, headers=headers)
-    if response.status_code not in [200, 201]:
+    try:
+        response = client.get(complete_url)
+    except RequestException as e:
+        # E.g. the deadline of the script passed.
         return {
             "error": "Cannot get merge request.",
-            "reason": "Received status code {response.status_code} with {response.text}.",
+            "reason": str(e),
+            "url": complete_url,
+        }
+    if response.status_code not in [200, 201]:
+        error = get_error("Cannot get merge request.", response=response)
+        return {
+            "error": error["message"],
+            "reason": error["reason"],
             "url": complete_url,
         }
         sys.exit(1)
@@ -67,4 +88,7 @@ def empty_mrs(url=URL, mr=None, headers=None):
             }
         )
 
+    if cache:
+        cache.put(mr, mr_versions)
+
     return mr_versions
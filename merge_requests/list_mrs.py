@@ -18,17 +18,55 @@ How to:
   * The gitlab project id can be given as argument (-p, --project)
   * If the gitlab project id is set both ways, GITLAB_PROJECT_ID has precedence.
   * The url can be given as argument (-u, --url)
+  * All pages of MRs are listed, the versions of the MRs are fetched while listing.
+    - Only MRs updated after a date can be listed (--updated-after)
+    - Only MRs with a merge status can be checked for being empty (--merge-status)
+    - The number of MRs checked at the same time can be given (--concurrency)
+    - The versions of unchanged MRs can be cached in a file (--versions-cache)
+    - The MRs of a group's projects can be kept in a file (--inventory), only
+      the MRs of projects with activity since the last run are fetched again.
+    - The MRs of a group's projects, their merge status and diff stats can be
+      queried with GraphQL, --batch-size projects per query (--engine graphql),
+      instead of the versions of every MR.
+  * MRs can be listed from a local mirror (--mirror <sqlite_file> --query <query>)
+    - Queries: all, opened, conflicting, empty (cannot be merged), stale
+    - The mirror is synced first, if the last sync is older than --max-staleness seconds.
 
 Attention:
   * For now, to make '--group <group_id>' working set '--project_id=""'.
 """
 
-import requests
 import os
 import sys
+import time
+import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from requests.exceptions import RequestException
 
 from get_empty_mrs import empty_mrs
+from versions_cache import VersionsCache, MAX_AGE_DEFAULT
+from mr_mirror import MRMirror, get_scope, QUERIES, STALE_DAYS_DEFAULT
+from _version import __version__
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from project_inventory import (
+    ProjectInventory,
+    FULL_REFRESH_DEFAULT,
+    MAX_AGE_DEFAULT as INVENTORY_MAX_AGE_DEFAULT,
+)
+from gitlab_graphql import iter_batched, BATCH_SIZE_DEFAULT, MR_FIELDS, MR_ARGUMENTS
+from gitlab_client import (
+    GitlabClient,
+    GitlabError,
+    PROJECT_ENDPOINT,
+    GROUP_ENDPOINT,
+    MR_ENDPOINT,
+)
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -36,82 +74,337 @@ logger.setLevel(logging.INFO)
 
 
 STATE_DEFAULT = "all"
+CONCURRENCY_DEFAULT = 8
+# Seconds after which the mirror is synced before answering a query.
+MAX_STALENESS_DEFAULT = 300
 
 PRIVATE_TOKEN = os.environ.get("GITLAB_PRIVATE_TOKEN", None)
 PROJECT_ID = os.environ.get("GITLAB_PROJECT_ID", None)
 GROUP_ID = os.environ.get("GITLAB_GROUP_ID", None)
 URL = os.environ.get("GITLAB_URL", None)
 
-GITHUB_API_ENDPOINT = "/api/v4"
-ISSUES_ENDPOINT = "/issues"
-PROJECT_ENDPOINT = "/projects" + "/{project_id}"
-GROUP_ENDPOINT = "/groups" + "/{group_id}"
-MR_ENDPOINT = "/merge_requests"
-TAGS_ENDPOINT = "/repository/tags"
-PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{TAGS_ENDPOINT}"
-
 CAN_BE_MERGED = "can_be_merged"
 CANNOT_BE_MERGED = "cannot_be_merged"
 
+ENGINES = ("rest", "graphql")
 
-def list_mrs(
-    url=URL, project_id=PROJECT_ID, group_id=GROUP_ID, state=STATE_DEFAULT, headers=None
+
+def iter_list_mrs(
+    url=URL,
+    project_id=PROJECT_ID,
+    group_id=GROUP_ID,
+    state=STATE_DEFAULT,
+    headers=None,
+    client=None,
+    updated_after=None,
 ):
-    url = url + GITHUB_API_ENDPOINT
+    """Yield the MRs of a project or group, all pages, as soon as they arrive.
+
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    :param updated_after: Only MRs updated after this ISO 8601 datetime.
+    Raises 'gitlab_client.GitlabError' if a page cannot be fetched.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
 
     endpoint = ""
     if project_id:
         endpoint = PROJECT_ENDPOINT.format(project_id=project_id)
     elif group_id:
         endpoint = GROUP_ENDPOINT.format(group_id=group_id)
-    complete_url = url + endpoint + MR_ENDPOINT + f"?state={state}"
-    response = requests.get(url=complete_url, headers=headers)
-    if response.status_code not in [200, 201]:
-        return {
-            "error": "Cannot get merge request.",
-            "reason": "Received status code {response.status_code} with {response.text}.",
-            "project_id": project_id,
-            "url": complete_url,
-        }
-        sys.exit(1)
+    params = {"state": state}
+    if updated_after:
+        params["updated_after"] = updated_after
 
-    json_response = response.json()
-    logger.debug(json_response)
-
-    mrs = list()
-    for mr in json_response:
+    for mr in client.paginate(endpoint + MR_ENDPOINT, params=params):
+        logger.debug(mr)
         iid = mr.get("iid", None)
         merge_status = mr.get("merge_status", None)
         has_conflicts = mr.get("has_conflicts", None)
         web_url = mr.get("web_url", None)
         project_id = mr.get("project_id", None)
+        source_branch = mr.get("source_branch", None)
+        target_branch = mr.get("target_branch", None)
+        updated_at = mr.get("updated_at", None)
+        sha = mr.get("sha", None)
+        mr_state = mr.get("state", None)
         # user_info =  mr.get("user", None)
         # assignee_can_merge = None
         # if user_info:
         #     assignee_can_merge = user_info.get("can_merge", None)
 
-        mrs.append(
-            {
-                "iid": iid,
-                #     "assignee_can_merge": assignee_can_merge,
-                "merge_status": merge_status,
-                "has_conflicts": has_conflicts,
-                "web_url": web_url,
-                "project_id": project_id,
-                "group_id": group_id,
-                #     "assignee_id": assignee_id,
-                #     "source_branch": source_branch,
-                #     "target_branch": target_branch,
-            }
+        yield {
+            "iid": iid,
+            #     "assignee_can_merge": assignee_can_merge,
+            "merge_status": merge_status,
+            "has_conflicts": has_conflicts,
+            "web_url": web_url,
+            "project_id": project_id,
+            "group_id": group_id,
+            "updated_at": updated_at,
+            "sha": sha,
+            "state": mr_state,
+            #     "assignee_id": assignee_id,
+            "source_branch": source_branch,
+            "target_branch": target_branch,
+        }
+
+
+def iter_inventory_mrs(
+    inventory=None,
+    url=URL,
+    group_id=GROUP_ID,
+    state=STATE_DEFAULT,
+    headers=None,
+    client=None,
+    updated_after=None,
+    concurrency=CONCURRENCY_DEFAULT,
+):
+    """Yield the MRs of the projects of a group, like 'iter_list_mrs'.
+
+    The MRs of projects without activity since they were stored come from
+    'inventory', those of the other projects are fetched, 'concurrency'
+    projects at the same time, and stored.
+    If most projects changed, e.g. in the first run, the MRs of the group are
+    listed instead, in fewer requests.
+
+    :param inventory: 'project_inventory.ProjectInventory' to list the
+        projects of the group with and to keep their MRs in.
+    Raises 'gitlab_client.GitlabError' if a page cannot be fetched.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+
+    name = f"mrs:{state}:{updated_after or ''}"
+    # Like the MRs of the group.
+    projects = inventory.refresh(client, group_id, include_subgroups=True)
+    stored = []
+    changed = []
+    for project in projects:
+        mrs = inventory.get_result(project, name)
+        if mrs is None:
+            changed.append(project)
+        else:
+            stored.append(mrs)
+
+    if len(changed) > len(projects) / 2:
+        projects_mrs = {str(project["id"]): [] for project in projects}
+        for mr in iter_list_mrs(
+            group_id=group_id,
+            state=state,
+            client=client,
+            updated_after=updated_after,
+        ):
+            projects_mrs.setdefault(str(mr["project_id"]), []).append(mr)
+            yield mr
+        for project in projects:
+            inventory.put_result(project, name, projects_mrs[str(project["id"])])
+        return
+
+    for mrs in stored:
+        yield from mrs
+
+    def get_project_mrs(project):
+        mrs = list(
+            iter_list_mrs(
+                project_id=project["id"],
+                group_id=group_id,
+                state=state,
+                client=client,
+                updated_after=updated_after,
+            )
+        )
+        inventory.put_result(project, name, mrs)
+        return mrs
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for mrs in executor.map(get_project_mrs, changed):
+            yield from mrs
+
+
+def get_graphql_mr(node, project, group_id=None):
+    """Return an MR queried with GraphQL like those of 'iter_list_mrs', and its diff stats."""
+    merge_status = node.get("mergeStatusEnum", None)
+    diff_stats = node.get("diffStatsSummary", None) or {}
+    mr = {
+        "iid": int(node["iid"]),
+        "merge_status": merge_status.lower() if merge_status else None,
+        "has_conflicts": node.get("conflicts", None),
+        "web_url": node.get("webUrl", None),
+        "project_id": project["id"],
+        "group_id": group_id,
+        "updated_at": node.get("updatedAt", None),
+        "sha": node.get("diffHeadSha", None),
+        "state": node.get("state", None),
+        "source_branch": node.get("sourceBranch", None),
+        "target_branch": node.get("targetBranch", None),
+    }
+    return mr, {
+        "web_url": mr["web_url"],
+        "additions": diff_stats.get("additions", None),
+        "deletions": diff_stats.get("deletions", None),
+        "file_count": diff_stats.get("fileCount", None),
+    }
+
+
+def iter_graphql_mrs(
+    url=URL,
+    group_id=GROUP_ID,
+    state=STATE_DEFAULT,
+    headers=None,
+    client=None,
+    updated_after=None,
+    batch_size=BATCH_SIZE_DEFAULT,
+):
+    """Yield '(mr, diff_stats)' of the projects of a group, queried with GraphQL.
+
+    The MRs of 'batch_size' projects are queried at once. Projects failing in
+    GraphQL are listed with REST, their 'diff_stats' are None.
+    Raises 'gitlab_client.GitlabError' if the projects or a REST page cannot
+    be fetched.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+
+    # Like the MRs of the group.
+    projects = client.paginate(
+        GROUP_ENDPOINT.format(group_id=group_id) + "/projects",
+        params={"include_subgroups": "true"},
+    )
+    projects = {project["path_with_namespace"]: project for project in projects}
+    nodes_per_project = iter_batched(
+        client,
+        list(projects),
+        "mergeRequests",
+        MR_FIELDS,
+        variables={"state": state, "updatedAfter": updated_after},
+        types=MR_ARGUMENTS,
+        batch_size=batch_size,
+    )
+    for path, nodes in nodes_per_project:
+        project = projects[path]
+        if nodes is None:
+            logger.debug(f"Listing the MRs of '{path}' with REST.")
+            for mr in iter_list_mrs(
+                project_id=project["id"],
+                group_id=group_id,
+                state=state,
+                client=client,
+                updated_after=updated_after,
+            ):
+                yield mr, None
+            continue
+        for node in nodes:
+            yield get_graphql_mr(node, project, group_id=group_id)
+
+
+def list_mrs(
+    url=URL,
+    project_id=PROJECT_ID,
+    group_id=GROUP_ID,
+    state=STATE_DEFAULT,
+    headers=None,
+    client=None,
+    updated_after=None,
+):
+    try:
+        return list(
+            iter_list_mrs(
+                url=url,
+                project_id=project_id,
+                group_id=group_id,
+                state=state,
+                headers=headers,
+                client=client,
+                updated_after=updated_after,
+            )
         )
+    except GitlabError as e:
+        return {
+            "error": "Cannot get merge request.",
+            "reason": e.error["reason"],
+            "project_id": project_id,
+            "url": e.error["url"],
+        }
+
+
+def sync_mirror(
+    mirror=None,
+    url=URL,
+    project_id=PROJECT_ID,
+    group_id=GROUP_ID,
+    headers=None,
+    client=None,
+):
+    """Store the MRs of a project or group updated since its last sync in 'mirror'.
+
+    All MRs are listed if a full sync is due, see 'MRMirror.get_updated_after'.
+    Returns the number of synced MRs.
+    Raises 'gitlab_client.GitlabError' if a page cannot be fetched.
+    """
+    scope = get_scope(project_id=project_id, group_id=group_id)
+    updated_after = mirror.get_updated_after(scope)
+    synced_at = time.time()
+    mrs = iter_list_mrs(
+        url=url,
+        project_id=project_id,
+        group_id=group_id,
+        state="all",
+        headers=headers,
+        client=client,
+        updated_after=updated_after,
+    )
+    return mirror.sync(scope, mrs, synced_at=synced_at, full=updated_after is None)
+
+
+def query_mirror(
+    path,
+    query="all",
+    max_staleness=MAX_STALENESS_DEFAULT,
+    stale_days=STALE_DAYS_DEFAULT,
+    url=URL,
+    project_id=PROJECT_ID,
+    group_id=GROUP_ID,
+    headers=None,
+    client=None,
+):
+    """Answer a query from the local MR mirror.
 
-    return mrs
+    The mirror is synced first, if its last sync is more than 'max_staleness'
+    seconds ago.
+    """
+    mirror = MRMirror(path)
+    try:
+        staleness = mirror.staleness(
+            get_scope(project_id=project_id, group_id=group_id)
+        )
+        if staleness is None or staleness > max_staleness:
+            try:
+                count = sync_mirror(
+                    mirror=mirror,
+                    url=url,
+                    project_id=project_id,
+                    group_id=group_id,
+                    headers=headers,
+                    client=client,
+                )
+                logger.debug(f"Synced {count} MRs into the mirror.")
+            except (GitlabError, RequestException, sqlite3.Error) as e:
+                # E.g. the database is locked by a long sync of another process.
+                logger.error(
+                    f"Cannot sync the mirror, answering from the last sync: '{str(e)}'."
+                )
+        return mirror.query(
+            query=query, project_id=project_id, group_id=group_id, stale_days=stale_days
+        )
+    finally:
+        mirror.close()
 
 
-def main():
+def main(argv=None):
     import argparse
     import json
-    from _version import __version__
 
     parser = argparse.ArgumentParser(
         description="List open MR.",
@@ -140,6 +433,85 @@ def main():
     parser.add_argument(
         "-s", "--state", default=STATE_DEFAULT, help="State of MRs to be listed."
     )
+    parser.add_argument(
+        "--updated-after",
+        default="",
+        help="Only list MRs updated after this ISO 8601 datetime, e.g. 2020-11-01T00:00:00Z.",
+    )
+    parser.add_argument(
+        "--merge-status",
+        default="",
+        help="Only check MRs with this merge status for being empty, e.g. cannot_be_merged.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY_DEFAULT,
+        help="Number of MRs to check for being empty at the same time.",
+    )
+    parser.add_argument(
+        "--versions-cache",
+        default="",
+        help="JSON file caching the versions of MRs, only changed MRs are fetched.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=int,
+        default=MAX_AGE_DEFAULT,
+        help="Days to keep the cached versions of merged or closed MRs.",
+    )
+    parser.add_argument(
+        "--inventory",
+        default="",
+        help="JSON file keeping the projects of the group and their MRs, only MRs of changed projects are fetched.",
+    )
+    parser.add_argument(
+        "--inventory-full-refresh",
+        type=int,
+        default=FULL_REFRESH_DEFAULT,
+        help="Seconds after which all projects of the inventory are listed again.",
+    )
+    parser.add_argument(
+        "--inventory-max-age",
+        type=int,
+        default=INVENTORY_MAX_AGE_DEFAULT,
+        help="Seconds after which the results of the inventory are fetched again, also of projects without activity.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="rest",
+        help="API to list the MRs of a group with. 'graphql' gets their diff stats instead of their versions.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE_DEFAULT,
+        help="Projects per GraphQL query.",
+    )
+    parser.add_argument(
+        "--mirror",
+        default="",
+        help="sqlite file mirroring the MRs, answers --query from it (see sync_mrs.py).",
+    )
+    parser.add_argument(
+        "--query",
+        choices=QUERIES,
+        default="all",
+        help="MRs to list from the mirror.",
+    )
+    parser.add_argument(
+        "--max-staleness",
+        type=int,
+        default=MAX_STALENESS_DEFAULT,
+        help="Seconds since the last sync after which the mirror is synced before answering.",
+    )
+    parser.add_argument(
+        "--stale-days",
+        type=int,
+        default=STALE_DAYS_DEFAULT,
+        help="Days without update after which an open MR is stale.",
+    )
     parser.add_argument(
         "-t",
         "--token",
@@ -148,7 +520,17 @@ def main():
     )
     parser.add_argument("--debug", action="store_true", help="Show debug info.")
 
-    args = parser.parse_args()
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.engine == "graphql" and args.inventory:
+        parser.error("--inventory cannot be used with --engine graphql.")
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
@@ -162,26 +544,136 @@ def main():
     group_id = args.group
     state = args.state
     url = args.url
+    updated_after = args.updated_after
+    merge_status = args.merge_status
+    concurrency = max(1, args.concurrency)
+    cache = None
+    if args.versions_cache:
+        cache = VersionsCache(args.versions_cache, max_age=args.cache_max_age)
 
     headers = {
         "PRIVATE-TOKEN": private_token,
         "Content-Type": "application/json",
     }
 
-    listed_mrs = list_mrs(
-        url=url, project_id=project_id, group_id=group_id, state=state, headers=headers
-    )
-    print(*listed_mrs, sep="\n")
-    # for k, v in tags.items():
-    #     print(k)
-    #     print("  " +  "\n  ".join(t for t in v))
+    if args.mirror:
+        mrs = query_mirror(
+            args.mirror,
+            query=args.query,
+            max_staleness=args.max_staleness,
+            stale_days=args.stale_days,
+            url=url,
+            project_id=project_id,
+            group_id=group_id,
+            headers=headers,
+        )
+        for mr in mrs:
+            print(mr)
+        return
 
-    for mr in listed_mrs:
-        # Get not mergeable MRs with conflicts.
-        # This seems to contains empty MRs.
-        result = empty_mrs(url=url, mr=mr, headers=headers)
-        if result:
-            print(json.dumps(result, indent=4))
+    client = GitlabClient(url, headers=headers, pool_size=concurrency)
+    graphql = args.engine == "graphql" and group_id and not project_id
+    inventory = None
+    if args.inventory and group_id and not project_id:
+        inventory = ProjectInventory(
+            args.inventory,
+            url,
+            full_refresh=args.inventory_full_refresh,
+            max_age=args.inventory_max_age,
+        )
+        mrs = iter_inventory_mrs(
+            inventory=inventory,
+            group_id=group_id,
+            state=state,
+            client=client,
+            updated_after=updated_after,
+            concurrency=concurrency,
+        )
+    elif graphql:
+        mrs = iter_graphql_mrs(
+            group_id=group_id,
+            state=state,
+            client=client,
+            updated_after=updated_after,
+            batch_size=max(1, args.batch_size),
+        )
+    else:
+        mrs = iter_list_mrs(
+            url=url,
+            project_id=project_id,
+            group_id=group_id,
+            state=state,
+            headers=headers,
+            client=client,
+            updated_after=updated_after,
+        )
+    if not graphql:
+        # Without diff stats, the versions are fetched.
+        mrs = ((mr, None) for mr in mrs)
+
+    def print_versions(futures):
+        for future in futures:
+            result = future.result()
+            if result:
+                print(json.dumps(result, indent=4))
+
+    # The versions are fetched while the next pages of MRs are listed.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = set()
+        try:
+            for mr, diff_stats in mrs:
+                print(mr)
+                # Get not mergeable MRs with conflicts.
+                # This seems to contains empty MRs.
+                if not merge_status or mr["merge_status"] == merge_status:
+                    if diff_stats is not None:
+                        print(json.dumps(diff_stats, indent=4))
+                    else:
+                        futures.add(
+                            executor.submit(
+                                empty_mrs,
+                                url=url,
+                                mr=mr,
+                                headers=headers,
+                                client=client,
+                                cache=cache,
+                            )
+                        )
+                done = {future for future in futures if future.done()}
+                print_versions(done)
+                futures -= done
+        except GitlabError as e:
+            print(
+                {
+                    "error": "Cannot get merge request.",
+                    "reason": e.error["reason"],
+                    "project_id": project_id,
+                    "url": e.error["url"],
+                }
+            )
+        except RequestException as e:
+            # E.g. the deadline passed, the MRs listed so far are printed.
+            print(
+                {
+                    "error": "Cannot get merge request.",
+                    "reason": str(e),
+                    "project_id": project_id,
+                }
+            )
+        print_versions(as_completed(futures))
+
+    if inventory:
+        inventory.save()
+        logger.info(
+            f"Inventory: {inventory.hits} projects unchanged, {inventory.misses} fetched,"
+            f" hit rate {inventory.hit_rate:.0%}."
+        )
+    if cache:
+        cache.save()
+        logger.info(
+            f"Versions cache: {cache.hits} hits, {cache.misses} misses,"
+            f" hit rate {cache.hit_rate:.0%}."
+        )
 
 
 if __name__ == "__main__":
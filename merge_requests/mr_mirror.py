@@ -0,0 +1,259 @@
+"""
+Goal:
+  * Local sqlite mirror of MRs.
+  * Synced incrementally, only MRs updated since the last sync are fetched.
+  * Synced fully every 'FULL_SYNC_DEFAULT' seconds, MRs not listed any more
+    (deleted, moved) are removed.
+  * Answers queries about conflicting, empty or stale MRs without the API.
+"""
+
+import time
+import sqlite3
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+QUERIES = ("all", "opened", "conflicting", "empty", "stale")
+STALE_DAYS_DEFAULT = 30
+# Seconds after which all MRs of a scope are listed again.
+FULL_SYNC_DEFAULT = 24 * 60 * 60
+# Seconds before the start of the last sync to list the updated MRs from, for
+# MRs updated while it listed them and a clock of the server behind ours.
+SYNC_OVERLAP = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mrs (
+    project_id INTEGER NOT NULL,
+    iid INTEGER NOT NULL,
+    state TEXT,
+    merge_status TEXT,
+    has_conflicts INTEGER,
+    source_branch TEXT,
+    target_branch TEXT,
+    updated_at TEXT,
+    sha TEXT,
+    web_url TEXT,
+    group_id TEXT,
+    PRIMARY KEY (project_id, iid)
+);
+CREATE INDEX IF NOT EXISTS mrs_state ON mrs (state, merge_status);
+CREATE TABLE IF NOT EXISTS syncs (
+    scope TEXT PRIMARY KEY,
+    synced_at REAL,
+    last_updated_at TEXT,
+    full_synced_at REAL
+);
+"""
+
+COLUMNS = (
+    "project_id",
+    "iid",
+    "state",
+    "merge_status",
+    "has_conflicts",
+    "source_branch",
+    "target_branch",
+    "updated_at",
+    "sha",
+    "web_url",
+    "group_id",
+)
+
+INSERT_MR = (
+    f"INSERT OR REPLACE INTO mrs ({', '.join(COLUMNS)})"
+    f" VALUES ({', '.join('?' * len(COLUMNS))})"
+)
+
+
+def get_scope(project_id=None, group_id=None):
+    """Name what a sync covers, a project or a group."""
+    if project_id:
+        return f"project:{project_id}"
+    return f"group:{group_id}"
+
+
+def _get_scope_condition(scope):
+    """Return the condition and parameters selecting the MRs of a scope."""
+    kind, _, scope_id = scope.partition(":")
+    if kind == "project":
+        return "project_id = ?", (scope_id,)
+    return "group_id = ?", (scope_id,)
+
+
+def _format_time(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+class MRMirror:
+    """MRs stored in a sqlite database, thread safe."""
+
+    def __init__(self, path, full_sync=FULL_SYNC_DEFAULT):
+        """
+        :param full_sync: Seconds after which all MRs of a scope are synced.
+        """
+        self.path = path
+        self.full_sync = full_sync
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+            columns = [
+                row["name"]
+                for row in self._connection.execute("PRAGMA table_info(syncs)")
+            ]
+            if "full_synced_at" not in columns:
+                # Mirrors created before full syncs, synced fully next time.
+                self._connection.execute(
+                    "ALTER TABLE syncs ADD COLUMN full_synced_at REAL"
+                )
+
+    def close(self):
+        self._connection.close()
+
+    def get_sync(self, scope):
+        """Return (synced_at, last_updated_at) of a scope, (None, None) if never synced."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT synced_at, last_updated_at FROM syncs WHERE scope = ?",
+                (scope,),
+            ).fetchone()
+        if not row:
+            return None, None
+        return row["synced_at"], row["last_updated_at"]
+
+    def get_updated_after(self, scope):
+        """Return the time to list the MRs of a scope updated after, None for all MRs.
+
+        All MRs are listed if the scope was never synced fully or not for
+        'full_sync' seconds.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT last_updated_at, full_synced_at FROM syncs WHERE scope = ?",
+                (scope,),
+            ).fetchone()
+        if (
+            not row
+            or row["full_synced_at"] is None
+            or time.time() - row["full_synced_at"] > self.full_sync
+        ):
+            return None
+        return row["last_updated_at"]
+
+    def staleness(self, scope):
+        """Seconds since the last sync of a scope, None if never synced."""
+        synced_at, _ = self.get_sync(scope)
+        if synced_at is None:
+            return None
+        return time.time() - synced_at
+
+    @staticmethod
+    def _values(mr):
+        values = [mr.get(column, None) for column in COLUMNS]
+        group_id = mr.get("group_id", None)
+        values[COLUMNS.index("group_id")] = str(group_id) if group_id else None
+        return values
+
+    def sync(self, scope, mrs, synced_at=None, full=False):
+        """Store the MRs (updated since the last sync) of a scope.
+
+        The next sync lists the MRs updated since 'synced_at' minus
+        'SYNC_OVERLAP', not since the newest update listed: MRs updated
+        while listing may not be listed.
+
+        :param synced_at: Time the MRs were started to be listed.
+        :param full: 'mrs' are all MRs of the scope, the others are removed.
+        Returns the number of stored MRs.
+        """
+        if synced_at is None:
+            synced_at = time.time()
+        # Listed before writing, the database is not locked while 'mrs' are
+        # fetched page by page.
+        rows = [self._values(mr) for mr in mrs]
+        seen = {
+            (values[COLUMNS.index("project_id")], values[COLUMNS.index("iid")])
+            for values in rows
+        }
+        with self._lock, self._connection:
+            full_synced_at = None
+            row = self._connection.execute(
+                "SELECT full_synced_at FROM syncs WHERE scope = ?", (scope,)
+            ).fetchone()
+            if row:
+                full_synced_at = row["full_synced_at"]
+            self._connection.executemany(INSERT_MR, rows)
+            if full:
+                condition, parameters = _get_scope_condition(scope)
+                stored = self._connection.execute(
+                    f"SELECT project_id, iid FROM mrs WHERE {condition}", parameters
+                ).fetchall()
+                removed = [tuple(row) for row in stored if tuple(row) not in seen]
+                self._connection.executemany(
+                    "DELETE FROM mrs WHERE project_id = ? AND iid = ?", removed
+                )
+                if removed:
+                    logger.debug(f"Removed {len(removed)} MRs of '{scope}'.")
+                full_synced_at = synced_at
+            self._connection.execute(
+                "INSERT OR REPLACE INTO syncs (scope, synced_at, last_updated_at, full_synced_at)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    scope,
+                    synced_at,
+                    _format_time(synced_at - SYNC_OVERLAP),
+                    full_synced_at,
+                ),
+            )
+        logger.debug(f"Synced {len(rows)} MRs of '{scope}'.")
+        return len(rows)
+
+    def query(
+        self, query="all", project_id=None, group_id=None, stale_days=STALE_DAYS_DEFAULT
+    ):
+        """Return the mirrored MRs matching a query as dicts.
+
+        * all: All MRs.
+        * opened: Open MRs.
+        * conflicting: Open MRs with merge conflicts.
+        * empty: Open MRs that cannot be merged.
+        * stale: Open MRs not updated for 'stale_days' days.
+
+        Only MRs of 'project_id' are returned, if given, otherwise only the
+        MRs synced for 'group_id', if given.
+        """
+        conditions = []
+        parameters = []
+        if query != "all":
+            conditions.append("state = 'opened'")
+        if query == "conflicting":
+            conditions.append("has_conflicts = 1")
+        elif query == "empty":
+            conditions.append("merge_status = 'cannot_be_merged'")
+        elif query == "stale":
+            conditions.append("updated_at < ?")
+            parameters.append(
+                time.strftime(
+                    "%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - stale_days * 86400)
+                )
+            )
+        if project_id:
+            conditions.append("project_id = ?")
+            parameters.append(project_id)
+        elif group_id:
+            conditions.append("group_id = ?")
+            parameters.append(str(group_id))
+        statement = "SELECT * FROM mrs"
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        statement += " ORDER BY project_id, iid"
+        with self._lock:
+            rows = self._connection.execute(statement, parameters).fetchall()
+        mrs = []
+        for row in rows:
+            mr = dict(row)
+            if mr["has_conflicts"] is not None:
+                mr["has_conflicts"] = bool(mr["has_conflicts"])
+            mrs.append(mr)
+        return mrs
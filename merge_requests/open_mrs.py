@@ -0,0 +1,70 @@
+"""
+Goal:
+  * Index the open MRs of several projects.
+  * Used to not create an MR again, if it already exists.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+
+import root_path  # noqa: F401
+from gitlab_client import GitlabClient, GROUP_ENDPOINT, PROJECT_ENDPOINT, MR_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY_DEFAULT = 8
+
+
+def get_open_mrs_index(
+    url=None,
+    project_ids=None,
+    source_branch=None,
+    target_branch=None,
+    group_id=None,
+    headers=None,
+    client=None,
+    concurrency=CONCURRENCY_DEFAULT,
+):
+    """Get the open MRs from 'source_branch' into 'target_branch'.
+
+    All projects are covered by one paginated list request on group level if
+    'group_id' is given, otherwise the MRs of every project are listed,
+    'concurrency' projects at a time.
+
+    Returns the MRs of 'project_ids' keyed by
+    (project_id, source_branch, target_branch), project ids as strings.
+    Raises 'gitlab_client.GitlabError' if the MRs cannot be listed.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers, pool_size=concurrency)
+
+    params = {
+        "state": "opened",
+        "source_branch": source_branch,
+        "target_branch": target_branch,
+    }
+    project_ids = {str(project_id) for project_id in project_ids}
+    if group_id:
+        endpoint = GROUP_ENDPOINT.format(group_id=quote_plus(str(group_id)))
+        mrs = client.paginate(endpoint + MR_ENDPOINT, params=params)
+    else:
+
+        def get_project_mrs(project_id):
+            endpoint = PROJECT_ENDPOINT.format(project_id=quote_plus(project_id))
+            return list(client.paginate(endpoint + MR_ENDPOINT, params=params))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            mrs = [
+                mr
+                for project_mrs in executor.map(get_project_mrs, sorted(project_ids))
+                for mr in project_mrs
+            ]
+
+    index = {}
+    for mr in mrs:
+        project_id = str(mr.get("project_id", None))
+        if project_id in project_ids:
+            index[(project_id, mr["source_branch"], mr["target_branch"])] = mr
+    logger.debug(f"Found {len(index)} open MRs for {len(project_ids)} projects.")
+    return index
@@ -0,0 +1,8 @@
+"""Make the shared modules in the repository root importable."""
+
+import os
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_PATH not in sys.path:
+    sys.path.append(ROOT_PATH)
@@ -0,0 +1,131 @@
+"""
+Goal:
+  * Sync the MRs of a project or group into a local sqlite mirror.
+  * Only MRs updated since the last sync are fetched, all MRs every
+    '--full-sync' seconds, removing those not listed any more.
+  * The mirror is queried with 'python list_mrs.py --mirror <sqlite_file> --query <query>'.
+
+How to:
+  * Get help
+    - python sync_mrs.py -h
+  * The Private Token can be given as environemnt variable GITLAB_PRIVATE_TOKEN
+    - I read the password using pass (cli password manager)
+    - GITLAB_PRIVATE_TOKEN=$(pass show work/CSS/gitlab/private_token) python sync_mrs.py --url <gitlab_url> --group <group_id> --mirror <sqlite_file>
+  * The Private Token can be given as argument (-t, --token)
+    - python sync_mrs.py --token $(pass show work/CSS/gitlab/private_token) --url <gitlab_url> --group <group_id> --mirror <sqlite_file>
+  * The url can be given as argument (-u, --url)
+"""
+
+import sys
+import sqlite3
+import logging
+
+from requests.exceptions import RequestException
+
+from list_mrs import sync_mirror
+from mr_mirror import MRMirror, get_scope, FULL_SYNC_DEFAULT
+from _version import __version__
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient, GitlabError
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Sync MRs into a local mirror.",
+        epilog="python sync_mrs.py --token $(pass show work/CSS/gitlab/private_token) --url <gitlab_url> --group <gitlab_group_id> --mirror <sqlite_file>",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version="%(prog)s {version}".format(version=__version__),
+    )
+
+    parser.add_argument(
+        "-u",
+        "--url",
+        required=True,
+        default="https://example.gitlab.com",
+        help="Gitlab host/url/server.",
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-p", "--project", default="", help="Gitlab project id.")
+    group.add_argument("-g", "--group", default="", help="Gitlab group id.")
+    parser.add_argument(
+        "-m", "--mirror", required=True, help="sqlite file mirroring the MRs."
+    )
+    parser.add_argument(
+        "--full-sync",
+        type=float,
+        default=FULL_SYNC_DEFAULT,
+        metavar="SECONDS",
+        help="Seconds after which all MRs are listed again, removing the deleted ones. '0' always lists all.",
+    )
+    parser.add_argument(
+        "-t",
+        "--token",
+        nargs="?",
+        help="Private Token to access gitlab API. If not given as argument, set GITLAB_PRIVATE_TOKEN.",
+    )
+    parser.add_argument("--debug", action="store_true", help="Show debug info.")
+
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+    headers = {
+        "PRIVATE-TOKEN": args.token,
+        "Content-Type": "application/json",
+    }
+
+    scope = get_scope(project_id=args.project, group_id=args.group)
+    mirror = MRMirror(args.mirror, full_sync=args.full_sync)
+    try:
+        synced = sync_mirror(
+            mirror=mirror,
+            url=args.url,
+            project_id=args.project,
+            group_id=args.group,
+            client=GitlabClient(args.url, headers=headers, pool_size=1),
+        )
+    except GitlabError as e:
+        error = dict(e.error, message="Cannot sync merge requests.")
+        logger.error(error)
+        print(json.dumps({"error": error, "scope": scope}))
+        return 1
+    except (RequestException, sqlite3.Error) as e:
+        # Nothing is stored, the next sync starts from the last one.
+        error = {"message": "Cannot sync merge requests.", "reason": str(e)}
+        logger.error(error)
+        print(json.dumps({"error": error, "scope": scope}))
+        return 1
+    finally:
+        mirror.close()
+
+    print(json.dumps({"scope": scope, "synced": synced}))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Goal:
+  * Persistent cache of MR versions.
+  * An MR's versions are only fetched again, if the MR changed since,
+    i.e. its 'updated_at' or head 'sha' differ from the cached ones.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Days after which cached versions of merged or closed MRs are dropped.
+MAX_AGE_DEFAULT = 30
+FINISHED_STATES = ("merged", "closed")
+
+
+class VersionsCache:
+    """MR versions keyed by (project_id, iid), valid for (updated_at, sha).
+
+    Thread safe. Loaded from and saved to a JSON file.
+    """
+
+    def __init__(self, path, max_age=MAX_AGE_DEFAULT):
+        """
+        :param max_age: Days after which merged or closed MRs are evicted.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._entries = _read(path)
+
+    @staticmethod
+    def _key(mr):
+        return f"{mr['project_id']}/{mr['iid']}"
+
+    def get(self, mr):
+        """Return the cached versions of an unchanged MR, None otherwise."""
+        with self._lock:
+            entry = self._entries.get(self._key(mr), None)
+            if (
+                entry
+                and entry["updated_at"] == mr.get("updated_at", None)
+                and entry["sha"] == mr.get("sha", None)
+            ):
+                self.hits += 1
+                return entry["versions"]
+            self.misses += 1
+            return None
+
+    def put(self, mr, versions):
+        with self._lock:
+            self._entries[self._key(mr)] = {
+                "updated_at": mr.get("updated_at", None),
+                "sha": mr.get("sha", None),
+                "state": mr.get("state", None),
+                "cached_at": time.time(),
+                "versions": versions,
+            }
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def evict(self):
+        """Drop merged or closed MRs cached more than 'max_age' days ago."""
+        oldest = time.time() - self.max_age * 24 * 60 * 60
+        with self._lock:
+            expired = [
+                key
+                for key, entry in self._entries.items()
+                if entry["state"] in FINISHED_STATES and entry["cached_at"] < oldest
+            ]
+            for key in expired:
+                del self._entries[key]
+        logger.debug(f"Evicted {len(expired)} MRs from the versions cache.")
+
+    def save(self):
+        """Write the cache, also keeping the MRs saved by others meanwhile.
+
+        Of MRs cached by both, the versions cached last are kept.
+        """
+        stored = _read(self.path)
+        with self._lock:
+            for key, entry in stored.items():
+                cached = self._entries.get(key, None)
+                if cached is None or entry["cached_at"] > cached["cached_at"]:
+                    self._entries[key] = entry
+        self.evict()
+        with self._lock:
+            # Unique, several scripts may save the same cache at once.
+            handle, temporary_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+            )
+            with os.fdopen(handle, "w") as file_handler:
+                json.dump(self._entries, file_handler)
+            os.replace(temporary_path, self.path)
+
+
+def _read(path):
+    """Return the entries of a saved cache, none if there is no valid one."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as file_handler:
+            return json.load(file_handler)
+    except ValueError as e:
+        logger.warning(f"Ignoring broken versions cache '{path}': '{str(e)}'.")
+        return {}
@@ -1,6 +1,16 @@
 import argparse
 
 from _version import __version__
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from watch_pipelines import (
+    POLL_INTERVAL_DEFAULT,
+    MAX_POLL_INTERVAL_DEFAULT,
+    WAIT_TIMEOUT_DEFAULT,
+)
 
 
 def get_cli_arguments():
@@ -31,6 +41,40 @@ def get_cli_arguments():
     )
     parser.add_argument("--reference", required=True, help="Target branch.")
     # default=False is implied by action='store_true'
+    parser.add_argument(
+        "--skip-duplicates",
+        action="store_true",
+        help="Do not create a pipeline, if one is already running for the reference's current commit.",
+    )
+    # default=False is implied by action='store_true'
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Wait for the pipelines to finish, exits with 1 if any did not succeed.",
+    )
+    parser.add_argument(
+        "--wait-timeout",
+        type=float,
+        default=WAIT_TIMEOUT_DEFAULT,
+        help="Seconds to wait for the pipelines at most, 0 waits until they finished.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=POLL_INTERVAL_DEFAULT,
+        help="Seconds between checking the pipelines, grows while nothing changes.",
+    )
+    parser.add_argument(
+        "--max-poll-interval",
+        type=float,
+        default=MAX_POLL_INTERVAL_DEFAULT,
+        help="Seconds between checking the pipelines at most.",
+    )
+    # default=False is implied by action='store_true'
     parser.add_argument("--debug", action="store_true", help="Show debug info.")
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
 
     return parser
@@ -17,23 +17,107 @@ How to:
   * The url can be given as argument (-u, --url)
 """
 
-import requests
 import sys
 import logging
 from urllib.parse import quote_plus
 
+from requests.exceptions import RequestException
+
 import environment_variables
+import arguments
+from watch_pipelines import watch_pipelines, get_exit_code
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import (
+    GitlabClient,
+    GitlabError,
+    get_error,
+    PROJECT_ENDPOINT,
+    PIPELINES_ENDPOINT,
+)
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-GITHUB_API_ENDPOINT = "/api/v4"
-PROJECT_ENDPOINT = "/projects" + "/{project_id}"
 REFERENCE_PARAMETER = "?ref={reference}"
 PIPELINE_ENDPOINT = "/pipeline" + f"{REFERENCE_PARAMETER}"
-PROJECT_TAGS_ENDPOINT = f"{PROJECT_ENDPOINT}" + f"{PIPELINE_ENDPOINT}"
+COMMIT_ENDPOINT = "/repository/commits" + "/{reference}"
+
+# Pipelines that are not finished yet.
+ACTIVE_STATUSES = (
+    "created",
+    "waiting_for_resource",
+    "preparing",
+    "pending",
+    "running",
+)
+
+
+def get_pipeline_result(json_response, project_id=None, reference=None):
+    """Shape a pipeline returned by the API into the printed result."""
+    pipeline_id = json_response.get("id", None)
+    ref = json_response.get("ref", None)
+    yaml_errors = json_response.get("yaml_errors", None)
+    status = json_response.get("status", None)
+    web_url = json_response.get("web_url", None)
+    created_at = json_response.get("created_at", None)
+
+    return {
+        "pipeline_id": pipeline_id,
+        "project_id": project_id,
+        "reference": reference,
+        "ref": ref,
+        "status": status,
+        "yaml_errors": yaml_errors,
+        "web_url": web_url,
+        "created_at": created_at,
+    }
+
+
+def find_active_pipeline(
+    url=environment_variables.URL,
+    project_id=environment_variables.PROJECT_ID,
+    reference=environment_variables.REFERENCE,
+    headers=None,
+    client=None,
+    timeout=None,
+):
+    """Find an unfinished pipeline for the current commit of a reference.
+
+    Returns the pipeline as returned by the API or None.
+    Raises 'gitlab_client.GitlabError' or 'requests.RequestException' if the
+    API cannot be asked.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+    kwargs = {"timeout": timeout} if timeout else {}
+
+    project_endpoint = PROJECT_ENDPOINT.format(project_id=quote_plus(str(project_id)))
+
+    response = client.get(
+        project_endpoint + COMMIT_ENDPOINT.format(reference=quote_plus(str(reference))),
+        **kwargs,
+    )
+    if response.status_code != 200:
+        raise GitlabError(
+            get_error("Cannot get commit.", response=response, url=response.url),
+            response=response,
+        )
+    sha = response.json().get("id", None)
+
+    for pipeline in client.paginate(
+        project_endpoint + PIPELINES_ENDPOINT,
+        params={"ref": reference, "sha": sha},
+        **kwargs,
+    ):
+        if pipeline.get("status", None) in ACTIVE_STATUSES:
+            return pipeline
+    return None
 
 
 def create_pipeline(
@@ -41,20 +125,54 @@ def create_pipeline(
     project_id=environment_variables.PROJECT_ID,
     reference=environment_variables.REFERENCE,
     headers=None,
+    client=None,
+    timeout=None,
+    skip_duplicates=False,
 ):
-    url = url + GITHUB_API_ENDPOINT
+    """Create a pipeline for a reference of a project.
+
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    :param timeout: Seconds to wait for the API, the client's timeout if not given.
+    :param skip_duplicates: Do not create a pipeline, if an unfinished one
+        exists for the current commit of the reference. That one is
+        returned instead, marked as 'duplicate'.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers)
+
+    if skip_duplicates:
+        try:
+            pipeline = find_active_pipeline(
+                url=url,
+                project_id=project_id,
+                reference=reference,
+                client=client,
+                timeout=timeout,
+            )
+        except (GitlabError, RequestException) as e:
+            pipeline = None
+            logger.warning(
+                f"Cannot check project '{project_id}' for running pipelines: '{str(e)}'."
+            )
+        if pipeline:
+            logger.info(f"Pipeline already running for project '{project_id}'.")
+            result = get_pipeline_result(
+                pipeline, project_id=project_id, reference=reference
+            )
+            result["duplicate"] = True
+            return result
 
     project_endpoint = PROJECT_ENDPOINT.format(project_id=quote_plus(str(project_id)))
-    complete_url = (
-        url + project_endpoint + PIPELINE_ENDPOINT.format(reference=reference)
+    complete_url = client.get_url(
+        project_endpoint + PIPELINE_ENDPOINT.format(reference=reference)
     )
-    response = requests.post(url=complete_url, headers=headers)
+    kwargs = {"timeout": timeout} if timeout else {}
+    response = client.post(complete_url, **kwargs)
     if response.status_code not in [200, 201]:
-        error = {
-            "message": "Cannot create pipeline.",
-            "reason": f"Received status code {response.status_code} with {response.text}.",
-            "project_id": project_id,
-        }
+        error = get_error(
+            "Cannot create pipeline.", response=response, project_id=project_id
+        )
         logger.error(error)
         return {
             "error": error,
@@ -65,32 +183,22 @@ def create_pipeline(
     json_response = response.json()
     logger.debug(json_response)
 
-    pipeline_id = json_response.get("id", None)
-    ref = json_response.get("ref", None)
-    yaml_errors = json_response.get("yaml_errors", None)
-    status = json_response.get("status", None)
-    web_url = json_response.get("web_url", None)
-
-    return {
-        "pipeline_id": pipeline_id,
-        "project_id": project_id,
-        "reference": reference,
-        "ref": ref,
-        "status": status,
-        "yaml_errors": yaml_errors,
-        "web_url": web_url,
-    }
-
+    return get_pipeline_result(
+        json_response, project_id=project_id, reference=reference
+    )
 
-def main():
-    import arguments
 
+def main(argv=None):
     parser = arguments.get_cli_arguments()
     parser.add_argument(
         "-p", "--project", required=True, default="-1", help="Gitlab project id."
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
@@ -108,10 +216,31 @@ def main():
     }
 
     created_pipeline = create_pipeline(
-        url=url, project_id=project_id, reference=reference, headers=headers
+        url=url,
+        project_id=project_id,
+        reference=reference,
+        headers=headers,
+        skip_duplicates=args.skip_duplicates,
     )
     print(created_pipeline)
 
+    if args.wait:
+        if "error" in created_pipeline:
+            return 1
+        pipelines = list(
+            watch_pipelines(
+                url=url,
+                pipelines=[created_pipeline],
+                headers=headers,
+                poll_interval=args.poll_interval,
+                max_poll_interval=args.max_poll_interval,
+                timeout=args.wait_timeout or None,
+            )
+        )
+        for pipeline in pipelines:
+            print(pipeline)
+        return get_exit_code(pipelines)
+
 
 if __name__ == "__main__":
     sys.exit(main())
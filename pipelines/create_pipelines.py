@@ -1,39 +1,116 @@
 import sys
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from create_pipeline import create_pipeline
+from watch_pipelines import watch_pipelines, get_exit_code
 import environment_variables
+import arguments
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient
+from journal import Journal, read_completed
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+CONCURRENCY_DEFAULT = 8
+# Seconds to wait for the API per project, all requests and retries.
+TIMEOUT_DEFAULT = 30
 
-def create_pipelines(
+
+def _create_pipeline(project_id=None, timeout=None, **kwargs):
+    """Create the pipeline of one project, errors do not affect other projects.
+
+    Its requests are not sent after 'timeout' seconds, see 'deadline.within'.
+    """
+    logger.info(f"Trying to create pipeline for project '{project_id}'.")
+    try:
+        if not timeout:
+            return create_pipeline(project_id=project_id, **kwargs)
+        with deadline.within(timeout):
+            return create_pipeline(project_id=project_id, **kwargs)
+    except Exception as e:
+        error = {
+            "message": "Cannot create pipeline.",
+            "reason": f"Error: '{str(e)}'.",
+            "project_id": project_id,
+        }
+        logger.error(error)
+        return {
+            "error": error,
+            "project_id": project_id,
+        }
+
+
+def iter_create_pipelines(
     url=environment_variables.URL,
     project_ids=environment_variables.PROJECT_ID,
     reference=environment_variables.REFERENCE,
     headers=None,
+    journal=None,
+    completed_projects=(),
+    concurrency=CONCURRENCY_DEFAULT,
+    timeout=TIMEOUT_DEFAULT,
+    client=None,
+    skip_duplicates=False,
 ):
-    pipelines = []
-    try:
-        for project_id in project_ids:
-            logger.info(f"Trying to create pipeline for project '{project_id}'.")
-            pipelines.append(
-                create_pipeline(
-                    url=url, project_id=project_id, reference=reference, headers=headers
-                )
+    """Create pipelines for several projects, 'concurrency' projects at a time.
+
+    Yields the results in the order the projects complete.
+
+    :param journal: 'journal.Journal' to record the outcome of every project in.
+    :param completed_projects: Project ids to skip, e.g. completed in a
+        previous run.
+    :param timeout: Seconds to wait for the API per project, for all its
+        requests and their retries.
+    :param skip_duplicates: Look up unfinished pipelines for the reference
+        (concurrently, as part of every project) and return those instead of
+        creating new ones.
+    """
+    completed_projects = {str(project_id) for project_id in completed_projects}
+    skipped_projects = [p for p in project_ids if str(p) in completed_projects]
+    if skipped_projects:
+        logger.info(f"Skipping {len(skipped_projects)} already completed projects.")
+    project_ids = [p for p in project_ids if str(p) not in completed_projects]
+
+    if client is None:
+        client = GitlabClient(url, headers=headers, pool_size=concurrency)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [
+            executor.submit(
+                _create_pipeline,
+                url=url,
+                project_id=project_id,
+                reference=reference,
+                headers=headers,
+                client=client,
+                timeout=timeout,
+                skip_duplicates=skip_duplicates,
             )
-    except (Exception) as e:
-        logger.error(f"Error: '{str(e)}'.")
+            for project_id in project_ids
+        ]
+        for future in as_completed(futures):
+            pipeline = future.result()
+            if journal:
+                journal.record(
+                    pipeline["project_id"], pipeline, completed="error" not in pipeline
+                )
+            yield pipeline
 
-    return pipelines
 
+def create_pipelines(*args, **kwargs):
+    """Create pipelines for several projects, see 'iter_create_pipelines'."""
+    return list(iter_create_pipelines(*args, **kwargs))
 
-def main():
-    import arguments
 
+def main(argv=None):
     parser = arguments.get_cli_arguments()
     parser.add_argument(
         "-p",
@@ -42,8 +119,35 @@ def main():
         nargs="+",
         help="Gitlab project ids. Pass several divided by whitespace.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY_DEFAULT,
+        help="Number of projects to create pipelines for at the same time.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=TIMEOUT_DEFAULT,
+        help="Seconds to wait for the API per project, for all its requests and their retries.",
+    )
+    parser.add_argument(
+        "--journal",
+        default="",
+        help="Append the outcome of every project to this NDJSON file.",
+    )
+    parser.add_argument(
+        "--resume",
+        default="",
+        metavar="JOURNAL",
+        help="Skip the projects completed in this journal, also appends to it.",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)
@@ -54,18 +158,70 @@ def main():
     project_ids = args.projects
     reference = args.reference
     url = args.url
+    concurrency = args.concurrency
+    timeout = args.timeout
+    journal_path = args.journal or args.resume
+    completed_projects = {}
+    if args.resume:
+        completed_projects = read_completed(args.resume)
 
     headers = {
         "PRIVATE-TOKEN": private_token,
         "Content-Type": "application/json",
     }
+    client = GitlabClient(url, headers=headers, pool_size=concurrency)
 
-    created_pipelines = create_pipelines(
-        url=url, project_ids=project_ids, reference=reference, headers=headers
-    )
-    logger.debug(created_pipelines)
-    for pipeline in created_pipelines:
-        print(json.dumps(pipeline))
+    journal = Journal(journal_path) if journal_path else None
+    try:
+        created_pipelines = iter_create_pipelines(
+            url=url,
+            project_ids=project_ids,
+            reference=reference,
+            headers=headers,
+            journal=journal,
+            completed_projects=completed_projects,
+            concurrency=concurrency,
+            timeout=timeout,
+            client=client,
+            skip_duplicates=args.skip_duplicates,
+        )
+        # Print every pipeline as soon as it is created (NDJSON).
+        pipelines = []
+        duplicates = 0
+        for pipeline in created_pipelines:
+            logger.debug(pipeline)
+            if pipeline.get("duplicate", False):
+                duplicates += 1
+            print(json.dumps(pipeline), flush=True)
+            pipelines.append(pipeline)
+    finally:
+        if journal:
+            journal.close()
+    if args.skip_duplicates:
+        logger.info(f"Pipelines already running, not created: {duplicates}.")
+
+    if args.wait:
+        # Print every pipeline as soon as it finished (NDJSON).
+        finished_pipelines = []
+        for pipeline in watch_pipelines(
+            url=url,
+            pipelines=pipelines,
+            headers=headers,
+            client=client,
+            poll_interval=args.poll_interval,
+            max_poll_interval=args.max_poll_interval,
+            timeout=args.wait_timeout or None,
+            concurrency=concurrency,
+        ):
+            print(json.dumps(pipeline), flush=True)
+            finished_pipelines.append(pipeline)
+        failed = len([p for p in pipelines if "error" in p])
+        exit_code = get_exit_code(finished_pipelines) or int(failed > 0)
+        logger.info(
+            f"Pipelines finished: {len(finished_pipelines)}, failed to create: {failed},"
+            f" exit code {exit_code}."
+        )
+        return exit_code
 
 
 if __name__ == "__main__":
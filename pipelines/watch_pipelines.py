@@ -0,0 +1,178 @@
+"""
+Goal:
+  * Wait for several pipelines to finish.
+  * Per round, one list request per project (only pipelines updated since the
+    last round, with an overlap for updates visible late) instead of one
+    request per pipeline.
+  * The poll interval grows while nothing changes.
+"""
+
+import time
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+
+import root_path  # noqa: F401
+import deadline
+from gitlab_client import (
+    GitlabClient,
+    GitlabError,
+    PROJECT_ENDPOINT,
+    PIPELINES_ENDPOINT,
+)
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("success", "failed", "canceled", "skipped", "manual")
+SUCCESS_STATUSES = ("success", "skipped", "manual")
+TIMED_OUT = "timed_out"
+
+POLL_INTERVAL_DEFAULT = 2.0
+MAX_POLL_INTERVAL_DEFAULT = 30.0
+# Seconds to wait for the pipelines at most.
+WAIT_TIMEOUT_DEFAULT = 3600.0
+# Seconds before the newest update seen to list the updates from, an update
+# can become visible after a newer one.
+POLL_OVERLAP = 10.0
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _duration(pipeline):
+    created_at = _parse_time(pipeline.get("created_at", None))
+    updated_at = _parse_time(pipeline.get("updated_at", None))
+    if not created_at or not updated_at:
+        return None
+    return (updated_at - created_at).total_seconds()
+
+
+def _poll_project(client, project_id, updated_after=None):
+    """Return the pipelines of a project updated after 'updated_after' minus 'POLL_OVERLAP'."""
+    endpoint = PROJECT_ENDPOINT.format(project_id=quote_plus(str(project_id)))
+    params = {"order_by": "updated_at", "sort": "desc"}
+    if updated_after:
+        since = _parse_time(updated_after) - timedelta(seconds=POLL_OVERLAP)
+        params["updated_after"] = since.isoformat()
+    return list(client.paginate(endpoint + PIPELINES_ENDPOINT, params=params))
+
+
+def watch_pipelines(
+    url=None,
+    pipelines=(),
+    headers=None,
+    client=None,
+    poll_interval=POLL_INTERVAL_DEFAULT,
+    max_poll_interval=MAX_POLL_INTERVAL_DEFAULT,
+    timeout=None,
+    concurrency=8,
+):
+    """Wait for pipelines to finish, yield every pipeline when it finished.
+
+    :param pipelines: Results of 'create_pipeline', those with an error are
+        ignored.
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    :param timeout: Seconds to wait at most, the pipelines not finished by
+        then, or by the deadline of the script, are yielded with status
+        'timed_out'.
+
+    Yields dicts with 'pipeline_id', 'project_id', 'status', 'duration'
+    (seconds from creation to the last update) and 'web_url'.
+    """
+    if client is None:
+        client = GitlabClient(url, headers=headers, pool_size=concurrency)
+    # {project_id: {pipeline_id: pipeline}}
+    watched = {}
+    # Newest 'updated_at' seen per project, in the server's clock. Pipelines
+    # listed again in the overlap are only changed by a new status.
+    updated_after = {}
+    for pipeline in pipelines:
+        if "error" in pipeline or not pipeline.get("pipeline_id", None):
+            continue
+        project_id = pipeline["project_id"]
+        watched.setdefault(project_id, {})[pipeline["pipeline_id"]] = {
+            "pipeline_id": pipeline["pipeline_id"],
+            "project_id": project_id,
+            "status": pipeline.get("status", None),
+            "duration": None,
+            "web_url": pipeline.get("web_url", None),
+        }
+        created_at = pipeline.get("created_at", None)
+        if project_id not in updated_after or (
+            created_at and created_at < (updated_after[project_id] or created_at)
+        ):
+            updated_after[project_id] = created_at
+
+    started_at = time.monotonic()
+    interval = poll_interval
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        while watched:
+            futures = {
+                project_id: executor.submit(
+                    _poll_project,
+                    client,
+                    project_id,
+                    updated_after=updated_after[project_id],
+                )
+                for project_id in watched
+            }
+            changed = False
+            for project_id, future in futures.items():
+                try:
+                    updates = future.result()
+                except (GitlabError, RequestException) as e:
+                    logger.warning(f"Cannot poll project '{project_id}': '{str(e)}'.")
+                    continue
+                for update in updates:
+                    updated_at = update.get("updated_at", None)
+                    if updated_at and (
+                        not updated_after[project_id]
+                        or updated_at > updated_after[project_id]
+                    ):
+                        updated_after[project_id] = updated_at
+                    pipeline = watched[project_id].get(update.get("id", None), None)
+                    if not pipeline:
+                        continue
+                    if update.get("status", None) != pipeline["status"]:
+                        changed = True
+                        pipeline["status"] = update.get("status", None)
+                        logger.debug(pipeline)
+                    if pipeline["status"] in FINISHED_STATUSES:
+                        pipeline["duration"] = _duration(update)
+                        del watched[project_id][pipeline["pipeline_id"]]
+                        yield pipeline
+                if not watched[project_id]:
+                    del watched[project_id]
+                    del updated_after[project_id]
+
+            if not watched:
+                break
+            elapsed = time.monotonic() - started_at
+            if (timeout is not None and elapsed >= timeout) or deadline.expired():
+                for project_pipelines in watched.values():
+                    for pipeline in project_pipelines.values():
+                        pipeline["status"] = TIMED_OUT
+                        yield pipeline
+                break
+            # Poll less often while nothing changes.
+            interval = (
+                poll_interval if changed else min(interval * 2, max_poll_interval)
+            )
+            if timeout is not None:
+                interval = min(interval, timeout - elapsed)
+            if deadline.remaining() is not None:
+                interval = min(interval, deadline.remaining())
+            logger.debug(f"Polling again in {interval:.1f} seconds.")
+            time.sleep(interval)
+
+
+def get_exit_code(pipelines):
+    """0 if all pipelines succeeded, 1 otherwise."""
+    return int(any(p["status"] not in SUCCESS_STATUSES for p in pipelines))
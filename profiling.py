@@ -0,0 +1,179 @@
+"""
+Profile a run of a script, enabled with '--profile DIR'.
+
+Written to DIR, named '<script>-<time>-<pid>', when the script exits:
+  * '.prof': cProfile stats of all threads, load with 'pstats' or e.g. snakeviz,
+  * '.txt': the top functions by cumulative and own time, the peak of the
+    traced memory and the top allocation sites at the peak and at exit,
+  * '-peak.tracemalloc' and '-exit.tracemalloc': tracemalloc snapshots,
+    load with 'tracemalloc.Snapshot.load'.
+
+The peak snapshot is the one taken when the traced memory was highest,
+memory is checked every 'SAMPLE_INTERVAL' seconds.
+"""
+
+import io
+import os
+import sys
+import time
+import atexit
+import logging
+import cProfile
+import threading
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TOP_DEFAULT = 30
+# Frames stored per allocation.
+TRACEMALLOC_FRAMES = 10
+# Seconds between checking the traced memory for a new peak.
+SAMPLE_INTERVAL = 0.5
+# Before Python 3.12 a profiler only sees the thread it was enabled in, every
+# thread gets its own. Since, only one profiler can be enabled, it sees all.
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+
+class Profiler:
+    """cProfile all threads and trace the memory allocations of a run."""
+
+    def __init__(self, path, top=TOP_DEFAULT, sample_interval=SAMPLE_INTERVAL):
+        """
+        :param path: Directory to write the profiles to.
+        :param top: Number of functions and allocation sites in the summary.
+        """
+        self.path = path
+        self.top = top
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._stopped = threading.Event()
+        self._sampler = None
+        self.peak_snapshot = None
+        self.peak_size = 0
+
+    def _profile_thread(self, frame, event, arg):
+        # Called once in every new thread, replaces itself with a profiler.
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _sample(self):
+        while not self._stopped.wait(self.sample_interval):
+            self._check_peak()
+
+    def _check_peak(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.peak_size:
+            self.peak_size = current
+            self.peak_snapshot = tracemalloc.take_snapshot()
+
+    def start(self):
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        if PROFILE_PER_THREAD:
+            threading.setprofile(self._profile_thread)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def stop(self):
+        """Stop profiling and write the results, returns the written paths."""
+        # Only needed for the results, not imported by every script.
+        import pstats
+
+        self._profile.disable()
+        if PROFILE_PER_THREAD:
+            threading.setprofile(None)
+        self._stopped.set()
+        self._sampler.join()
+        self._check_peak()
+        exit_snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                # Also stops profiling threads still running.
+                profile.create_stats()
+                if profile.stats:
+                    stats.add(profile)
+
+        os.makedirs(self.path, exist_ok=True)
+        name = "{script}-{time}-{pid}".format(
+            script=os.path.splitext(os.path.basename(sys.argv[0]))[0].replace(" ", "-")
+            or "python",
+            time=time.strftime("%Y%m%dT%H%M%S"),
+            pid=os.getpid(),
+        )
+        base = os.path.join(self.path, name)
+        stats.dump_stats(base + ".prof")
+        self.peak_snapshot.dump(base + "-peak.tracemalloc")
+        exit_snapshot.dump(base + "-exit.tracemalloc")
+        with open(base + ".txt", "w") as file_handler:
+            file_handler.write(self.summary(stats, peak, exit_snapshot))
+        return [
+            base + ".prof",
+            base + ".txt",
+            base + "-peak.tracemalloc",
+            base + "-exit.tracemalloc",
+        ]
+
+    def summary(self, stats, peak, exit_snapshot):
+        top = self.top
+        output = io.StringIO()
+        stats.stream = output
+        for sort in ("cumulative", "tottime"):
+            output.write(f"Top {self.top} functions by {sort} time\n")
+            stats.sort_stats(sort).print_stats(self.top)
+        output.write(f"Peak of the traced memory: {peak / 1024:.1f} KiB\n\n")
+        for title, snapshot in (
+            (f"at the peak ({self.peak_size / 1024:.1f} KiB)", self.peak_snapshot),
+            ("at exit", exit_snapshot),
+        ):
+            output.write(f"Top {self.top} allocation sites {title}\n")
+            snapshot = snapshot.filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            statistics = snapshot.statistics("lineno")
+            for statistic in statistics[:top]:
+                output.write(f"  {statistic}\n")
+            output.write("\n")
+        return output.getvalue()
+
+
+def add_arguments(parser):
+    """Add '--profile' to an 'argparse' parser."""
+    parser.add_argument(
+        "--profile",
+        default="",
+        metavar="DIR",
+        help="Write cProfile stats and tracemalloc snapshots of the run to this directory.",
+    )
+    return parser
+
+
+def setup(args):
+    """Start profiling, if asked for by the parsed arguments.
+
+    The results are written when the script exits.
+    """
+    if not args.profile:
+        return None
+    profiler = Profiler(args.profile).start()
+    atexit.register(_report, profiler)
+    return profiler
+
+
+def _report(profiler):
+    try:
+        paths = profiler.stop()
+    except OSError as e:
+        logger.error(f"Cannot write profile to '{profiler.path}': '{str(e)}'.")
+        return
+    logger.info(f"Profile written to {', '.join(paths)}.")
@@ -0,0 +1,196 @@
+"""
+Goal:
+  * Local inventory of the projects of groups, stored in a JSON file.
+  * Refreshed incrementally: the projects are listed by their
+    'last_activity_at', the most recent first, and only until the first
+    project that did not change since the last refresh.
+  * The results of scripts per project, e.g. its tags, are stored with the
+    'last_activity_at' they were fetched at. They are served from the
+    inventory until the project has activity again, for 'MAX_AGE_DEFAULT'
+    seconds at most.
+
+Attention:
+  * Projects moved into a group without new activity and deleted projects are
+    only noticed by a full refresh, done every 'FULL_REFRESH_DEFAULT' seconds.
+  * Gitlab updates 'last_activity_at' at most about once per hour, also for
+    pushes, e.g. of tags, and MRs. Results younger than 'MAX_AGE_DEFAULT'
+    seconds may miss those, older ones are fetched again.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from threading import Lock
+from urllib.parse import quote_plus
+
+from gitlab_client import GROUP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which all projects of a group are listed again.
+FULL_REFRESH_DEFAULT = 24 * 60 * 60
+# Seconds after which the results of a project are fetched again, even
+# without new activity.
+MAX_AGE_DEFAULT = 10 * 60
+FIELDS = (
+    "id",
+    "name",
+    "path_with_namespace",
+    "default_branch",
+    "http_url_to_repo",
+    "last_activity_at",
+    "archived",
+)
+
+
+class ProjectInventory:
+    """Projects of groups and the results of scripts per project.
+
+    Thread safe. Loaded from and saved to a JSON file, one per gitlab server.
+    """
+
+    def __init__(
+        self, path, url, full_refresh=FULL_REFRESH_DEFAULT, max_age=MAX_AGE_DEFAULT
+    ):
+        """
+        :param url: Gitlab host/url/server, an inventory of another one is
+            not used.
+        :param full_refresh: Seconds after which all projects are listed again.
+        :param max_age: Seconds after which the results of a project are
+            fetched again.
+        """
+        self.path = path
+        self.url = url
+        self.full_refresh = full_refresh
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # group_id: {"refreshed_at": ..., "full_refreshed_at": ..., "projects": {id: project}}
+        self._groups = {}
+        # project_id: {name: {"last_activity_at": ..., "result": ...}}
+        self._results = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as file_handler:
+                    content = json.load(file_handler)
+            except ValueError as e:
+                logger.warning(f"Ignoring broken inventory '{path}': '{str(e)}'.")
+                return
+            if content.get("url", None) != url:
+                logger.warning(
+                    f"Ignoring inventory '{path}' of '{content.get('url', None)}'."
+                )
+                return
+            self._groups = content.get("groups", {})
+            self._results = content.get("results", {})
+
+    def refresh(self, client, group_id, include_subgroups=False, full=False):
+        """Update the projects of a group, returns them.
+
+        Lists all projects if 'full' or if the last full refresh is older than
+        'full_refresh' seconds, else only those with activity since the last
+        refresh.
+        Raises 'gitlab_client.GitlabError' if a page cannot be fetched.
+
+        :param include_subgroups: Also the projects of its subgroups, kept
+            apart from those of the group only.
+        """
+        group_id = str(group_id)
+        key = f"{group_id}/subgroups" if include_subgroups else group_id
+        refreshed_at = time.time()
+        with self._lock:
+            group = self._groups.get(key, None)
+            full = (
+                full
+                or group is None
+                or refreshed_at - group["full_refreshed_at"] > self.full_refresh
+            )
+            previous = dict(group["projects"]) if group else {}
+        known = {} if full else previous
+
+        endpoint = GROUP_ENDPOINT.format(group_id=quote_plus(group_id)) + "/projects"
+        params = {"order_by": "last_activity_at", "sort": "desc"}
+        if include_subgroups:
+            params["include_subgroups"] = "true"
+        projects = {}
+        changed = 0
+        for project in client.paginate(endpoint, params=params):
+            project = {field: project.get(field, None) for field in FIELDS}
+            project_id = str(project["id"])
+            stored = known.get(project_id, None)
+            if stored and stored["last_activity_at"] == project["last_activity_at"]:
+                # All further projects had their last activity before.
+                break
+            projects[project_id] = project
+            changed += 1
+        if not full:
+            projects = {**known, **projects}
+        logger.debug(
+            f"Refreshed group '{key}': {changed} of {len(projects)} projects"
+            f" changed{', full refresh' if full else ''}."
+        )
+
+        with self._lock:
+            self._groups[key] = {
+                "refreshed_at": refreshed_at,
+                "full_refreshed_at": (
+                    refreshed_at if full else group["full_refreshed_at"]
+                ),
+                "projects": projects,
+            }
+            # Deleted or moved, noticed by a full refresh.
+            for project_id in previous:
+                if project_id not in projects:
+                    self._results.pop(project_id, None)
+        return list(projects.values())
+
+    def get_result(self, project, name):
+        """Return the result 'name' of a project.
+
+        None if the project changed since it was stored, or it was stored
+        more than 'max_age' seconds ago.
+        """
+        oldest = time.time() - self.max_age
+        with self._lock:
+            entry = self._results.get(str(project["id"]), {}).get(name, None)
+            if (
+                entry
+                and entry["last_activity_at"] == project["last_activity_at"]
+                and entry.get("stored_at", 0) >= oldest
+            ):
+                self.hits += 1
+                return entry["result"]
+            self.misses += 1
+            return None
+
+    def put_result(self, project, name, result):
+        """Store the result 'name' of a project, must be JSON serializable."""
+        with self._lock:
+            self._results.setdefault(str(project["id"]), {})[name] = {
+                "last_activity_at": project["last_activity_at"],
+                "stored_at": time.time(),
+                "result": result,
+            }
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def save(self):
+        with self._lock:
+            content = {
+                "url": self.url,
+                "groups": self._groups,
+                "results": self._results,
+            }
+            # Unique, several scripts may save the same inventory at once.
+            handle, temporary_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+            )
+            with os.fdopen(handle, "w") as file_handler:
+                json.dump(content, file_handler)
+            os.replace(temporary_path, self.path)
@@ -0,0 +1,172 @@
+"""
+A rate limit of the API requests shared by all processes of a machine.
+
+Scripts running at the same time, e.g. parallel CI jobs with the same token,
+share one token bucket per token in a local sqlite database:
+  * '--rate-limit' requests per second per token, bursts of as many,
+  * every request, and every retry, of 'gitlab_client.GitlabClient' takes a
+    token first, waiting until there is one,
+  * the seconds waited are in the metrics (see 'instrumentation').
+Processes with different '--rate-limit' for the same token share the bucket,
+each refills it at its own rate.
+
+The scripts enable it with '--rate-limit' or GITLAB_SCRIPTS_RATE_LIMIT, the
+database is '--rate-limit-db' or GITLAB_SCRIPTS_RATE_LIMIT_DB.
+Nothing is limited when disabled.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_VARIABLE = "GITLAB_SCRIPTS_RATE_LIMIT"
+DATABASE_VARIABLE = "GITLAB_SCRIPTS_RATE_LIMIT_DB"
+DATABASE_DEFAULT = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "gitlab-scripts-rate-limit.sqlite"
+)
+# Seconds to wait for the database, locked by another process.
+LOCK_TIMEOUT = 30
+
+CREATE_BUCKETS = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Token bucket of the running process, see 'enable'.
+_bucket = None
+
+
+def get_key(token):
+    """Return the key of the bucket of a token, the token is not stored."""
+    return hashlib.sha256((token or "").encode()).hexdigest()
+
+
+class TokenBucket:
+    """Token buckets, one per key, kept in a sqlite database.
+
+    Tokens are taken in advance: a request waiting for its token leaves the
+    bucket below zero, the next ones wait longer.
+    Thread and process safe.
+    """
+
+    def __init__(self, path=DATABASE_DEFAULT, rate=1.0, burst=None):
+        """
+        :param rate: Tokens added per second.
+        :param burst: Tokens the bucket holds at most, 'rate' (at least 1) if
+            not given.
+        """
+        self.path = path
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=LOCK_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        # Lost buckets only allow a burst, they need not survive a crash.
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(CREATE_BUCKETS)
+
+    def reserve(self, key, max_wait=None):
+        """Take a token, return the seconds to wait until it may be used.
+
+        Returns None without taking it, if that is more than 'max_wait'.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._connection.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = self.burst
+                if row is not None:
+                    elapsed = max(0.0, now - row[1])
+                    tokens = min(self.burst, row[0] + elapsed * self.rate)
+                wait = max(0.0, (1 - tokens) / self.rate)
+                if max_wait is not None and wait > max_wait:
+                    self._connection.execute("ROLLBACK")
+                    return None
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens - 1, now),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire(self, key, max_wait=None):
+        """Take a token, waiting until it may be used.
+
+        Returns the seconds waited, None without taking it, if that would be
+        more than 'max_wait'. Not limited, if the database fails.
+        """
+        try:
+            wait = self.reserve(key, max_wait=max_wait)
+        except sqlite3.Error as e:
+            logger.warning(
+                f"Rate limit at '{self.path}' failed, not limited: '{str(e)}'."
+            )
+            return 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def enable(rate, path=DATABASE_DEFAULT):
+    """Limit the requests of all clients created from now on to 'rate' per second per token."""
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(path, rate=rate)
+    return _bucket
+
+
+def get_bucket():
+    """Return the token bucket of the process, None if not enabled."""
+    return _bucket
+
+
+def add_arguments(parser):
+    """Add '--rate-limit' and '--rate-limit-db' to an 'argparse' parser."""
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=os.environ.get(RATE_LIMIT_VARIABLE, "") or "0",
+        metavar="REQUESTS",
+        help=f"Requests per second per token, shared by all scripts of this machine, 0 is unlimited."
+        f" Also {RATE_LIMIT_VARIABLE}.",
+    )
+    parser.add_argument(
+        "--rate-limit-db",
+        default=os.environ.get(DATABASE_VARIABLE, "") or DATABASE_DEFAULT,
+        metavar="FILE",
+        help=f"Sqlite database of the shared rate limit. Also {DATABASE_VARIABLE}.",
+    )
+    return parser
+
+
+def setup(args):
+    """Enable the rate limit, if asked for by the parsed arguments."""
+    if args.rate_limit <= 0:
+        return None
+    try:
+        return enable(args.rate_limit, path=args.rate_limit_db)
+    except sqlite3.Error as e:
+        logger.error(
+            f"Cannot open the rate limit at '{args.rate_limit_db}', not limited: '{str(e)}'."
+        )
+        return None
@@ -0,0 +1,44 @@
+"""Install the scripts with the 'gitlab-scripts' command, see 'gitlab_scripts.py'."""
+
+from setuptools import setup
+
+setup(
+    name="gitlab-scripts",
+    version="0.0.1",
+    description="Scripts for the gitlab API.",
+    # 'datetime.fromisoformat' is new in Python 3.7.
+    python_requires=">=3.7",
+    classifiers=[
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
+        "Programming Language :: Python :: 3.13",
+    ],
+    py_modules=[
+        "gitlab_scripts",
+        "gitlab_daemon",
+        "gitlab_client",
+        "gitlab_graphql",
+        "instrumentation",
+        "profiling",
+        "deadline",
+        "rate_limit",
+        "journal",
+        "project_inventory",
+        "git_tags",
+        "get_most_recent_tag",
+        "get_tf_module_source_version",
+        "get_unestimated_issues",
+        "check_included_ci_ref",
+    ],
+    # The scripts of these directories import their siblings by name,
+    # 'gitlab_scripts' puts the directory of a command on 'sys.path'.
+    packages=["merge_requests", "pipelines", "users"],
+    install_requires=["requests>=2.22.0", "GitPython"],
+    entry_points={"console_scripts": ["gitlab-scripts=gitlab_scripts:main"]},
+)
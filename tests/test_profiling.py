@@ -0,0 +1,82 @@
+"""
+Goal:
+  * Check that '--profile' writes a profile, also on Python 3.12 and later.
+
+How to:
+  * python -m unittest discover tests
+"""
+
+import os
+import sys
+import glob
+import pstats
+import tempfile
+import threading
+import unittest
+import subprocess
+
+TESTS_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_PATH = os.path.dirname(TESTS_PATH)
+sys.path.insert(0, ROOT_PATH)
+sys.path.insert(0, os.path.join(ROOT_PATH, "benchmarks"))
+
+import profiling  # noqa: E402
+
+
+def _work():
+    return sum(number * number for number in range(10000))
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_threads(self):
+        with tempfile.TemporaryDirectory() as path:
+            profiler = profiling.Profiler(path, sample_interval=0.01).start()
+            thread = threading.Thread(target=_work)
+            thread.start()
+            thread.join()
+            paths = profiler.stop()
+
+            self.assertEqual(len(paths), 4)
+            for written in paths:
+                self.assertTrue(os.path.exists(written), written)
+            stats = pstats.Stats(paths[0])
+            functions = {function for _, _, function in stats.stats}
+            self.assertIn("_work", functions)
+
+
+class ProfileArgumentTest(unittest.TestCase):
+    def test_command(self):
+        try:
+            from fake_gitlab import FakeGitlab
+        except ImportError as e:
+            self.skipTest(f"Cannot import the fake gitlab server: '{str(e)}'.")
+
+        fake_gitlab = FakeGitlab(projects=12)
+        with fake_gitlab, tempfile.TemporaryDirectory() as path:
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.join(ROOT_PATH, "get_most_recent_tag.py"),
+                    "--url",
+                    fake_gitlab.url,
+                    "--group",
+                    "1",
+                    "--token",
+                    "x",
+                    "--profile",
+                    path,
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                timeout=60,
+            )
+
+            self.assertEqual(process.returncode, 0, process.stderr)
+            self.assertNotIn("Traceback", process.stderr)
+            self.assertEqual(len(glob.glob(os.path.join(path, "*.prof"))), 1)
+            self.assertEqual(len(glob.glob(os.path.join(path, "*.txt"))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,31 +22,36 @@ import sys
 import logging
 from json import JSONDecodeError
 
-import requests
-
+import root_path  # noqa: F401
+import deadline
+import instrumentation
+import profiling
+import rate_limit
+from gitlab_client import GitlabClient, GitlabError, get_error, USERS_ENDPOINT
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-GITHUB_API_ENDPOINT = "/api/v4"
-USERS_ENDPOINT = "/users"
 
+def get_users(url=None, username="", headers=None, client=None):
+    """Get the ids of one or all users, keyed by username.
 
-def get_users(url=None, username="", headers=None):
+    :param client: 'gitlab_client.GitlabClient' to send the requests with,
+        created from 'url' and 'headers' if not given.
+    """
     logger.debug(f"User '{username}'.")
-    url = url + GITHUB_API_ENDPOINT
+    if client is None:
+        client = GitlabClient(url, headers=headers)
     user_ids = {}
     if username:
         # Get a specific gitlab user.
-        complete_url = url + f"{USERS_ENDPOINT}?username={username}"
-        response = requests.get(complete_url, headers=headers)
+        complete_url = client.get_url(f"{USERS_ENDPOINT}?username={username}")
+        response = client.get(complete_url)
         if not response.status_code == 200:
-            error = {
-                "message": "Cannot get user '{user}'.",
-                "reason": f"Received status code {response.status_code} with {response.text}.",
-                "username": username,
-            }
+            error = get_error(
+                f"Cannot get user '{username}'.", response=response, username=username
+            )
             logger.error(error)
             return {
                 "error": error,
@@ -69,26 +74,21 @@ def get_users(url=None, username="", headers=None):
                 "url": complete_url,
             }
     else:
-        # Get all gitlab users.
-        complete_url = url + f"{USERS_ENDPOINT}"
-        response = requests.get(complete_url, headers=headers)
-        if not response.status_code == 200:
-            error = {
-                "message": "Cannot get users.",
-                "reason": f"Received status code {response.status_code} with {response.text}.",
-            }
+        # Get all gitlab users, all pages.
+        complete_url = client.get_url(USERS_ENDPOINT)
+        try:
+            for user in client.paginate(complete_url):
+                user_ids[user["username"]] = user.get("id", None)
+        except GitlabError as e:
+            error = get_error("Cannot get users.", response=e.response)
             logger.error(error)
             return {
                 "error": error,
                 "url": complete_url,
             }
-        logger.debug(response.text)
-        try:
-            users = response.json()
         except JSONDecodeError as e:
             error = {
                 "message": "Is this JSON?.",
-                "reason": f"Received status code {response.status_code} with {response.text}.",
                 "error": str(e),
             }
             logger.error(error)
@@ -96,13 +96,11 @@ def get_users(url=None, username="", headers=None):
                 "error": error,
                 "url": complete_url,
             }
-        for user in users:
-            user_ids[user["username"]] = user.get("id", None)
 
     return user_ids
 
 
-def main():
+def main(argv=None):
     import argparse
 
     parser = argparse.ArgumentParser(
@@ -128,7 +126,15 @@ def main():
         help="Gitlab username to get id for. If not set, all users' ids are listed.",
     )
     parser.add_argument("--debug", action="store_true", help="Show debug info.")
-    args = parser.parse_args()
+    instrumentation.add_arguments(parser)
+    deadline.add_arguments(parser)
+    rate_limit.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.setup(args)
+    profiling.setup(args)
+    deadline.setup(args)
+    rate_limit.setup(args)
 
     if args.debug:
         logger.setLevel(logging.DEBUG)